@@ -2,10 +2,14 @@
 Django admin configuration for API models.
 """
 from django.contrib import admin
+from django.db.models import F
+from . import inventory, order_events
+from .checkout import release_orders
 from .models import (
     Category, Product, Review, Newsletter, UserProfile, Banner, Voucher,
     SalesAnalytics, Order, OrderItem, OrderTracking, Refund,
-    Watchlist, Complaint, Referral
+    Watchlist, Complaint, Referral, Experiment, ExperimentResult, InventoryHold, Cart, OutboxEvent,
+    ArchivedOrder, VoucherRedemption, VoucherCampaign, VoucherCode
 )
 
 
@@ -21,7 +25,7 @@ class ProductAdmin(admin.ModelAdmin):
     list_display = ['name', 'price', 'inventory', 'category', 'featured', 'on_sale', 'discount_percent', 'created_at']
     list_filter = ['featured', 'on_sale', 'category', 'created_at']
     search_fields = ['name', 'description', 'sku']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['reserved', 'created_at', 'updated_at']
     fieldsets = (
         ('Basic Information', {
             'fields': ('name', 'description', 'price', 'sku')
@@ -30,7 +34,7 @@ class ProductAdmin(admin.ModelAdmin):
             'fields': ('image_url', 'category')
         }),
         ('Inventory', {
-            'fields': ('inventory',)
+            'fields': ('inventory', 'reserved', 'stock_stripes')
         }),
         ('Sales & Discounts', {
             'fields': ('featured', 'on_sale', 'discount_percent')
@@ -41,6 +45,36 @@ class ProductAdmin(admin.ModelAdmin):
         }),
     )
 
+    def save_model(self, request, obj, form, change):
+        """
+        Stock columns are maintained by atomic updates, so edits are applied as
+        deltas (or hot SKU mode transitions) instead of overwriting them.
+        """
+        if not change:
+            super().save_model(request, obj, form, change)
+            if obj.stock_stripes:
+                inventory.enable_hot_mode(obj.id, obj.stock_stripes)
+            return
+
+        stock_fields = {'inventory', 'reserved', 'stock_stripes'}
+        obj.save(update_fields=[
+            f.name for f in obj._meta.concrete_fields
+            if not f.primary_key and f.name not in stock_fields
+        ])
+
+        was_striped = form.initial.get('stock_stripes', 0)
+        if 'inventory' in form.changed_data:
+            delta = obj.inventory - form.initial['inventory']
+            if was_striped:
+                inventory.restock_striped(obj.id, delta)
+            else:
+                Product.objects.filter(id=obj.id).update(inventory=F('inventory') + delta)
+        if 'stock_stripes' in form.changed_data:
+            if obj.stock_stripes:
+                inventory.enable_hot_mode(obj.id, obj.stock_stripes)
+            else:
+                inventory.disable_hot_mode(obj.id)
+
 
 @admin.register(Review)
 class ReviewAdmin(admin.ModelAdmin):
@@ -87,10 +121,13 @@ class NewsletterAdmin(admin.ModelAdmin):
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
-    list_display = ['user', 'phone', 'referral_code', 'referral_points', 'total_referrals', 'is_admin']
+    list_display = ['user', 'phone', 'referral_code', 'referral_points', 'total_referrals', 'order_count', 'lifetime_value', 'is_admin']
     list_filter = ['is_admin', 'created_at']
     search_fields = ['user__username', 'referral_code', 'phone']
-    readonly_fields = ['referral_code', 'created_at', 'updated_at']
+    readonly_fields = [
+        'referral_code', 'order_count', 'lifetime_value', 'first_order_at', 'last_order_at', 'cohort_month',
+        'stats_updated_at', 'created_at', 'updated_at',
+    ]
 
 
 @admin.register(Banner)
@@ -130,7 +167,7 @@ class VoucherAdmin(admin.ModelAdmin):
             'fields': ('discount_type', 'discount_value', 'min_purchase')
         }),
         ('Usage', {
-            'fields': ('max_uses', 'current_uses', 'is_active')
+            'fields': ('max_uses', 'max_uses_per_user', 'current_uses', 'is_active')
         }),
         ('Validity', {
             'fields': ('start_date', 'end_date')
@@ -141,6 +178,16 @@ class VoucherAdmin(admin.ModelAdmin):
         }),
     )
 
+    def save_model(self, request, obj, form, change):
+        """current_uses is incremented concurrently by checkouts, so an edit never writes it back."""
+        if not change:
+            super().save_model(request, obj, form, change)
+            return
+        obj.save(update_fields=[
+            f.name for f in obj._meta.concrete_fields
+            if not f.primary_key and f.name not in ('current_uses', 'created_at')
+        ])
+
 
 @admin.register(SalesAnalytics)
 class SalesAnalyticsAdmin(admin.ModelAdmin):
@@ -154,6 +201,9 @@ class OrderItemInline(admin.TabularInline):
     extra = 0
     readonly_fields = ['product', 'quantity', 'price_at_purchase', 'total']
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
+
 
 class OrderTrackingInline(admin.StackedInline):
     model = OrderTracking
@@ -166,6 +216,7 @@ class OrderAdmin(admin.ModelAdmin):
     list_filter = ['status', 'payment_status', 'created_at']
     search_fields = ['order_id', 'user__username', 'user__email']
     readonly_fields = ['order_id', 'created_at', 'updated_at']
+    list_select_related = ['user']
     inlines = [OrderItemInline, OrderTrackingInline]
     fieldsets = (
         ('Order Information', {
@@ -185,6 +236,35 @@ class OrderAdmin(admin.ModelAdmin):
         }),
     )
 
+    def save_related(self, request, form, formsets, change):
+        """Publish status and tracking changes (and release cancelled orders) in the admin's save transaction."""
+        super().save_related(request, form, formsets, change)
+        if not change:
+            return
+        order = form.instance
+        previous_status = form.initial.get('status', order.status)
+        if order.status == 'cancelled' and previous_status != 'cancelled':
+            release_orders([order.id])
+        if any(formset.model is OrderTracking and formset.has_changed() for formset in formsets):
+            tracking = OrderTracking.objects.filter(order=order).first()
+            order_events.tracking_changed(order, previous_status, tracking)
+        else:
+            order_events.status_changed(order, previous_status)
+
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    list_display = ['order_id', 'user', 'final_price', 'status', 'created_at', 'archived_at']
+    list_filter = ['status']
+    search_fields = ['order_id']
+    list_select_related = ['user']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 
 @admin.register(Refund)
 class RefundAdmin(admin.ModelAdmin):
@@ -192,6 +272,7 @@ class RefundAdmin(admin.ModelAdmin):
     list_filter = ['status', 'requested_at', 'processed_at']
     search_fields = ['order__order_id', 'reason']
     readonly_fields = ['requested_at', 'processed_at']
+    list_select_related = ['order']
     fieldsets = (
         ('Refund Request', {
             'fields': ('order', 'reason', 'amount', 'requested_at')
@@ -216,3 +297,67 @@ class ReferralAdmin(admin.ModelAdmin):
     list_filter = ['is_active', 'created_at']
     search_fields = ['referrer__username', 'referred_user__username', 'referral_code']
     readonly_fields = ['created_at']
+
+
+@admin.register(InventoryHold)
+class InventoryHoldAdmin(admin.ModelAdmin):
+    list_display = ['product', 'owner_key', 'quantity', 'status', 'expires_at']
+    list_filter = ['status']
+    search_fields = ['owner_key', 'product__name']
+    readonly_fields = ['created_at', 'updated_at']
+
+
+@admin.register(Cart)
+class CartAdmin(admin.ModelAdmin):
+    list_display = ['owner_key', 'voucher_code', 'updated_at']
+    search_fields = ['owner_key']
+    readonly_fields = ['updated_at']
+
+
+@admin.register(VoucherRedemption)
+class VoucherRedemptionAdmin(admin.ModelAdmin):
+    list_display = ['voucher', 'user', 'order_id', 'discount_amount', 'created_at']
+    list_select_related = ['voucher', 'user']
+    search_fields = ['voucher__code', 'user__username']
+    raw_id_fields = ['voucher', 'user']
+    readonly_fields = ['created_at']
+
+
+@admin.register(VoucherCampaign)
+class VoucherCampaignAdmin(admin.ModelAdmin):
+    list_display = ['name', 'code_prefix', 'discount_value', 'discount_type', 'is_active', 'start_date', 'end_date']
+    list_filter = ['discount_type', 'is_active']
+    search_fields = ['name', 'code_prefix']
+    readonly_fields = ['created_at', 'updated_at']
+
+
+@admin.register(VoucherCode)
+class VoucherCodeAdmin(admin.ModelAdmin):
+    # Millions of rows: exact-code search only, no full count
+    list_display = ['code', 'campaign', 'redeemed_at', 'redeemed_by']
+    list_select_related = ['campaign', 'redeemed_by']
+    search_fields = ['=code']
+    raw_id_fields = ['campaign', 'redeemed_by']
+    show_full_result_count = False
+
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ['id', 'topic', 'handler', 'status', 'attempts', 'available_at', 'created_at']
+    list_filter = ['status', 'handler', 'topic']
+    readonly_fields = ['created_at', 'processed_at']
+
+
+@admin.register(Experiment)
+class ExperimentAdmin(admin.ModelAdmin):
+    list_display = ['key', 'variants', 'is_active', 'updated_at']
+    list_filter = ['is_active']
+    search_fields = ['key', 'description']
+    readonly_fields = ['created_at', 'updated_at']
+
+
+@admin.register(ExperimentResult)
+class ExperimentResultAdmin(admin.ModelAdmin):
+    list_display = ['experiment_key', 'variant', 'exposed_units', 'converted_units', 'conversion_rate', 'revenue', 'computed_at']
+    list_filter = ['experiment_key']
+    readonly_fields = ['computed_at']
@@ -9,5 +9,7 @@ class ApiConfig(AppConfig):
     name = 'api'
 
     def ready(self):
-        """Import signals when the app is ready."""
+        """Import signals and outbox handlers when the app is ready."""
         import api.signals  # noqa
+        import api.order_events  # noqa
+        import api.live_sales  # noqa
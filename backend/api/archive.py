@@ -0,0 +1,170 @@
+"""
+Hot/cold split for orders.
+
+Orders that were delivered or cancelled more than ``ORDER_ARCHIVE_AFTER_MONTHS``
+months ago are moved from ``Order``/``OrderItem`` into ``ArchivedOrder``/
+``ArchivedOrderItem`` by the ``archive_orders`` command. Each batch is one
+transaction: copy with ``bulk_create``, then delete the live rows (which
+cascades to their items, tracking and refund), so an order is always in
+exactly one place. Orders with complaints stay live: complaints hang off
+live order items and are still worked on, and deleting the items would
+delete them too. On PostgreSQL the archive tables are partitioned by month
+and the partitions a batch needs are created before it is copied.
+
+``find_order`` looks an order number up in the live table first and then
+in the archive, so callers do not need to know where an order lives.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import ArchivedOrder, ArchivedOrderItem, Complaint, Order, OrderItem
+from .partitioning import ensure_partitions_for
+
+ARCHIVABLE_STATUSES = ('delivered', 'cancelled')
+
+
+def archive_cutoff(months=None, now=None):
+    """Orders last updated before this are archived (months are 30 days)."""
+    months = settings.ORDER_ARCHIVE_AFTER_MONTHS if months is None else months
+    return (now or timezone.now()) - timedelta(days=30 * months)
+
+
+def archivable_orders(cutoff):
+    return Order.objects.filter(status__in=ARCHIVABLE_STATUSES, updated_at__lt=cutoff).exclude(
+        Exists(Complaint.objects.filter(order_item__order_id=OuterRef('pk')))
+    )
+
+
+def _snapshot_tracking(order):
+    tracking = getattr(order, 'tracking', None)
+    if tracking is None:
+        return None
+    return {
+        'carrier': tracking.carrier,
+        'tracking_number': tracking.tracking_number,
+        'current_location': tracking.current_location,
+        'estimated_delivery': tracking.estimated_delivery.isoformat() if tracking.estimated_delivery else None,
+        'last_updated': tracking.last_updated.isoformat(),
+    }
+
+
+def _snapshot_refund(order):
+    refund = getattr(order, 'refund', None)
+    if refund is None:
+        return None
+    return {
+        'reason': refund.reason,
+        'amount': str(refund.amount),
+        'status': refund.status,
+        'requested_at': refund.requested_at.isoformat(),
+        'processed_at': refund.processed_at.isoformat() if refund.processed_at else None,
+        'processed_by_id': refund.processed_by_id,
+        'admin_notes': refund.admin_notes,
+    }
+
+
+def archive_batch(cutoff, batch_size=500):
+    """
+    Move one batch of archivable orders into the archive.
+
+    Candidate rows are locked with SKIP LOCKED where supported, so the job can
+    run while orders are being updated and several archivers can run at once.
+
+    Returns:
+        Number of orders archived
+    """
+    with transaction.atomic():
+        ids = list(
+            archivable_orders(cutoff).select_for_update(skip_locked=True)
+            .order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return 0
+
+        orders = list(
+            Order.objects.filter(id__in=ids).select_related('tracking', 'refund').order_by('id')
+        )
+        items = list(
+            OrderItem.objects.filter(order_id__in=ids).values_list(
+                'order_id', 'product_id', 'product__name', 'quantity', 'price_at_purchase', 'total'
+            )
+        )
+        item_counts = {}
+        for item in items:
+            item_counts[item[0]] = item_counts.get(item[0], 0) + 1
+
+        created_at = {order.id: order.created_at for order in orders}
+        for table in (ArchivedOrder._meta.db_table, ArchivedOrderItem._meta.db_table):
+            ensure_partitions_for(table, [moment.date() for moment in created_at.values()])
+
+        now = timezone.now()
+        ArchivedOrder.objects.bulk_create([
+            ArchivedOrder(
+                id=order.id,
+                order_id=order.order_id,
+                user_id=order.user_id,
+                total_price=order.total_price,
+                discount_amount=order.discount_amount,
+                final_price=order.final_price,
+                voucher_code=order.voucher_code,
+                status=order.status,
+                shipping_address=order.shipping_address,
+                phone=order.phone,
+                payment_method=order.payment_method,
+                payment_status=order.payment_status,
+                notes=order.notes,
+                item_count=item_counts.get(order.id, 0),
+                tracking=_snapshot_tracking(order),
+                refund=_snapshot_refund(order),
+                created_at=order.created_at,
+                updated_at=order.updated_at,
+                archived_at=now,
+            )
+            for order in orders
+        ])
+        ArchivedOrderItem.objects.bulk_create([
+            ArchivedOrderItem(
+                order_id=order_id,
+                order_created_at=created_at[order_id],
+                product_id=product_id,
+                product_name=product_name or '',
+                quantity=quantity,
+                price_at_purchase=price_at_purchase,
+                total=total,
+            )
+            for order_id, product_id, product_name, quantity, price_at_purchase, total in items
+        ])
+
+        Order.objects.filter(id__in=ids).delete()
+    return len(ids)
+
+
+def find_order(order_number, user=None):
+    """
+    Look up an order by its number in the live table, then the archive.
+
+    Args:
+        order_number: ``Order.order_id``
+        user: Restrict the lookup to this user's orders
+
+    Returns:
+        Tuple of (order, archived) where order is an Order or ArchivedOrder,
+        or (None, False) if not found
+    """
+    live = Order.objects.filter(order_id=order_number)
+    archived = ArchivedOrder.objects.filter(order_id=order_number)
+    if user is not None:
+        live = live.filter(user=user)
+        archived = archived.filter(user=user)
+
+    order = live.select_related('user', 'tracking', 'refund__processed_by').prefetch_related(
+        'items__product'
+    ).first()
+    if order is not None:
+        return order, False
+    order = archived.select_related('user').prefetch_related('items').first()
+    return order, order is not None
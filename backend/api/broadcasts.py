@@ -0,0 +1,389 @@
+"""
+Coalesced, topic-routed product broadcasts to ``ws/products/`` clients.
+
+Product signals no longer serialize and ``group_send`` inside ``save()``.
+Once the saving transaction commits they record *that* a product changed,
+keyed by product, in a per-process ``ProductBroadcaster``. A background
+publisher thread waits ``PRODUCT_BROADCAST_DEBOUNCE_SECONDS`` after the first
+change, then serializes every changed product with one query per
+``PRODUCT_BROADCAST_BATCH_SIZE`` products and publishes them. Saving a
+product 50 times in the window (or importing 10k products) costs one
+dictionary write per save in the request and one serialization per product
+in the publisher.
+
+Coalescing keeps the latest state: a created-then-updated product is sent
+as created, a deleted product only as deleted, and price and stock changes
+keep the first old value and the last new value (dropped if they net out).
+
+Clients subscribe to topics, each a channel group, and an update is only
+sent to the topics it matches:
+
+- ``product.<id>`` and ``category.<id>``: any change to that product / a
+  product in that category
+- ``new_arrivals``, ``featured``, ``sale``: changes to products flagged so
+- ``price_drops``: price changes that lowered the price
+
+A product moved out of a category or flag is also published to the topics
+it matched as loaded, so those subscribers see it leave.
+
+Each update is JSON-encoded once; every topic in a batch gets one
+pre-encoded ``product_updates`` message carrying its ``topic``, so a socket
+subscribed to overlapping topics sees an update once per matching topic.
+
+The new-arrivals and featured lists every socket asks for on connect are
+kept pre-encoded in the process-wide ``listings`` snapshot. The publisher
+marks a list stale when a batch touches one of its products or publishes to
+its topic, and its thread rebuilds it, so connects are answered from memory.
+The drop is recorded as a new list version in the shared cache, so other
+processes rebuild their copy too; a list is also rebuilt after
+``PRODUCT_SNAPSHOT_TTL_SECONDS`` (ratings change without product saves).
+"""
+import atexit
+import json
+import logging
+import re
+import threading
+import time
+from decimal import Decimal
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+
+from .models import Product
+from .serializers import ProductSerializer
+
+logger = logging.getLogger(__name__)
+
+GROUP_PREFIX = 'products.'
+STATIC_TOPICS = ('new_arrivals', 'featured', 'sale', 'price_drops')
+_ID_TOPIC = re.compile(r'^(product|category)\.[1-9][0-9]{0,18}$')
+
+
+def valid_topic(topic):
+    return isinstance(topic, str) and (topic in STATIC_TOPICS or bool(_ID_TOPIC.match(topic)))
+
+
+def topic_group(topic):
+    """Channel group of a topic (topics are validated first, so this is a safe group name)."""
+    return GROUP_PREFIX + topic
+
+
+def _topics(product_id, state, flags):
+    topics = [f'product.{product_id}']
+    if state['category_id']:
+        topics.append(f'category.{state["category_id"]}')
+    if flags:
+        topics += [topic for topic, field in (
+            ('new_arrivals', 'new_arrival'), ('featured', 'featured'), ('sale', 'on_sale')
+        ) if state[field]]
+    return topics
+
+
+def product_topics(product, flags=True):
+    """Topics a change to ``product`` is published to (``flags``: include new_arrivals/featured/sale)."""
+    return _topics(product.id, {
+        'category_id': product.category_id, 'new_arrival': product.new_arrival,
+        'featured': product.featured, 'on_sale': product.on_sale,
+    }, flags)
+
+
+def loaded_topics(product, flags=True):
+    """
+    Topics ``product`` matched when it was loaded from the database.
+
+    A change that moves a product out of a category or flag must still reach
+    that topic's subscribers, so these are published to as well.
+    """
+    state = getattr(product, '_loaded_topic_state', None)
+    if state is None or product.id is None:
+        return []
+    return _topics(product.id, state, flags)
+
+
+def _union(topics, more):
+    return topics + [topic for topic in more if topic not in topics]
+
+
+class ListingSnapshots:
+    """
+    Pre-encoded product lists sent to sockets on connect, shared by the process.
+
+    Each list is versioned in the shared cache: dropping it in one process
+    bumps the version, and every other process's copy stops being served
+    within ``VERSION_CHECK_SECONDS``.
+    """
+
+    # name (also the topic of its products) -> (message type, Product flag)
+    LISTINGS = {
+        'new_arrivals': ('new_arrivals', 'new_arrival'),
+        'featured': ('featured_products', 'featured'),
+    }
+    SIZE = 8
+    VERSION_KEY = 'product_listing_version:%s'
+    VERSION_CHECK_SECONDS = 1.0
+
+    def __init__(self):
+        self._snapshots = {}  # name -> (text, product ids, built at, shared version)
+        self._generations = dict.fromkeys(self.LISTINGS, 0)
+        self._versions = dict.fromkeys(self.LISTINGS, 0)
+        self._versions_read_at = float('-inf')
+        self._lock = threading.Lock()
+
+    def _shared_version(self, name, fresh=False):
+        """The list's version in the shared cache, read at most once per ``VERSION_CHECK_SECONDS``."""
+        now = time.monotonic()
+        if fresh or now - self._versions_read_at >= self.VERSION_CHECK_SECONDS:
+            found = cache.get_many([self.VERSION_KEY % listing for listing in self.LISTINGS])
+            self._versions = {listing: found.get(self.VERSION_KEY % listing, 0) for listing in self.LISTINGS}
+            self._versions_read_at = now
+        return self._versions[name]
+
+    def _bump_version(self, name):
+        key = self.VERSION_KEY % name
+        try:
+            cache.incr(key)
+        except ValueError:
+            if not cache.add(key, 1, timeout=None):
+                cache.incr(key)
+        self._versions_read_at = float('-inf')
+
+    def get(self, name):
+        """The encoded list if it is fresh, else None (no database access)."""
+        snapshot = self._snapshots.get(name)
+        if snapshot is None or time.monotonic() - snapshot[2] > settings.PRODUCT_SNAPSHOT_TTL_SECONDS:
+            return None
+        if snapshot[3] != self._shared_version(name):
+            return None
+        return snapshot[0]
+
+    def ensure(self, name):
+        """The encoded list, rebuilding it first if needed (one rebuild however many callers wait)."""
+        with self._lock:
+            return self.get(name) or self.refresh(name)
+
+    def refresh(self, name):
+        message_type, flag = self.LISTINGS[name]
+        generation = self._generations[name]
+        version = self._shared_version(name, fresh=True)
+        products = list(
+            Product.objects.filter(**{flag: True}).select_related('category').prefetch_related('reviews')[:self.SIZE]
+        )
+        text = json.dumps(
+            {'type': message_type, 'data': ProductSerializer(products, many=True).data},
+            cls=DjangoJSONEncoder, separators=(',', ':'),
+        )
+        # Not kept if invalidated while the query ran; the next caller rebuilds it
+        if self._generations[name] == generation:
+            self._snapshots[name] = (text, {product.id for product in products}, time.monotonic(), version)
+        return text
+
+    def invalidate(self, changed_ids, topics=()):
+        """
+        Drop the lists that show one of ``changed_ids`` or whose topic a change was published to.
+
+        A product entering or leaving a list is published to that list's
+        topic, so this also catches lists built by other processes.
+
+        Returns:
+            Names of the lists dropped
+        """
+        dropped = []
+        for name in self.LISTINGS:
+            snapshot = self._snapshots.get(name)
+            shown = snapshot[1] if snapshot is not None else set()
+            if shown & changed_ids or name in topics:
+                self._generations[name] += 1
+                self._snapshots.pop(name, None)
+                self._bump_version(name)
+                dropped.append(name)
+        return dropped
+
+
+listings = ListingSnapshots()
+
+
+class ProductBroadcaster:
+    """Per-process queue of product changes, published in debounced batches."""
+
+    def __init__(self, debounce=None, batch_size=None):
+        self.debounce = debounce
+        self.batch_size = batch_size
+        self._pending = {}  # (kind, product_id) -> change, in first-change order
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self.stale_listings = set()
+        atexit.register(self.flush)
+
+    def _queue(self, key, change, merge=None):
+        with self._lock:
+            current = self._pending.get(key)
+            self._pending[key] = merge(current, change) if current is not None and merge else change
+        if getattr(settings, 'BUFFERED_WRITES_BACKGROUND', True):
+            self._ensure_publisher()
+            self._wakeup.set()
+
+    def product_saved(self, product_id, created=False, old_topics=()):
+        """
+        Queue a created/updated message; the product is serialized at publish time.
+
+        ``old_topics`` are topics it matched before the save, sent the update too.
+        """
+        self._queue(('product', product_id), {'created': created, 'old_topics': list(old_topics)},
+                    lambda current, change: current if 'deleted' in current else {
+                        'created': current['created'] or change['created'],
+                        'old_topics': _union(current['old_topics'], change['old_topics']),
+                    })
+
+    def product_deleted(self, product_id, name, topics):
+        """Queue a deletion; ``topics`` are taken from the instance before it was deleted."""
+        self._queue(('product', product_id), {'deleted': name, 'topics': topics})
+
+    def price_changed(self, product, old_price, new_price, old_topics=()):
+        change = {
+            'name': product.name, 'old': old_price, 'new': new_price,
+            'topics': _union(product_topics(product, False), old_topics),
+        }
+        self._queue(('price', product.id), change, lambda current, change: {**change, 'old': current['old']})
+
+    def stock_changed(self, product, old_stock, new_stock):
+        change = {'name': product.name, 'old': old_stock, 'new': new_stock, 'topics': product_topics(product, False)}
+        self._queue(('stock', product.id), change, lambda current, change: {**change, 'old': current['old']})
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self, channel_layer=None):
+        """Publish all pending changes now. Returns the number of topic messages sent."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            channel_layer = channel_layer or get_channel_layer()
+            batch_size = self.batch_size or settings.PRODUCT_BROADCAST_BATCH_SIZE
+            items = list(pending.items())
+            sent = 0
+            for start in range(0, len(items), batch_size):
+                try:
+                    by_topic = {}
+                    for topics, update in self._encode(items[start:start + batch_size]):
+                        fragment = json.dumps(update, cls=DjangoJSONEncoder, separators=(',', ':'))
+                        for topic in topics:
+                            by_topic.setdefault(topic, []).append(fragment)
+                    self.stale_listings.update(listings.invalidate(
+                        {product_id for (_, product_id), _ in items[start:start + batch_size]}, by_topic
+                    ))
+                    if channel_layer is None:
+                        continue
+                    for topic, fragments in by_topic.items():
+                        text = '{"type":"product_updates","topic":%s,"data":[%s]}' % (
+                            json.dumps(topic), ','.join(fragments)
+                        )
+                        async_to_sync(channel_layer.group_send)(
+                            topic_group(topic), {'type': 'product_updates', 'text': text}
+                        )
+                        sent += 1
+                except Exception:
+                    logger.exception('Failed to publish %d product updates', len(items[start:start + batch_size]))
+            return sent
+
+    def _encode(self, items):
+        """``[(topics, update), ...]`` for a batch of pending changes."""
+        saved_ids = [product_id for (kind, product_id), change in items if kind == 'product' and 'deleted' not in change]
+        products = {}
+        if saved_ids:
+            queryset = Product.objects.filter(id__in=saved_ids).select_related('category').prefetch_related('reviews')
+            products = {product.id: product for product in queryset}
+        serialized = {}
+        if products:
+            rows = ProductSerializer(list(products.values()), many=True).data
+            serialized = {row['id']: row for row in rows}
+
+        updates = []
+        for (kind, product_id), change in items:
+            if kind == 'product' and 'deleted' in change:
+                updates.append((change['topics'], {
+                    'type': 'product_deleted', 'product_id': product_id, 'product_name': change['deleted'],
+                }))
+            elif kind == 'product':
+                product = products.get(product_id)
+                if product is None:
+                    continue  # Deleted before publishing; its deletion is sent on its own
+                updates.append((_union(product_topics(product), change['old_topics']), {
+                    'type': 'product_created' if change['created'] else 'product_updated',
+                    'product': serialized[product_id],
+                    'is_new_arrival': product.new_arrival,
+                    'is_featured': product.featured,
+                    'is_on_sale': product.on_sale,
+                }))
+            elif change['old'] != change['new']:
+                if kind == 'price':
+                    update = _price_update(product_id, change)
+                    topics = change['topics'] + (['price_drops'] if update['price_dropped'] else [])
+                else:
+                    update, topics = _stock_update(product_id, change), change['topics']
+                updates.append((topics, update))
+        return updates
+
+    def _ensure_publisher(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='product-broadcaster', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            # Let the burst that woke us finish before publishing it
+            time.sleep(self.debounce if self.debounce is not None else settings.PRODUCT_BROADCAST_DEBOUNCE_SECONDS)
+            self._wakeup.clear()
+            try:
+                self.flush()
+                # Rebuild dropped lists here so connecting sockets find them ready
+                while self.stale_listings:
+                    listings.ensure(self.stale_listings.pop())
+            except Exception:
+                logger.exception('Failed to rebuild product listings')
+            finally:
+                connections.close_all()
+
+
+def _price_update(product_id, change):
+    old_price, new_price = Decimal(change['old']), Decimal(change['new'])
+    price_dropped = new_price < old_price
+    return {
+        'type': 'price_change',
+        'product_id': product_id,
+        'product_name': change['name'],
+        'old_price': float(old_price),
+        'new_price': float(new_price),
+        'price_dropped': price_dropped,
+        'discount_percent': float((old_price - new_price) / old_price * 100) if price_dropped else 0,
+    }
+
+
+def _stock_update(product_id, change):
+    new_stock = change['new']
+    return {
+        'type': 'stock_update',
+        'product_id': product_id,
+        'product_name': change['name'],
+        'old_stock': change['old'],
+        'new_stock': new_stock,
+        'restocked': new_stock > change['old'],
+        'low_stock': 0 < new_stock < settings.LOW_STOCK_THRESHOLD,
+        'out_of_stock': new_stock == 0,
+    }
+
+
+product_broadcasts = ProductBroadcaster()
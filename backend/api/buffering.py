@@ -0,0 +1,112 @@
+"""
+In-memory write buffering for high-volume, append-only tables.
+
+Request handlers hand unsaved model instances to a ``BufferedWriter``; a
+background flusher thread writes them with ``bulk_create`` once the batch is
+full or the flush interval elapses, so page loads never wait on an INSERT.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class BufferedWriter:
+    """
+    Per-process buffer that batches model inserts.
+
+    Args:
+        model: Model class whose instances are buffered
+        batch_size: Number of pending rows that triggers a flush
+        flush_interval: Maximum seconds a row may wait before being flushed
+        max_buffer: Hard cap on pending rows; the oldest rows are dropped beyond it
+    """
+
+    def __init__(self, model, batch_size=500, flush_interval=2.0, max_buffer=50000):
+        self.model = model
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.dropped = 0
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._listeners = []
+        atexit.register(self.flush)
+
+    def add(self, instances):
+        """Queue unsaved instances for the next flush."""
+        if not instances:
+            return
+        with self._lock:
+            self._pending.extend(instances)
+            overflow = len(self._pending) - self.max_buffer
+            if overflow > 0:
+                del self._pending[:overflow]
+                self.dropped += overflow
+            full = len(self._pending) >= self.batch_size
+        if getattr(settings, 'BUFFERED_WRITES_BACKGROUND', True):
+            self._ensure_flusher()
+            if full:
+                self._wakeup.set()
+
+    def add_listener(self, callback):
+        """Register ``callback(instances)`` to run after every successful flush."""
+        self._listeners.append(callback)
+
+    def pending_count(self):
+        """Number of rows waiting to be written."""
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """Write all pending rows now. Returns the number of rows written."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            try:
+                self.model.objects.bulk_create(batch, batch_size=self.batch_size)
+            except Exception:
+                logger.exception('Failed to flush %d %s rows', len(batch), self.model.__name__)
+                return 0
+            for listener in self._listeners:
+                try:
+                    listener(batch)
+                except Exception:
+                    logger.exception('Flush listener %r failed', listener)
+            return len(batch)
+
+    def _ensure_flusher(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run,
+                name=f'{self.model.__name__}-flusher',
+                daemon=True,
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            started = time.monotonic()
+            try:
+                while self.flush() >= self.batch_size:
+                    # Keep draining while producers outpace us.
+                    if time.monotonic() - started > self.flush_interval:
+                        break
+            finally:
+                connections.close_all()
@@ -0,0 +1,105 @@
+"""
+Server-side carts.
+
+A cart is one ``Cart`` row per owner (``u:<user id>`` or ``s:<session id>``,
+see ``inventory.owner_keys_for_request``) holding ``{product id: quantity}``.
+Updates lock that single row; prices are always computed on read by the
+pricing engine.
+"""
+from django.conf import settings
+from django.db import transaction
+
+from .models import Cart, Product
+from .pricing import PricingError, price_cart
+
+
+class CartError(Exception):
+    """Raised when a cart update is rejected."""
+
+    def __init__(self, message, code='invalid'):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+
+
+def get_cart(owner_key):
+    """Return the owner's cart, or an unsaved empty one."""
+    return Cart.objects.filter(owner_key=owner_key).first() or Cart(owner_key=owner_key)
+
+
+def _locked_cart(owner_key):
+    cart, _ = Cart.objects.select_for_update().get_or_create(owner_key=owner_key)
+    return cart
+
+
+def set_line(owner_key, product_id, quantity):
+    """Set a line's quantity; 0 removes it. Returns the updated Cart."""
+    with transaction.atomic():
+        cart = _locked_cart(owner_key)
+        key = str(product_id)
+        if quantity <= 0:
+            cart.lines.pop(key, None)
+        else:
+            if key not in cart.lines:
+                if len(cart.lines) >= settings.CART_MAX_LINES:
+                    raise CartError('Cart is full', 'cart_full')
+                if not Product.objects.filter(id=product_id).exists():
+                    raise CartError('Product not found', 'not_found')
+            cart.lines[key] = quantity
+        cart.save(update_fields=['lines', 'updated_at'])
+    return cart
+
+
+def set_voucher(owner_key, code):
+    """Attach a voucher code to the cart (empty string removes it). Returns the updated Cart."""
+    with transaction.atomic():
+        cart = _locked_cart(owner_key)
+        cart.voucher_code = code
+        cart.save(update_fields=['voucher_code', 'updated_at'])
+    return cart
+
+
+def clear(owner_key):
+    """Delete the owner's cart."""
+    Cart.objects.filter(owner_key=owner_key).delete()
+
+
+def merge(from_key, into_key):
+    """Move a session cart into a user's cart after login, summing quantities."""
+    if from_key == into_key:
+        return get_cart(into_key)
+    with transaction.atomic():
+        source = Cart.objects.select_for_update().filter(owner_key=from_key).first()
+        if source is None:
+            return get_cart(into_key)
+        cart = _locked_cart(into_key)
+        for key, quantity in source.lines.items():
+            cart.lines[key] = min(cart.lines.get(key, 0) + quantity, settings.CART_MAX_QUANTITY)
+        cart.voucher_code = cart.voucher_code or source.voucher_code
+        cart.save(update_fields=['lines', 'voucher_code', 'updated_at'])
+        source.delete()
+    return cart
+
+
+def priced(cart):
+    """
+    Price a cart for display.
+
+    Lines for deleted products are dropped. A voucher that no longer applies
+    is left on the cart but priced out, and its error is returned so the
+    client can show it.
+
+    Returns:
+        Tuple of (PricedCart, voucher_error or None)
+    """
+    try:
+        return price_cart(cart.items, cart.voucher_code or None), None
+    except PricingError as exc:
+        if exc.code == 'not_found' and cart.pk:
+            for product_id in exc.details['product_ids']:
+                cart.lines.pop(str(product_id), None)
+            cart.save(update_fields=['lines', 'updated_at'])
+            return priced(cart)
+        if not exc.code.startswith('voucher'):
+            raise
+        return price_cart(cart.items), exc.message
@@ -0,0 +1,176 @@
+"""
+Atomic checkout service.
+
+Prices a cart server-side with the pricing engine (sale prices, bundle
+discounts and the voucher), and inside one transaction creates the order,
+bulk-inserts its items and decrements stock with conditional ``F()``
+updates. Contended product rows are touched last and in a fixed (id) order,
+so row locks are held only for the tail of the transaction and concurrent
+checkouts cannot deadlock on each other.
+
+Stock held by other shoppers' cart holds is not sellable; the buyer's own
+holds are converted into the sale. Hot SKUs are decremented through their
+striped sub-counters instead of the product row. The voucher is redeemed
+last of all, with the same kind of conditional update (``vouchers.redeem``).
+
+``release_orders`` is the reverse, run when orders are cancelled: it puts the
+items back in stock and gives the voucher use or campaign code back.
+"""
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from . import order_events
+from .inventory import active_holds, decrement_striped, fold_stripes, restock_striped
+from .models import InventoryHold, Order, OrderItem, Product
+from .pricing import PricingError, price_cart
+from .vouchers import VoucherError, redeem, redeem_code, unredeem
+
+
+class CheckoutError(Exception):
+    """Raised when a cart cannot be checked out."""
+
+    def __init__(self, message, code='invalid', details=None):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+        self.details = details or {}
+
+
+def checkout(user, items, shipping_address, phone, payment_method, voucher_code=None, notes='',
+             hold_owner_keys=None):
+    """
+    Place an order for ``items`` atomically.
+
+    Args:
+        user: User placing the order
+        items: List of ``{'product_id': int, 'quantity': int}``
+        shipping_address, phone, payment_method, notes: Order details
+        voucher_code: Optional voucher to apply
+        hold_owner_keys: Owner keys whose inventory holds this order consumes
+
+    Returns:
+        The created Order
+
+    Raises:
+        CheckoutError: Unknown product, invalid voucher or insufficient stock.
+            Nothing is written in that case.
+    """
+    if not items:
+        raise CheckoutError('Cart is empty', 'empty_cart')
+    try:
+        cart = price_cart(items, voucher_code)
+    except PricingError as exc:
+        raise CheckoutError(exc.message, exc.code, exc.details)
+
+    try:
+        return _place_order(
+            user, cart, shipping_address, phone, payment_method, notes, hold_owner_keys
+        )
+    except CheckoutError as exc:
+        # A sold-out hot SKU: refresh its mirrored inventory right away
+        product_id = exc.details.get('product_id')
+        if exc.code == 'out_of_stock' and any(
+            line.product_id == product_id and line.stock_stripes for line in cart.lines
+        ):
+            fold_stripes([product_id])
+        raise
+
+
+def _place_order(user, cart, shipping_address, phone, payment_method, notes, hold_owner_keys):
+    """Write the order and take the stock, all-or-nothing."""
+    with transaction.atomic():
+        order = Order.objects.create(
+            user=user,
+            total_price=cart.subtotal,
+            discount_amount=cart.discount,
+            final_price=cart.final_price,
+            voucher_code=cart.voucher.code if cart.voucher else None,
+            shipping_address=shipping_address,
+            phone=phone,
+            payment_method=payment_method,
+            notes=notes,
+        )
+        # bulk_create skips OrderItem.save(), so totals are computed here
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product_id=line.product_id,
+                quantity=line.quantity,
+                price_at_purchase=line.unit_price,
+                total=line.line_total,
+            )
+            for line in cart.lines
+        ])
+
+        product_ids = [line.product_id for line in cart.lines]
+        holds = active_holds(hold_owner_keys, product_ids) if hold_owner_keys else {}
+
+        # Hot rows last, in id order
+        now = timezone.now()
+        for line in sorted(cart.lines, key=lambda line: line.product_id):
+            if line.stock_stripes:
+                updated = decrement_striped(line.product_id, line.stock_stripes, line.quantity)
+            else:
+                held = sum(hold.quantity for hold in holds.get(line.product_id, []))
+                # Sellable to this buyer: inventory - (reserved - own holds)
+                updated = Product.objects.filter(
+                    id=line.product_id,
+                    inventory__gte=F('reserved') + (line.quantity - held),
+                ).update(
+                    inventory=F('inventory') - line.quantity,
+                    reserved=F('reserved') - held,
+                    updated_at=now,
+                )
+            if not updated:
+                raise CheckoutError(
+                    f'Insufficient stock for {line.name}',
+                    'out_of_stock',
+                    {'product_id': line.product_id}
+                )
+
+        if holds:
+            InventoryHold.objects.filter(
+                id__in=[hold.id for product_holds in holds.values() for hold in product_holds]
+            ).update(status='converted', updated_at=now)
+
+        if cart.voucher is not None:
+            try:
+                if cart.voucher.code_id is not None:
+                    redeem_code(cart.voucher.code_id, user, order)
+                else:
+                    redeem(
+                        cart.voucher.id, user, order,
+                        discount_amount=cart.discount,
+                        max_uses_per_user=cart.voucher.max_uses_per_user,
+                    )
+            except VoucherError as exc:
+                raise CheckoutError(exc.message, exc.code)
+
+        order_events.order_placed(order, [(line.product_id, line.quantity) for line in cart.lines])
+
+    return order
+
+
+def release_orders(order_ids):
+    """
+    Give back the stock and voucher uses taken at checkout by ``order_ids``.
+
+    Call in the transaction that cancels the orders, right after the
+    conditional status update, so each order is released exactly once.
+    Products are touched in id order and vouchers last, as at checkout.
+    """
+    quantities = dict(
+        OrderItem.objects.filter(order_id__in=order_ids, product_id__isnull=False)
+        .values('product_id').annotate(quantity=Sum('quantity')).values_list('product_id', 'quantity')
+    )
+    striped = set(Product.objects.filter(id__in=quantities, stock_stripes__gt=0).values_list('id', flat=True))
+    now = timezone.now()
+    for product_id in sorted(quantities):
+        if product_id in striped:
+            restock_striped(product_id, quantities[product_id])
+        else:
+            Product.objects.filter(id=product_id).update(
+                inventory=F('inventory') + quantities[product_id], updated_at=now
+            )
+    unredeem(order_ids)
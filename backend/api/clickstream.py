@@ -0,0 +1,60 @@
+"""
+Clickstream ingestion for browsing-based personalization.
+
+The frontend posts batches of view / add-to-cart / search events to
+``/api/events/``. Events are buffered in memory per worker and written to the
+append-only ``ClickEvent`` table in size- or time-bounded batches; each flushed batch also
+updates the co-view counts and the daily unique-visitor sketches.
+"""
+from django.conf import settings
+from django.utils import timezone
+
+from . import coview, recently_viewed, sketches
+from .buffering import BufferedWriter
+from .models import ClickEvent
+
+
+event_buffer = BufferedWriter(
+    ClickEvent,
+    batch_size=settings.CLICKSTREAM_BATCH_SIZE,
+    flush_interval=settings.CLICKSTREAM_FLUSH_INTERVAL,
+    max_buffer=settings.CLICKSTREAM_MAX_BUFFER,
+)
+event_buffer.add_listener(coview.update_from_events)
+event_buffer.add_listener(sketches.update_from_events)
+
+
+def record_events(events, user=None, session_id=''):
+    """
+    Queue validated events for writing and update the recently-viewed ring.
+
+    Args:
+        events: List of dicts with ``type`` and optional ``product_id``,
+            ``query`` and ``occurred_at`` keys
+        user: Authenticated user, if any
+        session_id: Client-generated session identifier
+
+    Returns:
+        List of unsaved ClickEvent instances that were queued
+    """
+    now = timezone.now()
+    user_id = user.id if user is not None and user.is_authenticated else None
+    instances = [
+        ClickEvent(
+            event_type=event['type'],
+            product_id=event.get('product_id'),
+            user_id=user_id,
+            session_id=session_id,
+            query=event.get('query', ''),
+            occurred_at=event.get('occurred_at') or now,
+            created_at=now,
+        )
+        for event in events
+    ]
+    event_buffer.add(instances)
+
+    viewed_ids = [event['product_id'] for event in events if event['type'] == 'view']
+    if viewed_ids:
+        recently_viewed.push(viewed_ids, user_id=user_id, session_id=session_id)
+
+    return instances
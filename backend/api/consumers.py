@@ -2,16 +2,29 @@
 WebSocket consumers for real-time updates.
 """
 import json
+from urllib.parse import parse_qs
+
+from django.conf import settings
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from .models import Product
-from .serializers import ProductSerializer
+from .broadcasts import listings, topic_group, valid_topic
+from .live_sales import GROUP as SALES_DASHBOARD_GROUP
+from .models import Order, UserProfile
+from .order_events import OPEN_STATUSES, tracking_payload, user_group
 
 
 class ProductConsumer(AsyncWebsocketConsumer):
     """
     WebSocket consumer for real-time product updates.
 
+    Clients receive only the topics they subscribe to (see api.broadcasts):
+    ``product.<id>``, ``category.<id>``, ``new_arrivals``, ``featured``,
+    ``sale`` and ``price_drops``. Subscribe on connect with
+    ``ws/products/?topics=featured,category.3`` or at any time with
+    ``{"type": "subscribe", "topics": [...]}`` /
+    ``{"type": "unsubscribe", "topics": [...]}``; each connection may hold at
+    most ``WS_MAX_SUBSCRIPTIONS`` topics.
+
     Handles:
     - New product arrivals
     - Product stock updates
@@ -19,31 +32,28 @@ class ProductConsumer(AsyncWebsocketConsumer):
     """
 
     async def connect(self):
-        """Accept WebSocket connection and join product updates group."""
-        self.group_name = 'product_updates'
-
-        # Join product updates group
-        await self.channel_layer.group_add(
-            self.group_name,
-            self.channel_name
-        )
-
+        """Accept the connection and join the topics from the query string."""
+        self.topics = set()
         await self.accept()
 
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        initial = [topic for value in query.get('topics', []) for topic in value.split(',') if topic]
+        if initial:
+            await self.subscribe(initial)
+
         # Send initial new arrivals data
         await self.send_new_arrivals()
 
     async def disconnect(self, close_code):
-        """Leave product updates group."""
-        await self.channel_layer.group_discard(
-            self.group_name,
-            self.channel_name
-        )
+        """Leave every subscribed topic group."""
+        for topic in getattr(self, 'topics', ()):
+            await self.channel_layer.group_discard(topic_group(topic), self.channel_name)
 
     async def receive(self, text_data):
         """
         Receive message from WebSocket.
         Expected message types:
+        - subscribe / unsubscribe: Change topic subscriptions
         - get_new_arrivals: Fetch latest new arrivals
         - get_featured: Fetch featured products
         """
@@ -51,53 +61,209 @@ class ProductConsumer(AsyncWebsocketConsumer):
             data = json.loads(text_data)
             message_type = data.get('type')
 
-            if message_type == 'get_new_arrivals':
+            if message_type == 'subscribe':
+                await self.subscribe(data.get('topics') or [])
+            elif message_type == 'unsubscribe':
+                await self.unsubscribe(data.get('topics') or [])
+            elif message_type == 'get_new_arrivals':
                 await self.send_new_arrivals()
             elif message_type == 'get_featured':
                 await self.send_featured_products()
 
-        except json.JSONDecodeError:
+        except (json.JSONDecodeError, AttributeError):
             await self.send(text_data=json.dumps({
                 'type': 'error',
                 'message': 'Invalid JSON'
             }))
 
-    async def product_update(self, event):
+    async def subscribe(self, topics):
+        """Join valid topics up to the per-connection limit; reply with the result."""
+        if not isinstance(topics, list):
+            topics = []
+        invalid = [topic for topic in topics if not valid_topic(topic)]
+        for topic in dict.fromkeys(topic for topic in topics if valid_topic(topic)):
+            if topic in self.topics:
+                continue
+            if len(self.topics) >= settings.WS_MAX_SUBSCRIPTIONS:
+                break
+            await self.channel_layer.group_add(topic_group(topic), self.channel_name)
+            self.topics.add(topic)
+        rejected = [topic for topic in topics if valid_topic(topic) and topic not in self.topics]
+        await self.send_subscriptions(invalid=invalid, over_limit=rejected)
+
+    async def unsubscribe(self, topics):
+        for topic in topics if isinstance(topics, list) else []:
+            if topic in self.topics:
+                await self.channel_layer.group_discard(topic_group(topic), self.channel_name)
+                self.topics.discard(topic)
+        await self.send_subscriptions()
+
+    async def send_subscriptions(self, invalid=(), over_limit=()):
+        message = {'type': 'subscriptions', 'topics': sorted(self.topics)}
+        if invalid:
+            message['invalid'] = list(invalid)
+        if over_limit:
+            message['over_limit'] = list(over_limit)
+            message['limit'] = settings.WS_MAX_SUBSCRIPTIONS
+        await self.send(text_data=json.dumps(message))
+
+    async def product_updates(self, event):
         """
-        Send product update to WebSocket.
-        Called when a product is created/updated.
+        Forward a pre-encoded batch of product updates.
+        Sent by the publisher in api.broadcasts after products change.
         """
-        await self.send(text_data=json.dumps({
-            'type': 'product_update',
-            'data': event['data']
-        }))
+        await self.send(text_data=event['text'])
 
     async def send_new_arrivals(self):
-        """Fetch and send new arrivals to client."""
-        products = await self.get_new_arrivals()
+        """Send the shared, pre-encoded new arrivals list."""
+        await self.send_listing('new_arrivals')
+
+    async def send_featured_products(self):
+        """Send the shared, pre-encoded featured products list."""
+        await self.send_listing('featured')
+
+    async def send_listing(self, name):
+        # Served from memory; only a stale list costs a (single, shared) rebuild
+        text = listings.get(name) or await database_sync_to_async(listings.ensure)(name)
+        await self.send(text_data=text)
+
+
+class OrderConsumer(AsyncWebsocketConsumer):
+    """
+    WebSocket consumer for a customer's own order updates.
+
+    Each authenticated user joins their private ``orders_user_<id>`` group and
+    receives status and tracking changes for their orders as they happen,
+    replacing polling of ``/api/orders/<id>/tracking/``.
+
+    Handles:
+    - Order status changes
+    - Shipment tracking updates
+    """
+
+    async def connect(self):
+        """Accept authenticated connections and join the user's order group."""
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close(code=4401)
+            return
+
+        self.group_name = user_group(user.id)
+        await self.channel_layer.group_add(
+            self.group_name,
+            self.channel_name
+        )
+
+        await self.accept()
+
+        # Send the current state so clients need no initial HTTP round trip
+        await self.send_open_orders()
+
+    async def disconnect(self, close_code):
+        """Leave the user's order group."""
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(
+                self.group_name,
+                self.channel_name
+            )
+
+    async def receive(self, text_data):
+        """
+        Receive message from WebSocket.
+        Expected message types:
+        - get_open_orders: Fetch the user's orders that are still in progress
+        """
+        try:
+            data = json.loads(text_data)
+            if data.get('type') == 'get_open_orders':
+                await self.send_open_orders()
+
+        except json.JSONDecodeError:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': 'Invalid JSON'
+            }))
+
+    async def order_update(self, event):
+        """
+        Send an order update to WebSocket.
+        Called by the ``order_push`` outbox handler.
+        """
         await self.send(text_data=json.dumps({
-            'type': 'new_arrivals',
-            'data': products
+            'type': 'order_update',
+            'data': event['data']
         }))
 
-    async def send_featured_products(self):
-        """Fetch and send featured products to client."""
-        products = await self.get_featured_products()
+    async def send_open_orders(self):
+        """Fetch and send the user's in-progress orders to client."""
+        orders = await self.get_open_orders()
         await self.send(text_data=json.dumps({
-            'type': 'featured_products',
-            'data': products
+            'type': 'open_orders',
+            'data': orders
         }))
 
     @database_sync_to_async
-    def get_new_arrivals(self):
-        """Get new arrival products from database."""
-        products = Product.objects.filter(new_arrival=True).select_related('category').prefetch_related('reviews')[:8]
-        serializer = ProductSerializer(products, many=True)
-        return serializer.data
+    def get_open_orders(self):
+        """Get the user's in-progress orders with their tracking info."""
+        orders = Order.objects.filter(
+            user_id=self.scope['user'].id,
+            status__in=OPEN_STATUSES
+        ).select_related('tracking')[:50]
+        return [
+            {
+                'order_id': order.id,
+                'order_number': order.order_id,
+                'status': order.status,
+                'tracking': tracking_payload(order.tracking) if hasattr(order, 'tracking') else None,
+            }
+            for order in orders
+        ]
+
+
+class DashboardConsumer(AsyncWebsocketConsumer):
+    """
+    WebSocket consumer for the admin sales dashboard.
+
+    Admins join the ``sales_dashboard`` group and receive the live KPIs
+    computed by the ``stream_sales_dashboard`` ticker, replacing polling of
+    the analytics endpoints. Ticks arrive already encoded and are forwarded
+    as is, so each viewer costs one send.
+
+    Handles:
+    - Sales ticks (orders/revenue per minute, hour and day, top products,
+      low-stock count)
+    """
+
+    async def connect(self):
+        """Accept admin connections and join the dashboard group."""
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close(code=4401)
+            return
+        if not await self.is_admin(user):
+            await self.close(code=4403)
+            return
+
+        self.group_name = SALES_DASHBOARD_GROUP
+        await self.channel_layer.group_add(
+            self.group_name,
+            self.channel_name
+        )
+
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        """Leave the dashboard group."""
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(
+                self.group_name,
+                self.channel_name
+            )
+
+    async def sales_tick(self, event):
+        """Forward a pre-encoded KPI snapshot from the ticker."""
+        await self.send(text_data=event['text'])
 
     @database_sync_to_async
-    def get_featured_products(self):
-        """Get featured products from database."""
-        products = Product.objects.filter(featured=True).select_related('category').prefetch_related('reviews')[:8]
-        serializer = ProductSerializer(products, many=True)
-        return serializer.data
+    def is_admin(self, user):
+        return user.is_staff or UserProfile.objects.filter(user=user, is_admin=True).exists()
@@ -0,0 +1,91 @@
+"""
+Session-based "viewed together" model built from the clickstream.
+
+Each flushed batch of view events is grouped per session; every view is paired
+with the session's previous views that fall inside the sliding window (at most
+``COVIEW_WINDOW_SIZE`` views and ``COVIEW_WINDOW_SECONDS`` back). The tail of
+each session's view sequence is kept in the cache between batches, and pair
+counts are applied with a single upsert-and-increment statement per batch.
+"""
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import CoViewCount
+
+TAIL_CACHE_PREFIX = 'coview:tail:'
+
+
+def _session_key(event):
+    if event.session_id:
+        return event.session_id
+    if event.user_id:
+        return f'user:{event.user_id}'
+    return None
+
+
+def update_from_events(events):
+    """
+    Fold a batch of ClickEvent instances into the co-view counts.
+
+    Registered as a flush listener on the clickstream buffer, so it runs on the
+    flusher thread rather than in a request.
+
+    Returns:
+        Number of (directed) pairs incremented
+    """
+    window_size = settings.COVIEW_WINDOW_SIZE
+    window_seconds = settings.COVIEW_WINDOW_SECONDS
+
+    sequences = defaultdict(list)
+    for event in events:
+        if event.event_type != 'view' or not event.product_id:
+            continue
+        key = _session_key(event)
+        if key:
+            sequences[key].append((event.occurred_at.timestamp(), event.product_id))
+    if not sequences:
+        return 0
+
+    cache_keys = {key: TAIL_CACHE_PREFIX + key for key in sequences}
+    stored_tails = cache.get_many(list(cache_keys.values()))
+
+    pairs = Counter()
+    new_tails = {}
+    for key, views in sequences.items():
+        views.sort()
+        tail = [tuple(item) for item in stored_tails.get(cache_keys[key], [])]
+        for viewed_at, product_id in views:
+            for previous_at, previous_id in tail:
+                if previous_id != product_id and viewed_at - previous_at <= window_seconds:
+                    pairs[(previous_id, product_id)] += 1
+                    pairs[(product_id, previous_id)] += 1
+            tail = [item for item in tail if item[1] != product_id]
+            tail.append((viewed_at, product_id))
+            tail = tail[-window_size:]
+        new_tails[cache_keys[key]] = tail
+
+    cache.set_many(new_tails, timeout=window_seconds)
+    _increment_pairs(pairs)
+    return len(pairs)
+
+
+def _increment_pairs(pairs):
+    """Upsert ``{(product_id, other_product_id): n}`` adding ``n`` to existing counts."""
+    if not pairs:
+        return
+    table = connection.ops.quote_name(CoViewCount._meta.db_table)
+    now = timezone.now()
+    sql = (
+        f'INSERT INTO {table} (product_id, other_product_id, count, updated_at) '
+        f'VALUES (%s, %s, %s, %s) '
+        f'ON CONFLICT (product_id, other_product_id) '
+        f'DO UPDATE SET count = {table}.count + excluded.count, updated_at = excluded.updated_at'
+    )
+    rows = [(a, b, n, now) for (a, b), n in sorted(pairs.items())]
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
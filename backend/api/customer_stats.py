@@ -0,0 +1,234 @@
+"""
+Customer purchasing stats and the cohort table.
+
+``compute`` loads every counted order (live and archived, not cancelled) into
+three NumPy arrays (customer, order time, amount in cents) with keyset reads,
+then derives everything with vectorized operations on the arrays sorted by
+customer:
+
+- per customer: order count, lifetime value, first and last order time and
+  cohort month (the month of the first order)
+- per cohort and months since the first order: active customers and revenue
+
+``write_profiles`` stores the per-customer stats on ``UserProfile`` with
+batched ``bulk_update``, and ``write_cohorts`` replaces the ``CustomerCohort``
+table, so profile pages and the admin cohort endpoint read precomputed rows.
+Months are calendar months in UTC, as in the analytics snapshots.
+"""
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Avg, Count, Q
+from django.utils import timezone
+
+from .models import ArchivedOrder, CustomerCohort, Order, UserProfile
+from .snapshots import _cents, _keyset, cohort_activity
+
+STATS_FIELDS = ['order_count', 'lifetime_value', 'first_order_at', 'last_order_at', 'cohort_month', 'stats_updated_at']
+
+
+def load_orders(chunk_size=50000):
+    """
+    Read counted orders as arrays.
+
+    Returns:
+        Tuple of (user_ids int64, created_at datetime64[s] UTC, amounts int64 cents)
+    """
+    users, times, amounts = [], [], []
+    for model in (Order, ArchivedOrder):
+        queryset = model.objects.exclude(status='cancelled')
+        for rows in _keyset(queryset, ('user_id', 'created_at', 'final_price'), chunk_size):
+            users.append(np.fromiter((row[1] for row in rows), np.int64, len(rows)))
+            times.append(np.fromiter((row[2].timestamp() for row in rows), np.float64, len(rows)))
+            amounts.append(np.fromiter((_cents(row[3]) for row in rows), np.int64, len(rows)))
+    if not users:
+        return np.zeros(0, np.int64), np.zeros(0, 'datetime64[s]'), np.zeros(0, np.int64)
+    times = np.concatenate(times).astype(np.int64).astype('datetime64[s]')
+    return np.concatenate(users), times, np.concatenate(amounts)
+
+
+def per_customer(users, times, amounts):
+    """
+    Per-customer stats from order arrays.
+
+    Returns:
+        ``{column: array}`` with one entry per customer, sorted by ``user_id``:
+        ``user_id``, ``order_count``, ``lifetime_cents``, ``first_order_at``,
+        ``last_order_at`` and ``cohort_month`` (``datetime64[M]``)
+    """
+    order = np.lexsort((times, users))
+    users, times, amounts = users[order], times[order], amounts[order]
+    user_ids, starts, counts = np.unique(users, return_index=True, return_counts=True)
+    return {
+        'user_id': user_ids,
+        'order_count': counts,
+        'lifetime_cents': np.add.reduceat(amounts, starts) if len(starts) else np.zeros(0, np.int64),
+        'first_order_at': times[starts],
+        'last_order_at': times[starts + counts - 1],
+        'cohort_month': times[starts].astype('datetime64[M]'),
+    }
+
+
+def cohort_table(users, times, amounts):
+    """
+    Cohort cells up to the latest month with orders.
+
+    Returns:
+        List of ``(cohort_month, months_since, cohort_size, active_customers,
+        revenue_cents)`` tuples, ``cohort_month`` as ``datetime64[M]``
+    """
+    cohorts, active, revenue = cohort_activity(users, times, amounts)
+    if not len(cohorts):
+        return []
+    # Only months that have happened for each cohort; later cells are not zeros
+    latest = times.max().astype('datetime64[M]')
+    horizon = (latest - cohorts).astype(np.int64)
+    cohort_index, months_since = np.nonzero(np.arange(active.shape[1]) <= horizon[:, None])
+    return list(zip(
+        cohorts[cohort_index],
+        months_since.tolist(),
+        active[cohort_index, 0].tolist(),
+        active[cohort_index, months_since].tolist(),
+        revenue[cohort_index, months_since].tolist(),
+    ))
+
+
+def _aware(values):
+    return [moment.replace(tzinfo=dt_timezone.utc) for moment in values.astype('datetime64[us]').astype(object)]
+
+
+def write_profiles(stats, now=None, batch_size=1000):
+    """
+    Store per-customer stats on their profiles; profiles without counted orders are reset.
+
+    Returns:
+        Number of profiles updated
+    """
+    now = now or timezone.now()
+    profile_ids, profile_users = [], []
+    for profile_id, user_id in UserProfile.objects.values_list('id', 'user_id').iterator(chunk_size=10000):
+        profile_ids.append(profile_id)
+        profile_users.append(user_id)
+    profile_ids = np.array(profile_ids, dtype=np.int64)
+    profile_users = np.array(profile_users, dtype=np.int64)
+
+    # Profile -> stats join: stats are sorted by user id
+    position = np.searchsorted(stats['user_id'], profile_users)
+    position = np.minimum(position, max(len(stats['user_id']) - 1, 0))
+    if len(stats['user_id']):
+        matched = stats['user_id'][position] == profile_users
+    else:
+        matched = np.zeros(len(profile_users), dtype=bool)
+    ids, rows = profile_ids[matched], position[matched]
+
+    updated = 0
+    for start in range(0, len(ids), batch_size):
+        chunk = rows[start:start + batch_size]
+        profiles = [
+            UserProfile(
+                id=profile_id,
+                order_count=count,
+                lifetime_value=Decimal(cents).scaleb(-2),
+                first_order_at=first,
+                last_order_at=last,
+                cohort_month=month,
+                stats_updated_at=now,
+            )
+            for profile_id, count, cents, first, last, month in zip(
+                ids[start:start + batch_size].tolist(),
+                stats['order_count'][chunk].tolist(),
+                stats['lifetime_cents'][chunk].tolist(),
+                _aware(stats['first_order_at'][chunk]),
+                _aware(stats['last_order_at'][chunk]),
+                stats['cohort_month'][chunk].astype('datetime64[D]').astype(object),
+            )
+        ]
+        updated += UserProfile.objects.bulk_update(profiles, STATS_FIELDS)
+
+    # Customers whose orders were all cancelled (or archived away) since the last run
+    updated += UserProfile.objects.filter(order_count__gt=0).exclude(stats_updated_at=now).update(
+        order_count=0, lifetime_value=0, first_order_at=None, last_order_at=None, cohort_month=None,
+        stats_updated_at=now,
+    )
+    return updated
+
+
+def write_cohorts(cells, now=None):
+    """Replace the ``CustomerCohort`` table with ``cells`` from ``cohort_table``."""
+    now = now or timezone.now()
+    with transaction.atomic():
+        CustomerCohort.objects.all().delete()
+        CustomerCohort.objects.bulk_create([
+            CustomerCohort(
+                cohort_month=month.astype('datetime64[D]').astype(object),
+                months_since=months_since,
+                cohort_size=size,
+                active_customers=active,
+                revenue=Decimal(cents).scaleb(-2),
+                computed_at=now,
+            )
+            for month, months_since, size, active, cents in cells
+        ], batch_size=1000)
+    return len(cells)
+
+
+def compute(chunk_size=50000, batch_size=1000):
+    """
+    Recompute profile stats and the cohort table from the order tables.
+
+    Returns:
+        ``{'orders': n, 'customers': n, 'profiles': n, 'cohort_cells': n}``
+    """
+    now = timezone.now()
+    users, times, amounts = load_orders(chunk_size)
+    stats = per_customer(users, times, amounts)
+    return {
+        'orders': len(users),
+        'customers': len(stats['user_id']),
+        'profiles': write_profiles(stats, now, batch_size),
+        'cohort_cells': write_cohorts(cohort_table(users, times, amounts), now),
+    }
+
+
+def cohort_report(date_from=None, date_to=None):
+    """
+    The stored cohort table, one entry per cohort, plus customer totals.
+
+    Args:
+        date_from / date_to: Only cohorts in this month range (dates, inclusive)
+    """
+    cells = CustomerCohort.objects.all()
+    if date_from:
+        cells = cells.filter(cohort_month__gte=date_from.replace(day=1))
+    if date_to:
+        cells = cells.filter(cohort_month__lte=date_to)
+
+    cohorts = {}
+    computed_at = None
+    for cell in cells:
+        computed_at = cell.computed_at
+        cohort = cohorts.setdefault(cell.cohort_month, {
+            'cohort': cell.cohort_month.strftime('%Y-%m'),
+            'customers': cell.cohort_size,
+            'retention': [],
+            'active_customers': [],
+            'revenue': [],
+        })
+        cohort['active_customers'].append(cell.active_customers)
+        cohort['retention'].append(round(cell.active_customers / cell.cohort_size, 4) if cell.cohort_size else 0)
+        cohort['revenue'].append(cell.revenue)
+
+    customers = UserProfile.objects.filter(order_count__gt=0).aggregate(
+        total=Count('id'),
+        repeat=Count('id', filter=Q(order_count__gt=1)),
+        avg_lifetime_value=Avg('lifetime_value'),
+    )
+    return {
+        'computed_at': computed_at,
+        'customers': customers['total'],
+        'repeat_rate': round(customers['repeat'] / customers['total'], 4) if customers['total'] else 0,
+        'avg_lifetime_value': (customers['avg_lifetime_value'] or Decimal('0')).quantize(Decimal('0.01')),
+        'cohorts': list(cohorts.values()),
+    }
@@ -0,0 +1,146 @@
+"""
+Low-overhead A/B experiment framework.
+
+Assignment is a pure function of (experiment key, salt, unit id): the unit id
+is hashed into one of 10,000 buckets and mapped onto the variants' cumulative
+weights, so the same user or session always lands in the same variant and no
+database lookup happens per request. Experiment definitions are loaded from
+the ``Experiment`` table at most once every ``EXPERIMENTS_CONFIG_TTL``
+seconds per worker. Exposures and conversions go through a buffered writer
+and are rolled up by the ``aggregate_experiments`` command.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_right
+from hashlib import blake2b
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+
+from .buffering import BufferedWriter
+from .models import Experiment, ExperimentEvent, validate_variants
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = 10000
+
+
+class CompiledExperiment:
+    """Experiment definition pre-processed for constant-time assignment."""
+
+    __slots__ = ('key', 'salt', 'thresholds', 'names')
+
+    def __init__(self, key, salt, variants):
+        validate_variants(variants)
+        self.key = key
+        self.salt = salt
+        self.thresholds = []
+        self.names = []
+        total = sum(weight for weight in variants.values() if weight > 0)
+        cumulative = 0
+        for name, weight in sorted(variants.items()):
+            if weight <= 0:
+                continue
+            cumulative += weight
+            self.thresholds.append(cumulative * BUCKETS // total)
+            self.names.append(name)
+
+    def assign(self, unit_id):
+        """Return the variant for ``unit_id``."""
+        digest = blake2b(f'{self.key}:{self.salt}:{unit_id}'.encode(), digest_size=8).digest()
+        bucket = int.from_bytes(digest, 'big') % BUCKETS
+        return self.names[bisect_right(self.thresholds, bucket)]
+
+
+_config = {}
+_config_loaded_at = 0.0
+_config_lock = threading.Lock()
+
+event_writer = BufferedWriter(
+    ExperimentEvent,
+    batch_size=settings.EXPERIMENT_LOG_BATCH_SIZE,
+    flush_interval=settings.EXPERIMENT_LOG_FLUSH_INTERVAL,
+)
+
+
+def active_experiments():
+    """Return ``{key: CompiledExperiment}``, reloading from the DB when the TTL expires."""
+    global _config, _config_loaded_at
+    if time.monotonic() - _config_loaded_at < settings.EXPERIMENTS_CONFIG_TTL:
+        return _config
+    with _config_lock:
+        if time.monotonic() - _config_loaded_at >= settings.EXPERIMENTS_CONFIG_TTL:
+            config = {}
+            for experiment in Experiment.objects.filter(is_active=True):
+                try:
+                    config[experiment.key] = CompiledExperiment(experiment.key, experiment.salt, experiment.variants)
+                except ValidationError:
+                    # A bad definition (e.g. saved outside the admin) stops that experiment, not the requests
+                    logger.error('Skipping experiment %s: invalid variants %r', experiment.key, experiment.variants)
+            _config = config
+            _config_loaded_at = time.monotonic()
+    return _config
+
+
+def reload_config():
+    """Force the next ``active_experiments`` call to reload definitions."""
+    global _config_loaded_at
+    _config_loaded_at = 0.0
+
+
+def unit_for_request(request):
+    """
+    Identify the randomization unit: the user when authenticated, otherwise the
+    client session id (``X-Session-ID`` header or ``session_id`` query param).
+    """
+    if request.user.is_authenticated:
+        return f'u:{request.user.id}'
+    session_id = request.headers.get('X-Session-ID') or request.query_params.get('session_id')
+    if session_id:
+        return f's:{session_id[:64]}'
+    return None
+
+
+def assign(key, unit_id):
+    """Return the variant of experiment ``key`` for ``unit_id``, or None if not running."""
+    if unit_id is None:
+        return None
+    experiment = active_experiments().get(key)
+    if experiment is None:
+        return None
+    return experiment.assign(unit_id)
+
+
+def expose(key, unit_id):
+    """Assign ``unit_id`` and log an exposure. Returns the variant, or None."""
+    variant = assign(key, unit_id)
+    if variant is not None:
+        event_writer.add([ExperimentEvent(
+            experiment_key=key,
+            variant=variant,
+            event_type='exposure',
+            unit_id=unit_id,
+        )])
+    return variant
+
+
+def log_conversion(unit_id, value=None):
+    """
+    Log a conversion for ``unit_id`` in every running experiment.
+
+    The unit may never have been exposed to some of them; ``aggregate_experiments``
+    only counts conversions of units with an exposure in the same variant.
+    """
+    if unit_id is None:
+        return
+    event_writer.add([
+        ExperimentEvent(
+            experiment_key=key,
+            variant=experiment.assign(unit_id),
+            event_type='conversion',
+            unit_id=unit_id,
+            value=value,
+        )
+        for key, experiment in active_experiments().items()
+    ])
@@ -0,0 +1,116 @@
+"""
+Bulk shipment updates from warehouse (3PL) integrations.
+
+Records are applied in chunks of ``ORDER_BULK_UPDATE_CHUNK``. Each chunk
+takes one transaction and a fixed number of statements: lock the orders,
+read their tracking rows, ``bulk_update`` the statuses, upsert the tracking
+rows, and publish one outbox event describing every change in the chunk.
+Cancelled orders get their stock and voucher uses back in the same
+transaction. A failing record is reported in the results and does not block
+the rest.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import order_events
+from .checkout import release_orders
+from .models import Order, OrderTracking
+
+TRACKING_FIELDS = {
+    'carrier': 'carrier',
+    'tracking_number': 'tracking_number',
+    'location': 'current_location',
+    'eta': 'estimated_delivery',
+}
+FINAL_STATUSES = {'cancelled', 'delivered'}
+
+
+def _apply_chunk(records):
+    """Apply validated records for distinct orders. Returns ``{order number: error}``."""
+    errors = {}
+    with transaction.atomic():
+        orders = {
+            order.order_id: order
+            for order in Order.objects.select_for_update().filter(
+                order_id__in=[record['order_id'] for record in records]
+            ).only('id', 'order_id', 'user_id', 'status').order_by('id')
+        }
+        trackings = {
+            tracking.order_id: tracking
+            for tracking in OrderTracking.objects.filter(order_id__in=[order.id for order in orders.values()])
+        }
+
+        now = timezone.now()
+        changed_orders = []
+        changed_trackings = []
+        changes = []
+        for record in records:
+            order = orders.get(record['order_id'])
+            if order is None:
+                errors[record['order_id']] = 'Order not found'
+                continue
+            previous_status = order.status
+            new_status = record.get('status') or previous_status
+            if new_status != previous_status:
+                if previous_status in FINAL_STATUSES:
+                    errors[order.order_id] = f'Order is already {previous_status}'
+                    continue
+                order.status = new_status
+                order.updated_at = now
+                changed_orders.append(order)
+
+            tracking = None
+            if any(field in record for field in TRACKING_FIELDS):
+                tracking = trackings.get(order.id) or OrderTracking(order_id=order.id)
+                for field, attribute in TRACKING_FIELDS.items():
+                    if field in record:
+                        setattr(tracking, attribute, record[field])
+                changed_trackings.append(tracking)
+
+            if new_status != previous_status or tracking is not None:
+                change = order_events.status_payload(order, previous_status)
+                change['tracking'] = order_events.tracking_payload(tracking) if tracking is not None else None
+                changes.append(change)
+
+        if changed_orders:
+            Order.objects.bulk_update(changed_orders, ['status', 'updated_at'])
+            # The orders are locked and were not cancelled before, so this runs once per order
+            cancelled = [order.id for order in changed_orders if order.status == 'cancelled']
+            if cancelled:
+                release_orders(cancelled)
+        if changed_trackings:
+            OrderTracking.objects.bulk_create(
+                changed_trackings,
+                update_conflicts=True,
+                unique_fields=['order'],
+                update_fields=list(TRACKING_FIELDS.values()) + ['last_updated'],
+            )
+        if changes:
+            order_events.orders_updated(changes)
+    return errors
+
+
+def apply_shipment_updates(records, chunk_size=None):
+    """
+    Apply validated shipment records.
+
+    Args:
+        records: Dicts with ``order_id`` (the order number) and any of
+            ``status``, ``carrier``, ``tracking_number``, ``location``, ``eta``.
+            Records for the same order are merged, later values winning.
+        chunk_size: Records per transaction (default ``ORDER_BULK_UPDATE_CHUNK``)
+
+    Returns:
+        ``{order number: error}`` for the records that were not applied
+    """
+    chunk_size = chunk_size or settings.ORDER_BULK_UPDATE_CHUNK
+    latest = {}
+    for record in records:
+        latest.setdefault(record['order_id'], {}).update(record)
+    merged = list(latest.values())
+
+    errors = {}
+    for start in range(0, len(merged), chunk_size):
+        errors.update(_apply_chunk(merged[start:start + chunk_size]))
+    return errors
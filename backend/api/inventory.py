@@ -0,0 +1,302 @@
+"""
+Inventory reservation holds for high-contention sales.
+
+Adding to the cart places a short-lived hold. Each hold is mirrored in the
+``Product.reserved`` counter with a conditional ``F()`` update, so
+availability (``inventory - reserved``) stays a column read and a hold can
+never push ``reserved`` past ``inventory``. Checkout converts the shopper's
+holds into a sale, and ``release_expired_holds`` releases lapsed holds in
+batches.
+
+Hot SKUs (``Product.stock_stripes > 0``) keep their stock in several
+``InventoryStripe`` rows instead of the single product row. Checkouts
+decrement a random stripe and fall back to the others, and
+``fold_inventory_stripes`` periodically mirrors the total into
+``Product.inventory`` and rebalances the stripes. Holds are not taken on hot
+SKUs: during a drop the first buyer to check out wins.
+"""
+import random
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import InventoryHold, InventoryStripe, Product
+
+
+class HoldError(Exception):
+    """Raised when a hold cannot be placed."""
+
+    def __init__(self, message, code='invalid', details=None):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+        self.details = details or {}
+
+
+def owner_keys_for_request(request):
+    """
+    Hold owner keys for a request: the user (when authenticated) first, then the
+    client session id (``X-Session-ID`` header or ``session_id`` query param), so
+    holds placed before logging in are still consumed at checkout.
+    """
+    keys = []
+    if request.user.is_authenticated:
+        keys.append(f'u:{request.user.id}')
+    session_id = request.headers.get('X-Session-ID') or request.query_params.get('session_id')
+    if session_id:
+        keys.append(f's:{session_id[:64]}')
+    return keys
+
+
+def place_hold(owner_key, product_id, quantity):
+    """
+    Hold ``quantity`` units of a product for ``owner_key``, replacing any
+    existing hold the owner has on it and restarting its TTL.
+
+    Returns:
+        The active InventoryHold
+
+    Raises:
+        HoldError: Unknown product, hot SKU, or not enough unreserved stock
+    """
+    if Product.objects.filter(id=product_id, stock_stripes__gt=0).exists():
+        raise HoldError('Holds are not available for this product', 'hot_sku')
+
+    expires_at = timezone.now() + timedelta(seconds=settings.INVENTORY_HOLD_TTL)
+    with transaction.atomic():
+        hold = InventoryHold.objects.select_for_update().filter(
+            owner_key=owner_key,
+            product_id=product_id,
+            status='active',
+        ).first()
+        delta = quantity - (hold.quantity if hold else 0)
+
+        if delta > 0:
+            reserved = Product.objects.filter(
+                id=product_id,
+                inventory__gte=F('reserved') + delta,
+            ).update(reserved=F('reserved') + delta)
+            if not reserved:
+                if not Product.objects.filter(id=product_id).exists():
+                    raise HoldError('Product not found', 'not_found')
+                raise HoldError('Not enough stock available', 'out_of_stock', {'product_id': product_id})
+        elif delta < 0:
+            Product.objects.filter(id=product_id).update(reserved=F('reserved') + delta)
+
+        if hold is None:
+            hold = InventoryHold.objects.create(
+                owner_key=owner_key,
+                product_id=product_id,
+                quantity=quantity,
+                expires_at=expires_at,
+            )
+        else:
+            hold.quantity = quantity
+            hold.expires_at = expires_at
+            hold.save(update_fields=['quantity', 'expires_at', 'updated_at'])
+    return hold
+
+
+def release_hold(owner_key, product_id):
+    """Release the owner's active hold on a product. Returns True if one existed."""
+    with transaction.atomic():
+        hold = InventoryHold.objects.select_for_update().filter(
+            owner_key=owner_key,
+            product_id=product_id,
+            status='active',
+        ).first()
+        if hold is None:
+            return False
+        Product.objects.filter(id=product_id).update(reserved=F('reserved') - hold.quantity)
+        hold.status = 'released'
+        hold.save(update_fields=['status', 'updated_at'])
+    return True
+
+
+def active_holds(owner_keys, product_ids):
+    """
+    Lock and return ``{product_id: [hold, ...]}`` for the owners' active holds.
+    Must be called inside a transaction.
+    """
+    holds = defaultdict(list)
+    queryset = InventoryHold.objects.select_for_update().filter(
+        owner_key__in=owner_keys,
+        product_id__in=product_ids,
+        status='active',
+    ).order_by('id')
+    for hold in queryset:
+        holds[hold.product_id].append(hold)
+    return holds
+
+
+def release_expired(batch_size=500):
+    """
+    Release one batch of expired holds.
+
+    Holds are locked with SKIP LOCKED where supported, so several sweepers can
+    run side by side and never wait on a checkout converting the same hold.
+
+    Returns:
+        Number of holds released
+    """
+    with transaction.atomic():
+        expired = list(
+            InventoryHold.objects.select_for_update(skip_locked=True).filter(
+                status='active',
+                expires_at__lte=timezone.now(),
+            ).order_by('expires_at').values_list('id', 'product_id', 'quantity')[:batch_size]
+        )
+        if not expired:
+            return 0
+
+        per_product = defaultdict(int)
+        for _, product_id, quantity in expired:
+            per_product[product_id] += quantity
+        for product_id in sorted(per_product):
+            Product.objects.filter(id=product_id).update(reserved=F('reserved') - per_product[product_id])
+
+        InventoryHold.objects.filter(id__in=[hold_id for hold_id, _, _ in expired]).update(
+            status='released',
+            updated_at=timezone.now(),
+        )
+    return len(expired)
+
+
+def _split(total, stripes):
+    """Split ``total`` into ``stripes`` near-equal parts."""
+    base, remainder = divmod(max(total, 0), stripes)
+    return [base + (1 if index < remainder else 0) for index in range(stripes)]
+
+
+def enable_hot_mode(product_id, stripes):
+    """
+    Move a product's unreserved stock into ``stripes`` sub-counters.
+    Active holds on the product are released first.
+    """
+    if stripes < 1:
+        raise ValueError('stripes must be at least 1')
+    with transaction.atomic():
+        product = Product.objects.select_for_update().get(id=product_id)
+        total = product.inventory if not product.stock_stripes else _stripe_total(product_id)
+        InventoryHold.objects.filter(product_id=product_id, status='active').update(
+            status='released',
+            updated_at=timezone.now(),
+        )
+        InventoryStripe.objects.filter(product_id=product_id).delete()
+        InventoryStripe.objects.bulk_create([
+            InventoryStripe(product_id=product_id, index=index, quantity=quantity)
+            for index, quantity in enumerate(_split(total, stripes))
+        ])
+        Product.objects.filter(id=product_id).update(
+            stock_stripes=stripes,
+            inventory=total,
+            reserved=0,
+            updated_at=timezone.now(),
+        )
+
+
+def disable_hot_mode(product_id):
+    """Fold a hot SKU's stripes back into ``Product.inventory`` and drop them."""
+    with transaction.atomic():
+        Product.objects.select_for_update().get(id=product_id)
+        total = _stripe_total(product_id)
+        InventoryStripe.objects.filter(product_id=product_id).delete()
+        Product.objects.filter(id=product_id).update(
+            stock_stripes=0,
+            inventory=total,
+            updated_at=timezone.now(),
+        )
+
+
+def restock_striped(product_id, delta):
+    """Add (or remove, if negative) ``delta`` units to a hot SKU's stripes."""
+    with transaction.atomic():
+        stripe = InventoryStripe.objects.select_for_update().filter(
+            product_id=product_id
+        ).order_by('-quantity').first()
+        if stripe is None:
+            return
+        stripe.quantity = max(stripe.quantity + delta, 0)
+        stripe.save(update_fields=['quantity'])
+    fold_stripes([product_id])
+
+
+def _stripe_total(product_id):
+    return InventoryStripe.objects.filter(product_id=product_id).aggregate(
+        total=Sum('quantity')
+    )['total'] or 0
+
+
+def decrement_striped(product_id, stripes, quantity):
+    """
+    Take ``quantity`` units from a hot SKU's stripes. Must run inside the
+    checkout transaction.
+
+    Tries a random stripe first, then the remaining ones; if no single stripe
+    can cover the quantity, locks all stripes and takes it across several.
+
+    Returns:
+        True if the stock was taken, False if the product is sold out
+    """
+    start = random.randrange(stripes)
+    for offset in range(stripes):
+        taken = InventoryStripe.objects.filter(
+            product_id=product_id,
+            index=(start + offset) % stripes,
+            quantity__gte=quantity,
+        ).update(quantity=F('quantity') - quantity)
+        if taken:
+            return True
+
+    # Slow path: spread the decrement over several stripes
+    rows = list(InventoryStripe.objects.select_for_update().filter(
+        product_id=product_id
+    ).order_by('index'))
+    if sum(row.quantity for row in rows) < quantity:
+        return False
+    remaining = quantity
+    for row in rows:
+        used = min(row.quantity, remaining)
+        row.quantity -= used
+        remaining -= used
+    InventoryStripe.objects.bulk_update(rows, ['quantity'])
+    return True
+
+
+def fold_stripes(product_ids=None):
+    """
+    Mirror each hot SKU's stripe total into ``Product.inventory`` and rebalance
+    its stripes evenly, broadcasting a stock update when the total changed.
+
+    Returns:
+        Number of products whose mirrored inventory changed
+    """
+    from .signals import broadcast_stock_update
+
+    hot_products = Product.objects.filter(stock_stripes__gt=0)
+    if product_ids is not None:
+        hot_products = hot_products.filter(id__in=product_ids)
+
+    changed = 0
+    for product in hot_products.only('id', 'name', 'category_id', 'inventory', 'stock_stripes'):
+        with transaction.atomic():
+            rows = list(InventoryStripe.objects.select_for_update().filter(
+                product_id=product.id
+            ).order_by('index'))
+            total = sum(row.quantity for row in rows)
+            for row, quantity in zip(rows, _split(total, len(rows))):
+                row.quantity = quantity
+            InventoryStripe.objects.bulk_update(rows, ['quantity'])
+            updated = Product.objects.filter(id=product.id).exclude(inventory=total).update(
+                inventory=total,
+                updated_at=timezone.now(),
+            )
+            if updated:
+                changed += 1
+                old_stock = product.inventory
+                broadcast_stock_update(product, old_stock, total)
+    return changed
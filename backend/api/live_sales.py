@@ -0,0 +1,205 @@
+"""
+Live sales KPIs for the admin dashboard.
+
+The ``stream_sales_dashboard`` command runs one ticker process that owns the
+counters below. It feeds them from ``order.placed`` outbox events (through
+the dedicated ``sales_dashboard`` handler) and, once per tick, sends one
+pre-encoded message to the ``sales_dashboard`` channel group. Every admin's
+``DashboardConsumer`` forwards the message as is. So the database is never
+queried per tick, and a tick costs the same however many admins are
+watching.
+
+KPIs:
+- orders and revenue over the last minute, hour and day
+- top products by units sold in the last hour
+- low-stock count, from an available-stock map that order events decrement
+  and that is re-read from the database every
+  ``SALES_DASHBOARD_STOCK_SYNC_SECONDS`` to pick up restocks
+
+Windows are kept in buckets (1 s, 1 min and 15 min), so they slide in steps of
+one bucket. On start the counters are seeded from the last day of orders.
+Pending events from before the seed are skipped, because the seed already
+counts them. The numbers are live indicators; SalesAnalytics holds the books.
+"""
+import json
+from collections import Counter, deque
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from . import order_events, outbox
+from .models import Order, OrderItem, OutboxEvent, Product
+
+GROUP = 'sales_dashboard'
+HANDLER = 'sales_dashboard'
+ZERO = Decimal('0')
+
+
+class RollingWindow:
+    """Totals over the last ``window`` seconds, kept in ``bucket``-second buckets."""
+
+    __slots__ = ('bucket', 'size', 'buckets', 'orders', 'revenue', 'products', 'track_products')
+
+    def __init__(self, window, bucket, track_products=False):
+        self.bucket = bucket
+        self.size = window // bucket
+        self.buckets = deque()  # [index, orders, revenue, Counter]
+        self.orders = 0
+        self.revenue = ZERO
+        self.products = Counter()
+        self.track_products = track_products
+
+    def expire(self, now):
+        oldest = int(now // self.bucket) - self.size
+        while self.buckets and self.buckets[0][0] <= oldest:
+            _, orders, revenue, products = self.buckets.popleft()
+            self.orders -= orders
+            self.revenue -= revenue
+            if products:
+                self.products.subtract(products)
+                for product_id in products:
+                    if self.products[product_id] <= 0:
+                        del self.products[product_id]
+
+    def add(self, moment, revenue, items, now):
+        """Count one order placed at ``moment`` (epoch seconds, as is ``now``)."""
+        index = int(moment // self.bucket)
+        if index <= int(now // self.bucket) - self.size:
+            return
+        target = None
+        for bucket in reversed(self.buckets):
+            if bucket[0] == index:
+                target = bucket
+                break
+            if bucket[0] < index:
+                break
+        if target is None:
+            target = [index, 0, ZERO, Counter() if self.track_products else None]
+            self.buckets.append(target)
+            if len(self.buckets) > 1 and self.buckets[-2][0] > index:
+                # Late event: keep buckets ordered by index
+                self.buckets = deque(sorted(self.buckets, key=lambda bucket: bucket[0]))
+        target[1] += 1
+        target[2] += revenue
+        self.orders += 1
+        self.revenue += revenue
+        if self.track_products:
+            for product_id, quantity in items:
+                target[3][product_id] += quantity
+                self.products[product_id] += quantity
+
+
+class LiveSales:
+    """Rolling counters and stock map for one ticker process."""
+
+    def __init__(self):
+        self.windows = {
+            'minute': RollingWindow(60, 1),
+            'hour': RollingWindow(3600, 60, track_products=True),
+            'day': RollingWindow(86400, 900),
+        }
+        self.stock = {}
+        self.names = {}
+        self.low_stock = set()
+
+    def _set_stock(self, product_id, available):
+        self.stock[product_id] = available
+        if 0 < available < settings.LOW_STOCK_THRESHOLD:
+            self.low_stock.add(product_id)
+        else:
+            self.low_stock.discard(product_id)
+
+    def record(self, moment, revenue, items):
+        """Count an order: ``moment`` in epoch seconds, ``items`` as ``(product_id, quantity)``."""
+        now = timezone.now().timestamp()
+        for window in self.windows.values():
+            window.expire(now)
+            window.add(moment, revenue, items, now)
+        for product_id, quantity in items:
+            if product_id in self.stock:
+                self._set_stock(product_id, self.stock[product_id] - quantity)
+
+    def sync_stock(self):
+        """Re-read available stock and names for every product (one query)."""
+        self.low_stock = set()
+        self.stock = {}
+        rows = Product.objects.annotate(available=F('inventory') - F('reserved')).values_list(
+            'id', 'name', 'available'
+        )
+        for product_id, name, available in rows.iterator(chunk_size=2000):
+            self.names[product_id] = name
+            self._set_stock(product_id, available)
+
+    def seed(self, now=None):
+        """Load the last day of orders (and the last hour of items) into the windows."""
+        now = now or timezone.now()
+        for window in self.windows.values():
+            window.buckets.clear()
+            window.orders, window.revenue = 0, ZERO
+            window.products.clear()
+
+        items = {}
+        hour_items = OrderItem.objects.filter(
+            order__created_at__gte=now - timedelta(hours=1)
+        ).exclude(order__status='cancelled').values_list('order_id', 'product_id', 'quantity')
+        for order_id, product_id, quantity in hour_items.iterator(chunk_size=2000):
+            items.setdefault(order_id, []).append((product_id, quantity))
+
+        orders = Order.objects.filter(created_at__gte=now - timedelta(days=1)).exclude(
+            status='cancelled'
+        ).order_by('created_at').values_list('id', 'created_at', 'final_price')
+        for order_id, created_at, final_price in orders.iterator(chunk_size=2000):
+            for window in self.windows.values():
+                window.add(created_at.timestamp(), final_price, items.get(order_id, ()), now.timestamp())
+
+    def snapshot(self, now=None):
+        now = now or timezone.now()
+        for window in self.windows.values():
+            window.expire(now.timestamp())
+        top = self.windows['hour'].products.most_common(settings.SALES_DASHBOARD_TOP_PRODUCTS)
+        return {
+            'at': now.isoformat(),
+            'windows': {
+                name: {'orders': window.orders, 'revenue': str(window.revenue)}
+                for name, window in self.windows.items()
+            },
+            'top_products': [
+                {'product_id': product_id, 'name': self.names.get(product_id, ''), 'quantity': quantity}
+                for product_id, quantity in top
+            ],
+            'low_stock': len(self.low_stock),
+        }
+
+
+state = LiveSales()
+
+
+@outbox.register(HANDLER, order_events.ORDER_PLACED, dedicated=True)
+def record_order(event):
+    """Count a placed order in this process's live counters."""
+    payload = event.payload
+    state.record(
+        datetime.fromisoformat(payload['created_at']).timestamp(),
+        Decimal(payload['final_price']),
+        [tuple(item) for item in payload['items']],
+    )
+
+
+def skip_seeded(before):
+    """Mark pending dashboard events created before ``before`` as done (the seed counted them)."""
+    return OutboxEvent.objects.filter(handler=HANDLER, status='pending', created_at__lt=before).update(
+        status='done', processed_at=timezone.now()
+    )
+
+
+def broadcast(channel_layer=None):
+    """Send the current snapshot to every connected admin: one group message."""
+    channel_layer = channel_layer or get_channel_layer()
+    text = json.dumps({'type': 'sales_tick', 'data': state.snapshot()}, separators=(',', ':'))
+    async_to_sync(channel_layer.group_send)(GROUP, {'type': 'sales_tick', 'text': text})
+    return text
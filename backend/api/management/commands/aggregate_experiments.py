@@ -0,0 +1,54 @@
+"""
+Management command to aggregate experiment exposures and conversions per variant.
+
+Usage: python manage.py aggregate_experiments [--experiment recommendation_ranking]
+
+Run periodically (e.g. every 15 minutes from cron); results are stored in
+ExperimentResult and visible in the admin. Conversions only count for units
+that were exposed to the variant, so the conversion rate is at most 1.
+"""
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Exists, OuterRef, Q, Sum
+
+from api.models import ExperimentEvent, ExperimentResult
+
+
+class Command(BaseCommand):
+    help = 'Aggregate per-variant experiment metrics'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--experiment', help='Only aggregate this experiment key')
+
+    def handle(self, *args, **options):
+        events = ExperimentEvent.objects.all()
+        if options['experiment']:
+            events = events.filter(experiment_key=options['experiment'])
+
+        exposed = ExperimentEvent.objects.filter(
+            experiment_key=OuterRef('experiment_key'), variant=OuterRef('variant'),
+            unit_id=OuterRef('unit_id'), event_type='exposure',
+        )
+        events = events.filter(Q(event_type='exposure') | Q(Exists(exposed)))
+
+        rows = events.values('experiment_key', 'variant').annotate(
+            exposed=Count('unit_id', distinct=True, filter=Q(event_type='exposure')),
+            converted=Count('unit_id', distinct=True, filter=Q(event_type='conversion')),
+            revenue=Sum('value', filter=Q(event_type='conversion')),
+        ).order_by('experiment_key', 'variant')
+
+        for row in rows:
+            exposed = row['exposed']
+            ExperimentResult.objects.update_or_create(
+                experiment_key=row['experiment_key'],
+                variant=row['variant'],
+                defaults={
+                    'exposed_units': exposed,
+                    'converted_units': row['converted'],
+                    'conversion_rate': row['converted'] / exposed if exposed else 0,
+                    'revenue': row['revenue'] or 0,
+                }
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f"✓ {row['experiment_key']}/{row['variant']}: "
+                f"{row['converted']}/{exposed} converted"
+            ))
@@ -0,0 +1,31 @@
+"""
+Management command to move old delivered/cancelled orders to the archive.
+
+Usage: python manage.py archive_orders [--months 12] [--batch-size 500] [--max-batches 0]
+
+Each batch is copied to ArchivedOrder/ArchivedOrderItem and deleted from the
+live tables in one transaction. Run nightly from cron.
+"""
+from django.core.management.base import BaseCommand
+
+from api.archive import archive_batch, archive_cutoff
+
+
+class Command(BaseCommand):
+    help = 'Archive orders delivered or cancelled more than N months ago'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=None, help='Default: ORDER_ARCHIVE_AFTER_MONTHS')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--max-batches', type=int, default=0, help='Stop after this many batches (0 = all)')
+
+    def handle(self, *args, **options):
+        cutoff = archive_cutoff(options['months'])
+        total = batches = 0
+        while True:
+            archived = archive_batch(cutoff, options['batch_size'])
+            total += archived
+            batches += 1
+            if archived < options['batch_size'] or batches == options['max_batches']:
+                break
+        self.stdout.write(self.style.SUCCESS(f'✓ Archived {total} orders last updated before {cutoff:%Y-%m-%d}'))
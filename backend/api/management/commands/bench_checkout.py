@@ -0,0 +1,125 @@
+"""
+Management command to benchmark concurrent checkouts against a single product.
+
+Usage: python manage.py bench_checkout [--threads 100] [--orders 500] [--stock 300] [--stripes 0,4,16]
+
+Creates a throwaway category, product and users, fires checkouts from a thread
+pool, then verifies that nothing was oversold and reports throughput and
+latency. With --stripes, one round is run per stripe count (0 = plain
+product row, N = hot SKU mode with N stripes) to compare contention.
+Run it against PostgreSQL; SQLite serializes all writers, so striping
+cannot help there.
+"""
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from api.checkout import CheckoutError, checkout
+from api.inventory import enable_hot_mode, fold_stripes
+from api.models import Category, Order, Product
+
+
+class Command(BaseCommand):
+    help = 'Benchmark concurrent checkouts and verify there are no oversells'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=100)
+        parser.add_argument('--orders', type=int, default=500)
+        parser.add_argument('--stock', type=int, default=300)
+        parser.add_argument('--quantity', type=int, default=1)
+        parser.add_argument('--stripes', default='0', help='Comma-separated stripe counts to compare')
+        parser.add_argument('--keep', action='store_true', help='Keep benchmark data')
+
+    def setup_data(self, stock, threads):
+        tag = uuid.uuid4().hex[:8]
+        category = Category.objects.create(
+            name=f'bench-{tag}', slug=f'bench-{tag}', image_url='https://example.com/bench.jpg'
+        )
+        product = Product.objects.create(
+            name=f'bench-{tag}', price=10, inventory=stock,
+            image_url='https://example.com/bench.jpg', category=category
+        )
+        users = [User(username=f'bench-{tag}-{i}') for i in range(threads)]
+        User.objects.bulk_create(users)
+        users = list(User.objects.filter(username__startswith=f'bench-{tag}-'))
+        return category, product, users
+
+    def handle(self, *args, **options):
+        if options['threads'] < 1 or options['orders'] < 1:
+            raise CommandError('--threads and --orders must be positive')
+        try:
+            stripe_counts = [int(value) for value in options['stripes'].split(',')]
+        except ValueError:
+            raise CommandError('--stripes must be comma-separated integers')
+
+        for stripes in stripe_counts:
+            self.stdout.write(f'--- stripes={stripes} ---')
+            self.run_round(options, stripes)
+
+    def run_round(self, options, stripes):
+        threads = options['threads']
+        total_orders = options['orders']
+        quantity = options['quantity']
+
+        category, product, users = self.setup_data(options['stock'], threads)
+        if stripes:
+            enable_hot_mode(product.id, stripes)
+        outcomes = {'ok': 0, 'out_of_stock': 0, 'error': 0}
+        latencies = []
+
+        def place(index):
+            started = time.perf_counter()
+            try:
+                checkout(
+                    users[index % len(users)],
+                    [{'product_id': product.id, 'quantity': quantity}],
+                    shipping_address='Benchmark St 1',
+                    phone='000',
+                    payment_method='bench',
+                )
+                result = 'ok'
+            except CheckoutError:
+                result = 'out_of_stock'
+            except Exception:
+                result = 'error'
+            finally:
+                connections.close_all()
+            return result, time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            for result, latency in pool.map(place, range(total_orders)):
+                outcomes[result] += 1
+                latencies.append(latency)
+        elapsed = time.perf_counter() - started
+
+        if stripes:
+            fold_stripes([product.id])
+        product.refresh_from_db()
+        sold = Order.objects.filter(items__product=product).count() * quantity
+        oversold = sold > options['stock'] or product.inventory != options['stock'] - sold
+
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1000
+        p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000
+        self.stdout.write(
+            f"{total_orders} checkouts on {threads} threads in {elapsed:.2f}s "
+            f"({total_orders / elapsed:.0f}/s), p50 {p50:.1f}ms, p95 {p95:.1f}ms"
+        )
+        self.stdout.write(
+            f"ok={outcomes['ok']} out_of_stock={outcomes['out_of_stock']} "
+            f"errors={outcomes['error']} remaining_inventory={product.inventory}"
+        )
+
+        if not options['keep']:
+            Order.objects.filter(user__in=users).delete()
+            User.objects.filter(id__in=[u.id for u in users]).delete()
+            category.delete()
+
+        if oversold:
+            raise CommandError(f'Oversell detected: sold {sold}, started with {options["stock"]}')
+        self.stdout.write(self.style.SUCCESS('✓ No oversells'))
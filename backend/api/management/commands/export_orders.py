@@ -0,0 +1,60 @@
+"""
+Management command to export orders with their items for finance.
+
+Usage: python manage.py export_orders [--format csv|jsonl] [--output orders.csv]
+       [--from 2025-01-01] [--to 2025-01-31] [--status delivered,shipped]
+       [--include-archived] [--chunk-size 2000]
+
+Streams rows to the output file (stdout by default) in keyset chunks, so
+memory use does not grow with the export size, and reports rows per second.
+"""
+import time
+from functools import partial
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import exports
+
+
+class Command(BaseCommand):
+    help = 'Stream orders and order items as CSV or JSON lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(exports.ENCODERS), default='csv')
+        parser.add_argument('--output', default='-', help='File path, or - for stdout')
+        parser.add_argument('--from', dest='date_from', help='Created on or after (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='date_to', help='Created on or before (YYYY-MM-DD)')
+        parser.add_argument('--status', default='', help='Comma-separated statuses')
+        parser.add_argument('--include-archived', action='store_true')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        try:
+            date_from = exports.parse_bound(options['date_from'])
+            date_to = exports.parse_bound(options['date_to'], end=True)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        orders = exports.iter_orders(
+            date_from, date_to,
+            [value for value in options['status'].split(',') if value],
+            include_archived=options['include_archived'],
+            chunk_size=options['chunk_size'],
+        )
+        encode, _ = exports.ENCODERS[options['format']]
+
+        out = open(options['output'], 'w', newline='') if options['output'] != '-' else None
+        write = out.write if out else partial(self.stdout.write, ending='')
+        started = time.perf_counter()
+        rows = 0
+        try:
+            for line in encode(orders):
+                write(line)
+                rows += 1
+        finally:
+            if out:
+                out.close()
+
+        elapsed = time.perf_counter() - started
+        rate = rows / elapsed if elapsed else 0
+        self.stderr.write(self.style.SUCCESS(f'✓ Exported {rows} lines in {elapsed:.2f}s ({rate:.0f} lines/s)'))
@@ -0,0 +1,32 @@
+"""
+Management command to fold hot SKU stock stripes back into Product.inventory.
+
+Usage: python manage.py fold_inventory_stripes [--loop] [--interval 5]
+
+Mirrors each hot SKU's stripe total into Product.inventory (which drives
+is_in_stock and stock broadcasts) and rebalances its stripes evenly.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.inventory import fold_stripes
+
+
+class Command(BaseCommand):
+    help = 'Fold striped hot SKU counters into Product.inventory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep folding until interrupted')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between folds')
+
+    def handle(self, *args, **options):
+        while True:
+            changed = fold_stripes()
+            if changed:
+                self.stdout.write(self.style.SUCCESS(f'✓ Updated inventory for {changed} hot SKUs'))
+            if not options['loop']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,54 @@
+"""
+Management command to create upcoming monthly partitions and prune old clickstream data.
+
+Usage: python manage.py maintain_partitions [--months-ahead 3] [--clickstream-retention-days 180]
+
+Run daily from cron. On databases other than PostgreSQL, partition creation
+is skipped and retention falls back to chunked deletes.
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from api.models import ClickEvent
+from api.partitioning import PARTITIONED_TABLES, drop_partitions_before, ensure_monthly_partitions
+
+
+class Command(BaseCommand):
+    help = 'Create upcoming monthly partitions and prune expired clickstream events'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=3)
+        parser.add_argument(
+            '--clickstream-retention-days', type=int, default=None,
+            help='Drop clickstream events older than this many days'
+        )
+
+    def handle(self, *args, **options):
+        for table in PARTITIONED_TABLES:
+            created = ensure_monthly_partitions(table, months_ahead=options['months_ahead'])
+            for name in created:
+                self.stdout.write(self.style.SUCCESS(f'✓ Created partition {name}'))
+
+        retention_days = options['clickstream_retention_days']
+        if retention_days is None:
+            return
+
+        cutoff = timezone.now() - timedelta(days=retention_days)
+        if connection.vendor == 'postgresql':
+            dropped = drop_partitions_before(ClickEvent._meta.db_table, cutoff.date())
+            for name in dropped:
+                self.stdout.write(self.style.SUCCESS(f'✓ Dropped partition {name}'))
+            return
+
+        deleted = 0
+        while True:
+            ids = list(
+                ClickEvent.objects.filter(created_at__lt=cutoff).values_list('id', flat=True)[:10000]
+            )
+            if not ids:
+                break
+            deleted += ClickEvent.objects.filter(id__in=ids).delete()[0]
+        self.stdout.write(self.style.SUCCESS(f'✓ Deleted {deleted} expired clickstream events'))
@@ -0,0 +1,49 @@
+"""
+Management command to deliver transactional outbox events.
+
+Usage: python manage.py process_outbox [--batch-size 100] [--handlers order_email] [--loop] [--interval 1]
+
+Run several workers to scale out; give a handler its own pool with --handlers.
+Delivered events older than OUTBOX_RETENTION_DAYS are purged once per run
+(or once an hour with --loop).
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api import outbox
+
+
+class Command(BaseCommand):
+    help = 'Deliver pending outbox events to their handlers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--handlers', default='', help='Comma-separated handler names (default: all)')
+        parser.add_argument('--loop', action='store_true', help='Keep delivering until interrupted')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to wait when idle')
+
+    def drain(self, batch_size, handlers):
+        delivered = failed = 0
+        while True:
+            batch_delivered, batch_failed = outbox.process_batch(batch_size, handlers)
+            delivered += batch_delivered
+            failed += batch_failed
+            if batch_delivered + batch_failed == 0:
+                return delivered, failed
+
+    def handle(self, *args, **options):
+        handlers = [name.strip() for name in options['handlers'].split(',') if name.strip()]
+        purged_at = 0.0
+        while True:
+            delivered, failed = self.drain(options['batch_size'], handlers)
+            if delivered or failed:
+                self.stdout.write(self.style.SUCCESS(f'✓ Delivered {delivered} events ({failed} failed)'))
+            if time.monotonic() - purged_at > 3600:
+                outbox.purge_processed()
+                purged_at = time.monotonic()
+            if not options['loop']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,40 @@
+"""
+Management command to release expired inventory holds.
+
+Usage: python manage.py release_expired_holds [--batch-size 500] [--loop] [--interval 5]
+
+With --loop it runs as a long-lived sweeper; several sweepers can run at once.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.inventory import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Release expired cart inventory holds in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--loop', action='store_true', help='Keep sweeping until interrupted')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between sweeps when idle')
+
+    def sweep(self, batch_size):
+        total = 0
+        while True:
+            released = release_expired(batch_size)
+            total += released
+            if released < batch_size:
+                return total
+
+    def handle(self, *args, **options):
+        while True:
+            released = self.sweep(options['batch_size'])
+            if released:
+                self.stdout.write(self.style.SUCCESS(f'✓ Released {released} expired holds'))
+            if not options['loop']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,63 @@
+"""
+Management command to roll orders up into daily SalesAnalytics rows and the
+hourly SalesCube.
+
+Usage: python manage.py rollup_sales [--loop] [--interval 300]
+       python manage.py rollup_sales --backfill --from 2024-01 --to 2024-12 [--workers 4]
+
+Without --backfill, recomputes only the days and hours of orders changed since
+the last run (run every few minutes from cron, or with --loop). --backfill recomputes
+whole months, --workers months at a time.
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.utils import timezone
+
+from api import rollups
+
+
+def parse_month(value):
+    try:
+        year, month = (int(part) for part in value.split('-'))
+    except ValueError:
+        raise CommandError(f'Invalid month {value!r}, expected YYYY-MM')
+    if not 1 <= month <= 12:
+        raise CommandError(f'Invalid month {value!r}, expected YYYY-MM')
+    return year, month
+
+
+class Command(BaseCommand):
+    help = 'Roll orders up into daily sales analytics and the sales cube'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backfill', action='store_true', help='Recompute whole months')
+        parser.add_argument('--from', dest='first', help='First month to backfill (YYYY-MM)')
+        parser.add_argument('--to', dest='last', help='Last month to backfill (YYYY-MM, default: this month)')
+        parser.add_argument('--workers', type=int, default=4, help='Months recomputed in parallel')
+        parser.add_argument('--loop', action='store_true', help='Keep rolling up until interrupted')
+        parser.add_argument('--interval', type=float, default=300.0, help='Seconds between runs')
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            if not options['first']:
+                raise CommandError('--backfill needs --from')
+            now = timezone.localdate()
+            last = parse_month(options['last']) if options['last'] else (now.year, now.month)
+            months = rollups.months_between(parse_month(options['first']), last)
+            started = time.perf_counter()
+            days = rollups.backfill(months, options['workers'])
+            self.stdout.write(self.style.SUCCESS(
+                f'✓ Backfilled {days} days in {len(months)} months ({time.perf_counter() - started:.1f}s)'
+            ))
+            return
+
+        while True:
+            days, hours = rollups.rollup_incremental()
+            if days or hours:
+                self.stdout.write(self.style.SUCCESS(f'✓ Rolled up {len(days)} days and {len(hours)} hours'))
+            if not options['loop']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,60 @@
+"""
+Management command to stream live sales KPIs to the admin dashboard.
+
+Usage: python manage.py stream_sales_dashboard [--tick 1]
+
+Run exactly one instance. It seeds rolling counters from the last day of
+orders, then keeps them current from order.placed outbox events and sends
+one snapshot per tick to the sales_dashboard channel group (see
+api/live_sales.py).
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from api import live_sales, outbox
+
+
+class Command(BaseCommand):
+    help = 'Stream live sales KPIs to connected admin dashboards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tick', type=float, default=None, help='Seconds between snapshots')
+        parser.add_argument('--ticks', type=int, default=0, help='Stop after this many ticks (0 = run forever)')
+
+    def handle(self, *args, **options):
+        tick = options['tick'] or settings.SALES_DASHBOARD_TICK_SECONDS
+        state = live_sales.state
+
+        seeded_at = timezone.now()
+        state.sync_stock()
+        state.seed(seeded_at)
+        skipped = live_sales.skip_seeded(seeded_at)
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Seeded {state.windows['day'].orders} orders from the last day ({skipped} queued events skipped)"
+        ))
+
+        ticks = 0
+        next_tick = time.monotonic()
+        next_sync = next_tick + settings.SALES_DASHBOARD_STOCK_SYNC_SECONDS
+        while True:
+            while sum(outbox.process_batch(handlers=[live_sales.HANDLER])):
+                pass
+
+            now = time.monotonic()
+            if now >= next_sync:
+                state.sync_stock()
+                next_sync = now + settings.SALES_DASHBOARD_STOCK_SYNC_SECONDS
+            if now >= next_tick:
+                live_sales.broadcast()
+                ticks += 1
+                next_tick += tick
+                if next_tick < now:
+                    next_tick = now + tick
+                if ticks == options['ticks']:
+                    break
+            close_old_connections()
+            time.sleep(max(0.0, min(next_tick - time.monotonic(), 0.2)))
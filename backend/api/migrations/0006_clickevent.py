@@ -0,0 +1,36 @@
+# Generated by Django 4.2.26 on 2026-10-19 00:43
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def partition_clickevent(apps, schema_editor):
+    from api.partitioning import partition_table_by_range
+    partition_table_by_range(schema_editor, apps.get_model('api', 'ClickEvent'), 'created_at')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_chatsession_chatmessage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClickEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(choices=[('view', 'View'), ('add_to_cart', 'Add to Cart'), ('search', 'Search')], max_length=20)),
+                ('product_id', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('user_id', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('session_id', models.CharField(blank=True, max_length=64)),
+                ('query', models.CharField(blank=True, max_length=200)),
+                ('occurred_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at'], name='api_clickev_created_8a6e97_idx'), models.Index(fields=['product_id', 'created_at'], name='api_clickev_product_eddee6_idx'), models.Index(fields=['session_id', 'created_at'], name='api_clickev_session_6b7de2_idx')],
+            },
+        ),
+        migrations.RunPython(partition_clickevent, migrations.RunPython.noop),
+    ]
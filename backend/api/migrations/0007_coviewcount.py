@@ -0,0 +1,26 @@
+# Generated by Django 4.2.26 on 2026-10-19 00:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_clickevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoViewCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_id', models.PositiveBigIntegerField()),
+                ('other_product_id', models.PositiveBigIntegerField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('product_id', 'other_product_id')},
+            },
+        ),
+    ]
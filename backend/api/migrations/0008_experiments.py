@@ -0,0 +1,62 @@
+# Generated by Django 4.2.26 on 2026-10-19 00:46
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_coviewcount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Experiment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.SlugField(max_length=100, unique=True)),
+                ('description', models.TextField(blank=True)),
+                ('variants', models.JSONField(default=dict, help_text='Variant name -> traffic weight, e.g. {"control": 50, "rating_first": 50}')),
+                ('salt', models.CharField(blank=True, help_text='Change to reshuffle bucket assignment', max_length=32)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['key'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ExperimentResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('experiment_key', models.CharField(max_length=100)),
+                ('variant', models.CharField(max_length=50)),
+                ('exposed_units', models.IntegerField(default=0)),
+                ('converted_units', models.IntegerField(default=0)),
+                ('conversion_rate', models.FloatField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['experiment_key', 'variant'],
+                'unique_together': {('experiment_key', 'variant')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ExperimentEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('experiment_key', models.CharField(max_length=100)),
+                ('variant', models.CharField(max_length=50)),
+                ('event_type', models.CharField(choices=[('exposure', 'Exposure'), ('conversion', 'Conversion')], max_length=20)),
+                ('unit_id', models.CharField(max_length=80)),
+                ('value', models.DecimalField(blank=True, decimal_places=2, max_digits=15, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['experiment_key', 'created_at'], name='api_experim_experim_5707b2_idx')],
+            },
+        ),
+    ]
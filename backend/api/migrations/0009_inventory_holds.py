@@ -0,0 +1,36 @@
+# Generated by Django 4.2.26 on 2026-10-19 00:49
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_experiments'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='reserved',
+            field=models.IntegerField(default=0, validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+        migrations.CreateModel(
+            name='InventoryHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner_key', models.CharField(max_length=80)),
+                ('quantity', models.IntegerField(validators=[django.core.validators.MinValueValidator(1)])),
+                ('status', models.CharField(choices=[('active', 'Active'), ('released', 'Released'), ('converted', 'Converted')], default='active', max_length=20)),
+                ('expires_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='api.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'expires_at'], name='api_invento_status_ca2469_idx'), models.Index(fields=['owner_key', 'status'], name='api_invento_owner_k_1902bf_idx')],
+            },
+        ),
+    ]
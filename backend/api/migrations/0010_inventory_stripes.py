@@ -0,0 +1,32 @@
+# Generated by Django 4.2.26 on 2026-10-19 00:51
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_inventory_holds'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='stock_stripes',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Hot SKU mode: split stock across this many counters (0 = off)'),
+        ),
+        migrations.CreateModel(
+            name='InventoryStripe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveSmallIntegerField()),
+                ('quantity', models.IntegerField(default=0, validators=[django.core.validators.MinValueValidator(0)])),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stripes', to='api.product')),
+            ],
+            options={
+                'unique_together': {('product', 'index')},
+            },
+        ),
+    ]
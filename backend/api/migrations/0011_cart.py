@@ -0,0 +1,23 @@
+# Generated by Django 4.2.26 on 2026-10-19 00:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_inventory_stripes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Cart',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner_key', models.CharField(max_length=80, unique=True)),
+                ('lines', models.JSONField(blank=True, default=dict)),
+                ('voucher_code', models.CharField(blank=True, default='', max_length=50)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
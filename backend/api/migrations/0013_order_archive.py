@@ -0,0 +1,75 @@
+# Generated by Django 4.2.26 on 2026-10-19 01:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def partition_archive(apps, schema_editor):
+    from api.partitioning import partition_table_by_range
+    partition_table_by_range(schema_editor, apps.get_model('api', 'ArchivedOrder'), 'created_at')
+    partition_table_by_range(schema_editor, apps.get_model('api', 'ArchivedOrderItem'), 'order_created_at')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0012_outboxevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('order_id', models.CharField(max_length=50)),
+                ('total_price', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('discount_amount', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('final_price', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('voucher_code', models.CharField(blank=True, max_length=50, null=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('shipped', 'Shipped'), ('delivered', 'Delivered'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('shipping_address', models.TextField()),
+                ('phone', models.CharField(max_length=20)),
+                ('payment_method', models.CharField(max_length=50)),
+                ('payment_status', models.CharField(max_length=20)),
+                ('notes', models.TextField(blank=True)),
+                ('item_count', models.IntegerField(default=0)),
+                ('tracking', models.JSONField(blank=True, null=True)),
+                ('refund', models.JSONField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='archived_orders', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrderItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_created_at', models.DateTimeField()),
+                ('product_id', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('product_name', models.CharField(blank=True, max_length=200)),
+                ('quantity', models.IntegerField()),
+                ('price_at_purchase', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('total', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('order', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='items', to='api.archivedorder')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['order'], name='api_archive_order_i_cf70f9_idx')],
+            },
+        ),
+        migrations.RunPython(partition_archive, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['order_id'], name='api_archive_order_i_bac810_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['user', '-created_at'], name='api_archive_user_id_477566_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.26 on 2026-10-19 01:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0013_order_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voucher',
+            name='max_uses_per_user',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='VoucherRedemption',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_id', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('discount_amount', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='voucher_redemptions', to=settings.AUTH_USER_MODEL)),
+                ('voucher', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='redemptions', to='api.voucher')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['voucher', 'user'], name='api_voucher_voucher_42231a_idx')],
+            },
+        ),
+    ]
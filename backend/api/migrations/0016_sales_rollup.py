@@ -0,0 +1,36 @@
+# Generated by Django 4.2.26 on 2026-10-19 01:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_voucher_campaign'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('position', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='salesanalytics',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AlterField(
+            model_name='salesanalytics',
+            name='date',
+            field=models.DateField(unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['updated_at'], name='api_order_updated_cdc357_idx'),
+        ),
+    ]
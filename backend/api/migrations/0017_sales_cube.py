@@ -0,0 +1,30 @@
+# Generated by Django 4.2.26 on 2026-10-19 01:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_sales_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesCube',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('status', models.CharField(max_length=20)),
+                ('order_count', models.IntegerField(default=0)),
+                ('items_sold', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('category', models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='api.category')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='salescube',
+            constraint=models.UniqueConstraint(fields=('hour', 'category', 'status'), name='unique_sales_cube_cell'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 4.2.26 on 2026-10-19 01:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_sales_cube'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerCohort',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cohort_month', models.DateField()),
+                ('months_since', models.IntegerField()),
+                ('cohort_size', models.IntegerField(default=0)),
+                ('active_customers', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('computed_at', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ['cohort_month', 'months_since'],
+            },
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='cohort_month',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='first_order_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='last_order_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='lifetime_value',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='order_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='stats_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='customercohort',
+            constraint=models.UniqueConstraint(fields=('cohort_month', 'months_since'), name='unique_customer_cohort_cell'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.26 on 2026-10-19 01:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_customer_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(choices=[('customers', 'Customers'), ('visitors', 'Visitors')], max_length=20)),
+                ('day', models.DateField()),
+                ('category_id', models.PositiveBigIntegerField(default=0)),
+                ('registers', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dailysketch',
+            constraint=models.UniqueConstraint(fields=('metric', 'day', 'category_id'), name='unique_daily_sketch'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.26 on 2026-10-19 01:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_daily_sketch'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='experimentevent',
+            index=models.Index(fields=['experiment_key', 'unit_id'], name='api_experim_experim_561b5e_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.26 on 2026-10-19 01:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_experiment_event_unit_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='outboxevent',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+    ]
@@ -3,8 +3,10 @@ Models for ClassyCouture API.
 """
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
+from decimal import Decimal
 import uuid
 
 
@@ -76,6 +78,11 @@ class Product(models.Model):
     featured = models.BooleanField(default=False, db_index=True)
     new_arrival = models.BooleanField(default=False, db_index=True)  # Mark products as new arrivals
     inventory = models.IntegerField(default=0, validators=[MinValueValidator(0)])  # Stock quantity
+    reserved = models.IntegerField(default=0, validators=[MinValueValidator(0)])  # Units held by active cart holds
+    stock_stripes = models.PositiveSmallIntegerField(
+        default=0,
+        help_text="Hot SKU mode: split stock across this many counters (0 = off)"
+    )
     sku = models.CharField(max_length=50, unique=True, null=True, blank=True)  # Stock Keeping Unit
     on_sale = models.BooleanField(default=False)
     discount_percent = models.IntegerField(default=0, validators=[MinValueValidator(0), MaxValueValidator(100)])
@@ -92,6 +99,19 @@ class Product(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so that saving a new price can be broadcast as a price change,
+        # and a change reaches the topics the product is leaving
+        instance._loaded_price = instance.__dict__.get('price')
+        instance._loaded_topic_state = instance.topic_state()
+        return instance
+
+    def topic_state(self):
+        """The loaded values of the fields that decide a product's broadcast topics (None if deferred)."""
+        return {field: self.__dict__.get(field) for field in ('category_id', 'new_arrival', 'featured', 'on_sale')}
+
     @property
     def rating(self):
         """Calculate average rating from reviews."""
@@ -109,14 +129,19 @@ class Product(models.Model):
     def discounted_price(self):
         """Calculate discounted price."""
         if self.on_sale and self.discount_percent > 0:
-            discount_amount = self.price * (self.discount_percent / 100)
+            discount_amount = self.price * Decimal(self.discount_percent) / 100
             return round(self.price - discount_amount, 2)
         return self.price
 
+    @property
+    def available_inventory(self):
+        """Stock that is neither sold nor held in someone's cart."""
+        return max(self.inventory - self.reserved, 0)
+
     @property
     def is_in_stock(self):
-        """Check if product is in stock."""
-        return self.inventory > 0
+        """Check if product has stock available to add to a cart."""
+        return self.available_inventory > 0
 
 
 class Review(models.Model):
@@ -170,6 +195,13 @@ class UserProfile(models.Model):
     referral_points = models.IntegerField(default=0, validators=[MinValueValidator(0)])
     total_referrals = models.IntegerField(default=0, validators=[MinValueValidator(0)])
     is_admin = models.BooleanField(default=False)
+    # Purchasing stats, denormalized by the ``compute_customer_stats`` command
+    order_count = models.IntegerField(default=0)
+    lifetime_value = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    first_order_at = models.DateTimeField(null=True, blank=True)
+    last_order_at = models.DateTimeField(null=True, blank=True)
+    cohort_month = models.DateField(null=True, blank=True)
+    stats_updated_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -213,6 +245,7 @@ class Voucher(models.Model):
     discount_value = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
     min_purchase = models.DecimalField(max_digits=10, decimal_places=2, default=0, validators=[MinValueValidator(0)])
     max_uses = models.IntegerField(null=True, blank=True)
+    max_uses_per_user = models.PositiveIntegerField(null=True, blank=True)
     current_uses = models.IntegerField(default=0, validators=[MinValueValidator(0)])
     is_active = models.BooleanField(default=True)
     start_date = models.DateTimeField()
@@ -238,9 +271,65 @@ class Voucher(models.Model):
         return True
 
 
+class VoucherRedemption(models.Model):
+    """One use of a voucher by a user, written in the same transaction as the order."""
+    voucher = models.ForeignKey(Voucher, on_delete=models.CASCADE, related_name='redemptions')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='voucher_redemptions')
+    order_id = models.PositiveBigIntegerField(null=True, blank=True)  # Order pk; kept when orders are archived
+    discount_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['voucher', 'user']),
+        ]
+
+    def __str__(self):
+        return f"{self.voucher_id} used by {self.user_id}"
+
+
+class VoucherCampaign(models.Model):
+    """Rules shared by a batch of generated single-use codes (see ``VoucherCode``)."""
+    DISCOUNT_TYPES = Voucher.DISCOUNT_TYPES
+
+    name = models.CharField(max_length=100)
+    description = models.TextField(blank=True)
+    code_prefix = models.CharField(max_length=10, blank=True)
+    discount_type = models.CharField(max_length=20, choices=DISCOUNT_TYPES, default='percentage')
+    discount_value = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
+    min_purchase = models.DecimalField(max_digits=10, decimal_places=2, default=0, validators=[MinValueValidator(0)])
+    is_active = models.BooleanField(default=True)
+    start_date = models.DateTimeField()
+    end_date = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+
+class VoucherCode(models.Model):
+    """
+    One single-use code of a campaign.
+
+    Kept narrow (millions of rows per campaign): the rules live on the
+    campaign and a code is looked up by its unique index.
+    """
+    code = models.CharField(max_length=32, unique=True)
+    campaign = models.ForeignKey(VoucherCampaign, on_delete=models.CASCADE, related_name='codes')
+    redeemed_at = models.DateTimeField(null=True, blank=True)
+    redeemed_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, db_index=False, related_name='+'
+    )
+    order_id = models.PositiveBigIntegerField(null=True, blank=True)
+
+    def __str__(self):
+        return self.code
+
+
 class SalesAnalytics(models.Model):
-    """Track sales and analytics."""
-    date = models.DateField(auto_now_add=True)
+    """Daily sales totals, precomputed by the ``rollup_sales`` command."""
+    date = models.DateField(unique=True)
     total_orders = models.IntegerField(default=0)
     total_revenue = models.DecimalField(max_digits=15, decimal_places=2, default=0)
     total_items_sold = models.IntegerField(default=0)
@@ -248,6 +337,7 @@ class SalesAnalytics(models.Model):
     total_profit = models.DecimalField(max_digits=15, decimal_places=2, default=0)
     unique_customers = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-date']
@@ -257,10 +347,119 @@ class SalesAnalytics(models.Model):
         return f"Sales - {self.date}"
 
 
+class SalesCube(models.Model):
+    """
+    Pre-aggregated sales cell: one (hour, category, status) combination.
+
+    Maintained by ``rollup_sales``; any date range and roll-up (day, month,
+    category, status) is answered by summing cells.
+    """
+    hour = models.DateTimeField()
+    category = models.ForeignKey(
+        Category, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+        null=True, blank=True, related_name='+'
+    )
+    status = models.CharField(max_length=20)
+    order_count = models.IntegerField(default=0)  # Orders with items in this category
+    items_sold = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['hour', 'category', 'status'], name='unique_sales_cube_cell'),
+        ]
+
+    def __str__(self):
+        return f"{self.hour:%Y-%m-%d %H}:00 / {self.category_id} / {self.status}"
+
+
+class DailySketch(models.Model):
+    """
+    HyperLogLog registers for one day's distinct customers or visitors.
+
+    Merged across days to count distinct values over any range (see
+    ``api.sketches``). ``category_id`` 0 covers all categories.
+    """
+    METRICS = [
+        ('customers', 'Customers'),
+        ('visitors', 'Visitors'),
+    ]
+
+    metric = models.CharField(max_length=20, choices=METRICS)
+    day = models.DateField()
+    category_id = models.PositiveBigIntegerField(default=0)
+    registers = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['metric', 'day', 'category_id'], name='unique_daily_sketch'),
+        ]
+
+    def __str__(self):
+        return f"{self.metric} {self.day} / {self.category_id or 'all'}"
+
+
+class CustomerCohort(models.Model):
+    """
+    One cell of the cohort table: customers whose first order was in
+    ``cohort_month`` and who ordered again ``months_since`` months later.
+
+    Rebuilt as a whole by the ``compute_customer_stats`` command.
+    """
+    cohort_month = models.DateField()
+    months_since = models.IntegerField()
+    cohort_size = models.IntegerField(default=0)
+    active_customers = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['cohort_month', 'months_since']
+        constraints = [
+            models.UniqueConstraint(fields=['cohort_month', 'months_since'], name='unique_customer_cohort_cell'),
+        ]
+
+    def __str__(self):
+        return f"{self.cohort_month:%Y-%m} +{self.months_since}"
+
+
+class RollupWatermark(models.Model):
+    """How far an incremental rollup has read (orders changed before ``position``)."""
+    name = models.CharField(max_length=50, unique=True)
+    position = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.position}"
+
+
 # ============================================================================
 # ORDER MANAGEMENT
 # ============================================================================
 
+class Cart(models.Model):
+    """
+    Server-side shopping cart, one row per user or session.
+
+    Lines are stored compactly as ``{"<product id>": quantity}`` so reading or
+    updating a cart is a single-row operation; prices are never stored and are
+    computed by the pricing engine on read.
+    """
+    owner_key = models.CharField(max_length=80, unique=True)  # "u:<user id>" or "s:<session id>"
+    lines = models.JSONField(default=dict, blank=True)
+    voucher_code = models.CharField(max_length=50, blank=True, default='')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Cart {self.owner_key} ({len(self.lines)} lines)"
+
+    @property
+    def items(self):
+        """Lines as ``[{'product_id': int, 'quantity': int}]``."""
+        return [{'product_id': int(pid), 'quantity': qty} for pid, qty in self.lines.items()]
+
+
 class Order(models.Model):
     """Customer order model."""
     STATUS_CHOICES = [
@@ -291,6 +490,7 @@ class Order(models.Model):
         indexes = [
             models.Index(fields=['user', '-created_at']),
             models.Index(fields=['status']),
+            models.Index(fields=['updated_at']),
         ]
 
     def __str__(self):
@@ -459,3 +659,313 @@ class ChatMessage(models.Model):
 
     def __str__(self):
         return f"{self.sender_name}: {self.message[:50]}"
+
+
+# ============================================================================
+# INVENTORY
+# ============================================================================
+
+class InventoryHold(models.Model):
+    """
+    Short-lived reservation of stock for a shopper's cart.
+
+    Active holds are mirrored in ``Product.reserved`` so availability is a
+    column read, not a SUM over holds. Expired holds are released in batches by
+    the ``release_expired_holds`` command.
+    """
+    STATUS_CHOICES = [
+        ('active', 'Active'),
+        ('released', 'Released'),
+        ('converted', 'Converted'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='holds')
+    owner_key = models.CharField(max_length=80)  # "u:<user id>" or "s:<session id>"
+    quantity = models.IntegerField(validators=[MinValueValidator(1)])
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'expires_at']),
+            models.Index(fields=['owner_key', 'status']),
+        ]
+
+    def __str__(self):
+        return f"Hold {self.product_id} x {self.quantity} ({self.owner_key})"
+
+
+class InventoryStripe(models.Model):
+    """
+    One sub-counter of a hot SKU's stock.
+
+    While ``Product.stock_stripes`` is set, sellable stock lives in these rows
+    and checkouts decrement a random stripe, so concurrent buyers rarely wait
+    on the same row lock. ``Product.inventory`` mirrors the stripe total and is
+    refreshed by the ``fold_inventory_stripes`` command.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stripes')
+    index = models.PositiveSmallIntegerField()
+    quantity = models.IntegerField(default=0, validators=[MinValueValidator(0)])
+
+    class Meta:
+        unique_together = [['product', 'index']]
+
+    def __str__(self):
+        return f"{self.product_id}[{self.index}] = {self.quantity}"
+
+
+# ============================================================================
+# CLICKSTREAM
+# ============================================================================
+
+class ClickEvent(models.Model):
+    """
+    Append-only storefront interaction event (product view, add-to-cart, search).
+
+    Rows are written in batches by ``api.clickstream`` and never updated. Product
+    and user are stored as plain ids so ingest takes no FK locks and events
+    outlive deleted products. On PostgreSQL the table is range-partitioned by
+    month on ``created_at`` (see ``api.partitioning``).
+    """
+    EVENT_TYPES = [
+        ('view', 'View'),
+        ('add_to_cart', 'Add to Cart'),
+        ('search', 'Search'),
+    ]
+
+    event_type = models.CharField(max_length=20, choices=EVENT_TYPES)
+    product_id = models.PositiveBigIntegerField(null=True, blank=True)
+    user_id = models.PositiveBigIntegerField(null=True, blank=True)
+    session_id = models.CharField(max_length=64, blank=True)
+    query = models.CharField(max_length=200, blank=True)
+    occurred_at = models.DateTimeField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at']),
+            models.Index(fields=['product_id', 'created_at']),
+            models.Index(fields=['session_id', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} - {self.product_id or self.query}"
+
+
+class CoViewCount(models.Model):
+    """
+    Item-to-item "viewed together" count.
+
+    Incremented for both directions whenever two products are viewed within the
+    same session inside the co-view sliding window (see ``api.coview``).
+    """
+    product_id = models.PositiveBigIntegerField()
+    other_product_id = models.PositiveBigIntegerField()
+    count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = [['product_id', 'other_product_id']]
+
+    def __str__(self):
+        return f"{self.product_id} ↔ {self.other_product_id} ({self.count})"
+
+
+# ============================================================================
+# EXPERIMENTS
+# ============================================================================
+
+class Experiment(models.Model):
+    """
+    A/B experiment definition.
+
+    Edited in the admin; workers pick up changes within
+    ``EXPERIMENTS_CONFIG_TTL`` seconds, so no deploy is needed.
+    """
+    key = models.SlugField(max_length=100, unique=True)
+    description = models.TextField(blank=True)
+    variants = models.JSONField(
+        default=dict,
+        help_text='Variant name -> traffic weight, e.g. {"control": 50, "rating_first": 50}'
+    )
+    salt = models.CharField(
+        max_length=32,
+        blank=True,
+        help_text="Change to reshuffle bucket assignment"
+    )
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['key']
+
+    def __str__(self):
+        return self.key
+
+    def clean(self):
+        validate_variants(self.variants)
+
+
+def validate_variants(variants):
+    """Check experiment variants are ``{name: weight}`` with non-negative weights and a positive total."""
+    if not isinstance(variants, dict) or not variants:
+        raise ValidationError({'variants': 'Variants must be an object mapping variant names to weights.'})
+    for name, weight in variants.items():
+        if isinstance(weight, bool) or not isinstance(weight, (int, float)) or not 0 <= weight < float('inf'):
+            raise ValidationError({'variants': f'Weight of "{name}" must be a non-negative number.'})
+    if sum(variants.values()) <= 0:
+        raise ValidationError({'variants': 'At least one variant needs a positive weight.'})
+
+
+class ExperimentEvent(models.Model):
+    """Append-only exposure/conversion log, written in batches by ``api.experiments``."""
+    EVENT_TYPES = [
+        ('exposure', 'Exposure'),
+        ('conversion', 'Conversion'),
+    ]
+
+    experiment_key = models.CharField(max_length=100)
+    variant = models.CharField(max_length=50)
+    event_type = models.CharField(max_length=20, choices=EVENT_TYPES)
+    unit_id = models.CharField(max_length=80)
+    value = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['experiment_key', 'created_at']),
+            models.Index(fields=['experiment_key', 'unit_id']),
+        ]
+
+    def __str__(self):
+        return f"{self.experiment_key}/{self.variant} {self.event_type}"
+
+
+class ExperimentResult(models.Model):
+    """Per-variant metrics computed by the ``aggregate_experiments`` command."""
+    experiment_key = models.CharField(max_length=100)
+    variant = models.CharField(max_length=50)
+    exposed_units = models.IntegerField(default=0)
+    converted_units = models.IntegerField(default=0)
+    conversion_rate = models.FloatField(default=0)
+    revenue = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['experiment_key', 'variant']
+        unique_together = [['experiment_key', 'variant']]
+
+    def __str__(self):
+        return f"{self.experiment_key}/{self.variant}"
+
+
+# ============================================================================
+# OUTBOX
+# ============================================================================
+
+class OutboxEvent(models.Model):
+    """
+    Domain event waiting to be delivered to one handler.
+
+    Written in the same transaction as the change it describes, so an event
+    exists if and only if the change committed. One row is written per
+    registered handler, so handlers retry and scale independently. Rows are
+    drained by the ``process_outbox`` command; a ``processing`` row is leased
+    to a worker until ``available_at``.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    topic = models.CharField(max_length=100)
+    handler = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'handler', 'available_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.topic} -> {self.handler} ({self.status})"
+
+
+# ============================================================================
+# ORDER ARCHIVE
+# ============================================================================
+
+class ArchivedOrder(models.Model):
+    """
+    Cold copy of an order that was delivered or cancelled long ago.
+
+    Rows are moved here from ``Order`` by the ``archive_orders`` command and
+    keep their original primary key. On PostgreSQL the table is partitioned
+    by month of ``created_at``. Tracking and refund details are kept as
+    snapshots, since their live tables are pruned along with the order.
+    """
+    id = models.BigAutoField(primary_key=True)
+    order_id = models.CharField(max_length=50)
+    user = models.ForeignKey(
+        User, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name='archived_orders'
+    )
+    total_price = models.DecimalField(max_digits=15, decimal_places=2)
+    discount_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    final_price = models.DecimalField(max_digits=15, decimal_places=2)
+    voucher_code = models.CharField(max_length=50, blank=True, null=True)
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    shipping_address = models.TextField()
+    phone = models.CharField(max_length=20)
+    payment_method = models.CharField(max_length=50)
+    payment_status = models.CharField(max_length=20)
+    notes = models.TextField(blank=True)
+    item_count = models.IntegerField(default=0)
+    tracking = models.JSONField(null=True, blank=True)
+    refund = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-created_at']
+        # Declared here rather than with db_index so partitioning re-creates them
+        indexes = [
+            models.Index(fields=['order_id']),
+            models.Index(fields=['user', '-created_at']),
+        ]
+
+    def __str__(self):
+        return f"Archived order {self.order_id}"
+
+
+class ArchivedOrderItem(models.Model):
+    """Line of an archived order, partitioned alongside its order."""
+    order = models.ForeignKey(
+        ArchivedOrder, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name='items'
+    )
+    order_created_at = models.DateTimeField()
+    product_id = models.PositiveBigIntegerField(null=True, blank=True)
+    product_name = models.CharField(max_length=200, blank=True)
+    quantity = models.IntegerField()
+    price_at_purchase = models.DecimalField(max_digits=10, decimal_places=2)
+    total = models.DecimalField(max_digits=15, decimal_places=2)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['order']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_name} x {self.quantity}"
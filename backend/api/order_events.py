@@ -0,0 +1,130 @@
+"""
+Order domain events and their outbox handlers.
+
+Call ``status_changed`` wherever an order's status changes, inside the same
+transaction; the handlers below run later in the ``process_outbox`` worker.
+Bulk updates publish a single ``orders_updated`` event per batch instead.
+Checkout publishes ``order_placed`` for every new order.
+
+Handlers:
+- ``order_email``: emails the customer when the status changes
+- ``order_push``: pushes the change to the customer's ``orders_user_<id>``
+  WebSocket group (see ``OrderConsumer``)
+- ``sales_dashboard`` (in ``live_sales``): feeds the live admin dashboard
+"""
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.mail import send_mass_mail
+from django.utils import timezone
+
+from . import outbox
+
+STATUS_CHANGED = 'order.status_changed'
+BATCH_UPDATED = 'order.batch_updated'
+ORDER_PLACED = 'order.placed'
+OPEN_STATUSES = ('pending', 'processing', 'shipped')
+
+
+def user_group(user_id):
+    """Channel layer group that receives a user's order updates."""
+    return f'orders_user_{user_id}'
+
+
+def tracking_payload(tracking):
+    return {
+        'carrier': tracking.carrier,
+        'tracking_number': tracking.tracking_number,
+        'current_location': tracking.current_location,
+        'estimated_delivery': tracking.estimated_delivery.isoformat() if tracking.estimated_delivery else None,
+    }
+
+
+def status_payload(order, previous_status):
+    return {
+        'order_id': order.id,
+        'order_number': order.order_id,
+        'user_id': order.user_id,
+        'status': order.status,
+        'previous_status': previous_status,
+        'changed_at': timezone.now().isoformat(),
+    }
+
+
+def status_changed(order, previous_status):
+    """Publish an ``order.status_changed`` event if the status actually changed."""
+    if order.status != previous_status:
+        outbox.publish(STATUS_CHANGED, status_payload(order, previous_status))
+
+
+def orders_updated(changes):
+    """
+    Publish one ``order.batch_updated`` event for many orders.
+
+    ``changes`` are ``status_payload`` dicts, optionally with a ``tracking`` key.
+    """
+    outbox.publish(BATCH_UPDATED, {'changes': changes})
+
+
+def tracking_changed(order, previous_status, tracking):
+    """Publish a status and/or tracking change for one order."""
+    change = status_payload(order, previous_status)
+    change['tracking'] = tracking_payload(tracking) if tracking is not None else None
+    orders_updated([change])
+
+
+def order_placed(order, lines):
+    """Publish an ``order.placed`` event; ``lines`` are ``(product_id, quantity)`` pairs."""
+    outbox.publish(ORDER_PLACED, {
+        'order_id': order.id,
+        'user_id': order.user_id,
+        'final_price': str(order.final_price),
+        'created_at': order.created_at.isoformat(),
+        'items': [[product_id, quantity] for product_id, quantity in lines],
+    })
+
+
+def _changes(event):
+    if event.topic == BATCH_UPDATED:
+        return event.payload['changes']
+    return [event.payload]
+
+
+@outbox.register('order_email', STATUS_CHANGED, BATCH_UPDATED)
+def send_status_email(event):
+    """Email each customer whose order status changed."""
+    changes = [change for change in _changes(event) if change['status'] != change['previous_status']]
+    if not changes:
+        return
+    emails = dict(
+        User.objects.filter(id__in={change['user_id'] for change in changes}).values_list('id', 'email')
+    )
+    messages = []
+    for change in changes:
+        email = emails.get(change['user_id'])
+        if not email:
+            continue
+        messages.append((
+            f"Your order {change['order_number']} is {change['status']}",
+            f"Hi,\n\nThe status of your order {change['order_number']} "
+            f"changed from {change['previous_status']} to {change['status']}.\n\n"
+            f"ClassyCouture",
+            settings.DEFAULT_FROM_EMAIL,
+            [email],
+        ))
+    if messages:
+        send_mass_mail(messages)
+
+
+@outbox.register('order_push', STATUS_CHANGED, BATCH_UPDATED)
+def push_order_updates(event):
+    """Push each change to its owner's WebSocket group only."""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    for change in _changes(event):
+        async_to_sync(channel_layer.group_send)(
+            user_group(change['user_id']),
+            {'type': 'order_update', 'data': change}
+        )
@@ -0,0 +1,186 @@
+"""
+Transactional outbox.
+
+Side effects of a state change (emails, analytics, WebSocket pushes) are not
+run in the request. Instead ``publish`` inserts the event, fanned out to one
+``OutboxEvent`` row per registered handler, in the same transaction as the
+change: a single multi-row INSERT. The ``process_outbox`` worker leases
+pending rows in batches with SKIP LOCKED, runs each handler outside that
+transaction and retries failures with exponential backoff, so any number of
+workers can drain the table and each handler can get its own worker pool
+(``--handlers``).
+
+Handlers must be idempotent: a row is delivered at least once. Handlers
+registered as ``dedicated`` keep state in the process that runs them (e.g. the
+live sales dashboard) and are only delivered to workers that name them.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+_topics = defaultdict(list)
+_dedicated = set()
+
+
+def register(name, *topics, dedicated=False):
+    """
+    Register a handler for ``topics``. Use as a decorator::
+
+        @outbox.register('order_email', 'order.status_changed')
+        def send_status_email(event): ...
+
+    The handler receives the OutboxEvent; raising marks it for retry.
+    ``dedicated`` handlers are skipped by workers that do not ask for them
+    by name.
+    """
+    def decorator(func):
+        _handlers[name] = func
+        if dedicated:
+            _dedicated.add(name)
+        for topic in topics:
+            if name not in _topics[topic]:
+                _topics[topic].append(name)
+        return func
+    return decorator
+
+
+def handlers_for(topic):
+    return list(_topics.get(topic, ()))
+
+
+def publish(topic, payload):
+    """
+    Record an event for every handler subscribed to ``topic``.
+
+    Call inside the transaction that makes the change; the rows commit or roll
+    back with it.
+    """
+    names = handlers_for(topic)
+    if names:
+        OutboxEvent.objects.bulk_create([
+            OutboxEvent(topic=topic, handler=name, payload=payload) for name in names
+        ])
+    return len(names)
+
+
+def publish_many(topic, payloads):
+    """Record several events for ``topic`` with one INSERT."""
+    names = handlers_for(topic)
+    if names and payloads:
+        OutboxEvent.objects.bulk_create([
+            OutboxEvent(topic=topic, handler=name, payload=payload)
+            for payload in payloads
+            for name in names
+        ])
+
+
+def _retry_delay(attempts):
+    return timedelta(seconds=settings.OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+
+
+def claim(batch_size=None, handlers=None):
+    """
+    Lease a batch of due events to this worker.
+
+    A short transaction picks due rows with SKIP LOCKED and marks them
+    ``processing`` until ``OUTBOX_LEASE_SECONDS`` from now, counting the
+    attempt. No row lock outlives the claim; if the worker dies, its
+    unfinished rows are due again once the lease expires.
+
+    Returns:
+        The claimed events, in id order
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    now = timezone.now()
+    with transaction.atomic():
+        queryset = OutboxEvent.objects.select_for_update(skip_locked=True).filter(
+            status__in=('pending', 'processing'),
+            available_at__lte=now,
+        )
+        if handlers:
+            queryset = queryset.filter(handler__in=handlers)
+        elif _dedicated:
+            queryset = queryset.exclude(handler__in=_dedicated)
+        ids = list(queryset.order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return []
+        OutboxEvent.objects.filter(id__in=ids).update(
+            status='processing',
+            available_at=now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS),
+            attempts=F('attempts') + 1,
+        )
+    return list(OutboxEvent.objects.filter(id__in=ids).order_by('id'))
+
+
+def deliver(event):
+    """
+    Run the handler of a claimed event and record the outcome on its row.
+
+    The handler's own queries and the ``done`` mark commit together.
+
+    Returns:
+        True if the handler succeeded
+    """
+    handler = _handlers.get(event.handler)
+    try:
+        if handler is None:
+            raise LookupError(f'No handler registered as {event.handler!r}')
+        with transaction.atomic():
+            handler(event)
+            OutboxEvent.objects.filter(id=event.id).update(status='done', processed_at=timezone.now())
+    except Exception as exc:
+        logger.warning('Outbox event %s (%s) failed: %s', event.id, event.handler, exc)
+        event.last_error = f'{type(exc).__name__}: {exc}'[:2000]
+        if event.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            event.status = 'failed'
+        else:
+            event.status = 'pending'
+            event.available_at = timezone.now() + _retry_delay(event.attempts)
+        event.save(update_fields=['last_error', 'status', 'available_at'])
+        return False
+    return True
+
+
+def process_batch(batch_size=None, handlers=None):
+    """
+    Claim and deliver one batch of due events.
+
+    Handlers run outside the claiming transaction and each row is marked
+    done or failed on its own, so a crash only replays the rows it had not
+    finished.
+
+    Args:
+        batch_size: Maximum events to claim (default ``OUTBOX_BATCH_SIZE``)
+        handlers: Only deliver events for these handler names (default: all
+            but the dedicated ones)
+
+    Returns:
+        Tuple of (delivered, failed) counts
+    """
+    delivered = failed = 0
+    for event in claim(batch_size, handlers):
+        if deliver(event):
+            delivered += 1
+        else:
+            failed += 1
+    return delivered, failed
+
+
+def purge_processed(older_than_days=None):
+    """Delete delivered events older than ``OUTBOX_RETENTION_DAYS``. Returns the count."""
+    days = settings.OUTBOX_RETENTION_DAYS if older_than_days is None else older_than_days
+    deleted, _ = OutboxEvent.objects.filter(
+        status='done',
+        processed_at__lt=timezone.now() - timedelta(days=days),
+    ).delete()
+    return deleted
@@ -0,0 +1,130 @@
+"""
+Monthly range partitioning helpers for append-only tables.
+
+On PostgreSQL the tables listed in ``PARTITIONED_TABLES`` are declared
+``PARTITION BY RANGE`` on a timestamp column, with a DEFAULT partition as a
+safety net and monthly partitions created ahead of time by the
+``maintain_partitions`` management command. On other databases (SQLite in
+development) the tables stay regular tables and these helpers are no-ops.
+"""
+from datetime import date
+
+from django.db import connection
+
+# db_table -> partition key column
+PARTITIONED_TABLES = {
+    'api_clickevent': 'created_at',
+    'api_archivedorder': 'created_at',
+    'api_archivedorderitem': 'order_created_at',
+}
+
+
+def _month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def _add_months(day, months):
+    month_index = day.year * 12 + (day.month - 1) + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    """Name of the partition holding ``month`` (any date inside it)."""
+    return f'{table}_p{month.year:04d}{month.month:02d}'
+
+
+def partition_table_by_range(schema_editor, model, column):
+    """
+    Rebuild a freshly created (empty) model table as a range-partitioned table.
+
+    Intended to be called from a ``RunPython`` migration right after the
+    ``CreateModel`` operation. The primary key becomes ``(id, column)`` because
+    PostgreSQL requires the partition key in every unique constraint.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    qn = schema_editor.quote_name
+    table = model._meta.db_table
+    staging = f'{table}_partitioned'
+    sequence = f'{table}_id_seq'
+
+    schema_editor.execute(
+        f'CREATE TABLE {qn(staging)} (LIKE {qn(table)} INCLUDING DEFAULTS) '
+        f'PARTITION BY RANGE ({qn(column)})'
+    )
+    schema_editor.execute(f'DROP TABLE {qn(table)}')
+    schema_editor.execute(f'ALTER TABLE {qn(staging)} RENAME TO {qn(table)}')
+    schema_editor.execute(f'CREATE SEQUENCE {qn(sequence)} OWNED BY {qn(table)}."id"')
+    schema_editor.execute(
+        f'ALTER TABLE {qn(table)} ALTER COLUMN "id" SET DEFAULT nextval(%s)',
+        [sequence],
+    )
+    schema_editor.execute(f'ALTER TABLE {qn(table)} ADD PRIMARY KEY ("id", {qn(column)})')
+    schema_editor.execute(
+        f'CREATE TABLE {qn(table + "_default")} PARTITION OF {qn(table)} DEFAULT'
+    )
+    for index in model._meta.indexes:
+        schema_editor.add_index(model, index)
+
+
+def ensure_monthly_partitions(table, months_ahead=3, months_back=0, today=None):
+    """
+    Create monthly partitions for ``table`` from ``months_back`` months ago up to
+    ``months_ahead`` months from now. Returns the names of created partitions.
+    """
+    current = _month_start(today or date.today())
+    return ensure_partitions_for(
+        table, [_add_months(current, offset) for offset in range(-months_back, months_ahead + 1)]
+    )
+
+
+def ensure_partitions_for(table, months):
+    """
+    Create the monthly partitions of ``table`` covering ``months`` (any date
+    inside each month) that do not exist yet. Returns the names created.
+    """
+    if connection.vendor != 'postgresql':
+        return []
+
+    created = []
+    with connection.cursor() as cursor:
+        for start in sorted({_month_start(month) for month in months}):
+            end = _add_months(start, 1)
+            name = partition_name(table, start)
+            cursor.execute('SELECT to_regclass(%s)', [name])
+            if cursor.fetchone()[0] is not None:
+                continue
+            cursor.execute(
+                f'CREATE TABLE "{name}" PARTITION OF "{table}" '
+                f'FOR VALUES FROM (%s) TO (%s)',
+                [start.isoformat(), end.isoformat()],
+            )
+            created.append(name)
+    return created
+
+
+def drop_partitions_before(table, cutoff):
+    """
+    Drop monthly partitions of ``table`` that end on or before ``cutoff``.
+    Returns the names of dropped partitions.
+    """
+    if connection.vendor != 'postgresql':
+        return []
+
+    prefix = f'{table}_p'
+    limit = partition_name(table, _month_start(cutoff))
+    dropped = []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname FROM pg_inherits i '
+            'JOIN pg_class c ON c.oid = i.inhrelid '
+            'JOIN pg_class p ON p.oid = i.inhparent '
+            'WHERE p.relname = %s',
+            [table],
+        )
+        for (name,) in cursor.fetchall():
+            if name.startswith(prefix) and len(name) == len(limit) and name < limit:
+                cursor.execute(f'DROP TABLE "{name}"')
+                dropped.append(name)
+    return sorted(dropped)
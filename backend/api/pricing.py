@@ -0,0 +1,342 @@
+"""
+Batch cart pricing engine.
+
+Prices a whole cart in one pass: all products are fetched with a single
+``values_list`` query (no model instances), bundle companions come from the
+cache (one ``get_many``; misses are filled with one grouped co-purchase query),
+and voucher and campaign rules are compiled once per ``PRICING_RULES_TTL``
+seconds per worker, so a warm 50-line cart is priced with one database query.
+
+The rules match the rest of the shop: the product sale discount
+(``Product.discounted_price``), a 10% bundle discount on pairs that are
+frequently bought together (``get_bundle_discount_suggestions``), then the
+voucher on what is left.
+"""
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import OrderItem, Product, Voucher, VoucherCampaign, VoucherCode
+
+CENT = Decimal('0.01')
+ZERO = Decimal('0')
+BUNDLE_DISCOUNT_PERCENT = 10
+BUNDLE_COMPANIONS = 3
+BUNDLE_CACHE_PREFIX = 'bundle:'
+
+PRODUCT_FIELDS = ('id', 'name', 'image_url', 'price', 'on_sale', 'discount_percent', 'stock_stripes')
+
+
+class PricingError(Exception):
+    """Raised when a cart cannot be priced."""
+
+    def __init__(self, message, code='invalid', details=None):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+        self.details = details or {}
+
+
+class CompiledVoucher:
+    """Voucher rules pre-processed for pricing without a database hit."""
+
+    __slots__ = (
+        'id', 'code', 'code_id', 'campaign_id', 'percentage', 'value', 'min_purchase',
+        'is_active', 'start_date', 'end_date', 'exhausted', 'max_uses_per_user',
+    )
+
+    def __init__(self, rules, code=None, code_id=None, redeemed=False):
+        """
+        Compile a Voucher, or a VoucherCampaign for one of its codes
+        (``code``, ``code_id`` and ``redeemed`` come from the VoucherCode).
+        """
+        campaign = isinstance(rules, VoucherCampaign)
+        self.id = None if campaign else rules.id
+        self.code = code if campaign else rules.code
+        self.code_id = code_id
+        self.campaign_id = rules.id if campaign else None
+        self.percentage = rules.discount_type == 'percentage'
+        self.value = Decimal(rules.discount_value)
+        self.min_purchase = Decimal(rules.min_purchase)
+        self.is_active = rules.is_active
+        self.start_date = rules.start_date
+        self.end_date = rules.end_date
+        if campaign:
+            self.exhausted = redeemed
+            self.max_uses_per_user = None
+        else:
+            # Cached usage is a hint; redeem() enforces max_uses (cancellations give uses back)
+            self.exhausted = rules.max_uses is not None and rules.current_uses >= rules.max_uses
+            self.max_uses_per_user = rules.max_uses_per_user
+
+    def discount(self, amount, now=None):
+        """
+        Return the discount on ``amount``, or raise PricingError.
+
+        Usage is checked against the cached snapshot only; checkout enforces
+        the limits when the voucher is redeemed (``vouchers.redeem``).
+        """
+        now = now or timezone.now()
+        if self.exhausted or not self.is_active or not self.start_date <= now <= self.end_date:
+            raise PricingError('Voucher expired or max uses reached', 'voucher_invalid')
+        if amount < self.min_purchase:
+            raise PricingError(
+                f'Minimum purchase of {self.min_purchase} required for this voucher',
+                'voucher_min_purchase'
+            )
+        discount = amount * self.value / 100 if self.percentage else self.value
+        return min(discount, amount).quantize(CENT)
+
+
+_rules = {'vouchers': None, 'loaded_at': 0.0}
+_campaigns = {}
+_rules_lock = threading.Lock()
+
+
+def _vouchers():
+    """``{code: CompiledVoucher}`` for every Voucher, reloaded every ``PRICING_RULES_TTL`` seconds."""
+    vouchers = _rules['vouchers']
+    if vouchers is None or time.monotonic() - _rules['loaded_at'] >= settings.PRICING_RULES_TTL:
+        vouchers = {voucher.code: CompiledVoucher(voucher) for voucher in Voucher.objects.all()}
+        with _rules_lock:
+            _rules['vouchers'] = vouchers
+            _rules['loaded_at'] = time.monotonic()
+    return vouchers
+
+
+def _campaign(campaign_id):
+    entry = _campaigns.get(campaign_id)
+    if entry is not None and time.monotonic() - entry[1] < settings.PRICING_RULES_TTL:
+        return entry[0]
+    campaign = VoucherCampaign.objects.get(pk=campaign_id)
+    with _rules_lock:
+        _campaigns[campaign_id] = (campaign, time.monotonic())
+    return campaign
+
+
+def compiled_voucher(code):
+    """
+    Return the CompiledVoucher for ``code``, or None if unknown.
+
+    Vouchers are few and all of them are compiled together per worker.
+    Campaign codes are too many to cache: each is one lookup on the unique
+    code index, with the campaign's rules cached.
+    """
+    compiled = _vouchers().get(code)
+    if compiled is not None:
+        return compiled
+    row = VoucherCode.objects.filter(code=code).values_list('id', 'campaign_id', 'redeemed_at').first()
+    if row is None:
+        return None
+    code_id, campaign_id, redeemed_at = row
+    return CompiledVoucher(_campaign(campaign_id), code, code_id, redeemed_at is not None)
+
+
+def invalidate_vouchers():
+    """Drop compiled voucher and campaign rules so the next lookup re-reads them."""
+    with _rules_lock:
+        _rules['vouchers'] = None
+        _campaigns.clear()
+
+
+def bundle_companions(product_ids):
+    """
+    Return ``{product_id: [companion_id, ...]}``: each product's top
+    co-purchased products, most frequent first.
+
+    Read from the cache in one call; misses are computed together with one
+    grouped query over order items and cached for ``PRICING_BUNDLE_TTL``.
+    """
+    keys = {f'{BUNDLE_CACHE_PREFIX}{product_id}': product_id for product_id in product_ids}
+    cached = cache.get_many(list(keys))
+    companions = {keys[key]: value for key, value in cached.items()}
+
+    missing = [product_id for product_id in product_ids if product_id not in companions]
+    if missing:
+        ranked = defaultdict(list)
+        co_purchased = OrderItem.objects.filter(
+            product_id__in=missing
+        ).values_list('product_id', 'order__items__product_id').annotate(
+            frequency=Count('id')
+        ).order_by('product_id', '-frequency', 'order__items__product_id')
+        for product_id, companion_id, _ in co_purchased:
+            if companion_id != product_id and len(ranked[product_id]) < BUNDLE_COMPANIONS:
+                ranked[product_id].append(companion_id)
+
+        fresh = {product_id: ranked.get(product_id, []) for product_id in missing}
+        cache.set_many(
+            {f'{BUNDLE_CACHE_PREFIX}{product_id}': value for product_id, value in fresh.items()},
+            timeout=settings.PRICING_BUNDLE_TTL
+        )
+        companions.update(fresh)
+    return companions
+
+
+class PricedLine:
+    """One priced cart line."""
+
+    __slots__ = (
+        'product_id', 'name', 'image_url', 'stock_stripes', 'quantity',
+        'list_price', 'unit_price', 'bundle_discount',
+    )
+
+    def __init__(self, row, quantity):
+        product_id, name, image_url, price, on_sale, discount_percent, stock_stripes = row
+        self.product_id = product_id
+        self.name = name
+        self.image_url = image_url
+        self.stock_stripes = stock_stripes
+        self.quantity = quantity
+        self.list_price = price
+        if on_sale and discount_percent > 0:
+            self.unit_price = (price - price * Decimal(discount_percent) / 100).quantize(CENT)
+        else:
+            self.unit_price = price
+        self.bundle_discount = ZERO
+
+    @property
+    def line_total(self):
+        return self.unit_price * self.quantity
+
+    @property
+    def savings(self):
+        """Sale and bundle savings on this line."""
+        return (self.list_price - self.unit_price) * self.quantity + self.bundle_discount
+
+    def as_dict(self):
+        return {
+            'product_id': self.product_id,
+            'name': self.name,
+            'image': self.image_url,
+            'quantity': self.quantity,
+            'list_price': self.list_price,
+            'unit_price': self.unit_price,
+            'line_total': self.line_total,
+            'bundle_discount': self.bundle_discount,
+            'savings': self.savings,
+        }
+
+
+class PricedCart:
+    """Result of pricing a cart."""
+
+    __slots__ = ('lines', 'subtotal', 'bundle_discount', 'voucher', 'voucher_discount')
+
+    def __init__(self, lines, subtotal, bundle_discount, voucher, voucher_discount):
+        self.lines = lines
+        self.subtotal = subtotal
+        self.bundle_discount = bundle_discount
+        self.voucher = voucher
+        self.voucher_discount = voucher_discount
+
+    @property
+    def discount(self):
+        """Everything taken off the subtotal at checkout."""
+        return self.bundle_discount + self.voucher_discount
+
+    @property
+    def final_price(self):
+        return self.subtotal - self.discount
+
+    @property
+    def savings(self):
+        return sum((line.savings for line in self.lines), ZERO) + self.voucher_discount
+
+    def as_dict(self):
+        return {
+            'lines': [line.as_dict() for line in self.lines],
+            'subtotal': self.subtotal,
+            'bundle_discount': self.bundle_discount,
+            'voucher_code': self.voucher.code if self.voucher else None,
+            'voucher_discount': self.voucher_discount,
+            'savings': self.savings,
+            'final_price': self.final_price,
+        }
+
+
+def _merge_lines(items):
+    """Collapse ``[{'product_id', 'quantity'}]`` into ``{product_id: quantity}``."""
+    quantities = OrderedDict()
+    for item in items:
+        quantities[item['product_id']] = quantities.get(item['product_id'], 0) + item['quantity']
+    return quantities
+
+
+def _apply_bundles(lines):
+    """
+    Pair lines with their co-purchase companions and discount each pair.
+
+    Higher-priced lines pick first; every unit joins at most one bundle.
+    Returns the total bundle discount.
+    """
+    by_id = {line.product_id: line for line in lines}
+    companions = bundle_companions(list(by_id))
+    unpaired = {line.product_id: line.quantity for line in lines}
+
+    total = ZERO
+    for line in sorted(lines, key=lambda line: (-line.unit_price, line.product_id)):
+        for companion_id in companions.get(line.product_id, []):
+            if not unpaired[line.product_id]:
+                break
+            if not unpaired.get(companion_id):
+                continue
+            pairs = min(unpaired[line.product_id], unpaired[companion_id])
+            companion = by_id[companion_id]
+            pair_price = line.unit_price + companion.unit_price
+            if not pair_price:
+                continue
+            discount = (pair_price * BUNDLE_DISCOUNT_PERCENT / 100 * pairs).quantize(CENT)
+            # Split the discount across both lines in proportion to their price
+            share = (discount * line.unit_price / pair_price).quantize(CENT)
+            line.bundle_discount += share
+            companion.bundle_discount += discount - share
+            unpaired[line.product_id] -= pairs
+            unpaired[companion_id] -= pairs
+            total += discount
+    return total
+
+
+def price_cart(items, voucher_code=None, bundles=True):
+    """
+    Price a cart.
+
+    Args:
+        items: List of ``{'product_id': int, 'quantity': int}``; repeated
+            products are merged
+        voucher_code: Optional voucher to apply
+        bundles: Apply bundle discounts
+
+    Returns:
+        PricedCart
+
+    Raises:
+        PricingError: Unknown product or voucher, or the voucher does not apply
+    """
+    quantities = _merge_lines(items)
+    rows = {
+        row[0]: row
+        for row in Product.objects.filter(id__in=list(quantities)).values_list(*PRODUCT_FIELDS)
+    }
+    missing = [product_id for product_id in quantities if product_id not in rows]
+    if missing:
+        raise PricingError('Product not found', 'not_found', {'product_ids': missing})
+
+    lines = [PricedLine(rows[product_id], quantity) for product_id, quantity in quantities.items()]
+    subtotal = sum((line.line_total for line in lines), ZERO)
+    bundle_discount = _apply_bundles(lines) if bundles and len(lines) > 1 else ZERO
+
+    voucher = None
+    voucher_discount = ZERO
+    if voucher_code:
+        voucher = compiled_voucher(voucher_code)
+        if voucher is None:
+            raise PricingError('Voucher not found', 'voucher_invalid')
+        voucher_discount = voucher.discount(subtotal - bundle_discount)
+
+    return PricedCart(lines, subtotal, bundle_discount, voucher, voucher_discount)
@@ -0,0 +1,70 @@
+"""
+Compact recently-viewed store per user or session.
+
+Each owner's history is a fixed-capacity ring of product IDs, most recent
+first, packed into a single binary blob (``array('I')``: 4 bytes per ID) under
+one cache key. Reading is one cache get; recording a batch of views is one
+get plus one set, regardless of how many views the batch contains.
+"""
+from array import array
+
+from django.conf import settings
+from django.core.cache import cache
+
+CACHE_PREFIX = 'rv:'
+
+
+def _cache_key(user_id=None, session_id=''):
+    if user_id:
+        return f'{CACHE_PREFIX}u:{user_id}'
+    if session_id:
+        return f'{CACHE_PREFIX}s:{session_id}'
+    return None
+
+
+def pack(product_ids):
+    """Pack product IDs into a binary blob."""
+    return array('I', product_ids).tobytes()
+
+
+def unpack(blob):
+    """Unpack a blob produced by ``pack``."""
+    if not blob:
+        return []
+    ids = array('I')
+    ids.frombytes(blob)
+    return ids.tolist()
+
+
+def get_recent(user_id=None, session_id=''):
+    """Return recently viewed product IDs, most recent first."""
+    key = _cache_key(user_id, session_id)
+    if key is None:
+        return []
+    return unpack(cache.get(key))
+
+
+def push(product_ids, user_id=None, session_id=''):
+    """
+    Record views in the order they happened (oldest first).
+
+    Re-viewed products move to the front; once the ring is full the oldest
+    entries fall off.
+
+    Returns:
+        The updated list of product IDs, most recent first
+    """
+    key = _cache_key(user_id, session_id)
+    if key is None or not product_ids:
+        return []
+
+    capacity = settings.RECENTLY_VIEWED_SIZE
+    recent = unpack(cache.get(key))
+    for product_id in product_ids:
+        if product_id in recent:
+            recent.remove(product_id)
+        recent.insert(0, product_id)
+    del recent[capacity:]
+
+    cache.set(key, pack(recent), timeout=settings.RECENTLY_VIEWED_TTL)
+    return recent
@@ -3,18 +3,38 @@ AI-Powered Recommendation Engine for ClassyCouture
 Provides personalized product recommendations based on user behavior and purchase patterns.
 """
 
-from django.db.models import Count, Q, F, Avg
+from django.db.models import Count, Q, F, Avg, Sum
 from django.utils import timezone
 from datetime import timedelta
-from .models import Product, Order, OrderItem, Review
+from .models import Product, Order, OrderItem, Review, CoViewCount
 from typing import List
 
 
+# Experiment key used to A/B test the ranking strategies below
+RANKING_EXPERIMENT = 'recommendation_ranking'
+
+# Ranking variants for candidate lists (variant name -> ORDER BY terms)
+RANKING_STRATEGIES = {
+    'control': ('-featured', F('avg_rating').desc(nulls_last=True), '-created_at'),
+    'rating_first': (F('avg_rating').desc(nulls_last=True), '-featured', '-created_at'),
+    'newest_first': ('-created_at', '-featured'),
+}
+
+
 class RecommendationEngine:
     """AI-powered product recommendation system."""
 
     @staticmethod
-    def get_similar_products(product_id: int, limit: int = 6) -> List[Product]:
+    def rank(queryset, ranking: str = 'control'):
+        """
+        Order a product queryset using one of the RANKING_STRATEGIES.
+        Unknown strategy names fall back to 'control'.
+        """
+        ordering = RANKING_STRATEGIES.get(ranking, RANKING_STRATEGIES['control'])
+        return queryset.annotate(avg_rating=Avg('reviews__rating')).order_by(*ordering)
+
+    @staticmethod
+    def get_similar_products(product_id: int, limit: int = 6, ranking: str = 'control') -> List[Product]:
         """
         Get products similar to the given product.
         Based on: category, price range, and rating.
@@ -22,6 +42,7 @@ class RecommendationEngine:
         Args:
             product_id: ID of the product to find similar items for
             limit: Maximum number of recommendations to return
+            ranking: Name of the ranking strategy to order candidates with
 
         Returns:
             List of similar Product objects
@@ -36,17 +57,16 @@ class RecommendationEngine:
         price_max = float(product.price) * 1.3
 
         # Find similar products
-        similar = Product.objects.filter(
-            category=product.category,
-            price__gte=price_min,
-            price__lte=price_max,
-            inventory__gt=0
-        ).exclude(
-            id=product_id
-        ).order_by(
-            '-featured',
-            '-rating',
-            '-created_at'
+        similar = RecommendationEngine.rank(
+            Product.objects.filter(
+                category=product.category,
+                price__gte=price_min,
+                price__lte=price_max,
+                inventory__gt=0
+            ).exclude(
+                id=product_id
+            ),
+            ranking
         )[:limit]
 
         return list(similar)
@@ -105,7 +125,8 @@ class RecommendationEngine:
         return sorted_products
 
     @staticmethod
-    def get_personalized_recommendations(user_id: int, limit: int = 8) -> List[Product]:
+    def get_personalized_recommendations(user_id: int, limit: int = 8,
+                                         ranking: str = 'control') -> List[Product]:
         """
         Get personalized recommendations based on user's purchase history and browsing.
         Uses collaborative filtering approach.
@@ -113,6 +134,7 @@ class RecommendationEngine:
         Args:
             user_id: ID of the user to generate recommendations for
             limit: Maximum number of recommendations to return
+            ranking: Name of the ranking strategy to order candidates with
 
         Returns:
             List of recommended Product objects
@@ -143,15 +165,14 @@ class RecommendationEngine:
         favorite_category_ids = [cat['category'] for cat in favorite_categories]
 
         # Recommend products from favorite categories that user hasn't purchased
-        recommendations = Product.objects.filter(
-            category_id__in=favorite_category_ids,
-            inventory__gt=0
-        ).exclude(
-            id__in=purchased_product_ids
-        ).order_by(
-            '-featured',
-            '-rating',
-            '-created_at'
+        recommendations = RecommendationEngine.rank(
+            Product.objects.filter(
+                category_id__in=favorite_category_ids,
+                inventory__gt=0
+            ).exclude(
+                id__in=purchased_product_ids
+            ),
+            ranking
         )[:limit]
 
         recommendations_list = list(recommendations)
@@ -168,6 +189,49 @@ class RecommendationEngine:
 
         return recommendations_list
 
+    @staticmethod
+    def get_viewed_together(product_ids: List[int], limit: int = 8) -> List[Product]:
+        """
+        Get products other shoppers viewed in the same sessions as the given products.
+        Works without a user, so anonymous traffic gets browsing-based results.
+
+        Args:
+            product_ids: Recently viewed product IDs, most recent first
+            limit: Maximum number of recommendations to return
+
+        Returns:
+            List of Product objects ordered by co-view score
+        """
+        if not product_ids:
+            return RecommendationEngine.get_trending_products(limit)
+
+        scores = CoViewCount.objects.filter(
+            product_id__in=product_ids
+        ).exclude(
+            other_product_id__in=product_ids
+        ).values('other_product_id').annotate(
+            score=Sum('count')
+        ).order_by('-score')[:limit * 2]
+
+        candidate_ids = [item['other_product_id'] for item in scores]
+        products = Product.objects.filter(
+            id__in=candidate_ids,
+            inventory__gt=0
+        ).select_related('category').prefetch_related('reviews')
+
+        product_dict = {p.id: p for p in products}
+        ranked = [product_dict[pid] for pid in candidate_ids if pid in product_dict][:limit]
+
+        # Cold start: pad with trending products
+        if len(ranked) < limit:
+            seen = set(product_ids) | {p.id for p in ranked}
+            ranked.extend([
+                p for p in RecommendationEngine.get_trending_products(limit)
+                if p.id not in seen
+            ][:limit - len(ranked)])
+
+        return ranked
+
     @staticmethod
     def get_trending_products(limit: int = 8) -> List[Product]:
         """
@@ -184,7 +248,7 @@ class RecommendationEngine:
 
         # Find products with most sales in last 30 days
         trending_ids = OrderItem.objects.filter(
-            order__order_date__gte=thirty_days_ago,
+            order__created_at__gte=thirty_days_ago,
             order__status__in=['processing', 'shipped', 'delivered']
         ).values('product_id').annotate(
             sales_count=Count('product_id')
@@ -213,49 +277,68 @@ class RecommendationEngine:
                 inventory__gt=0
             ).exclude(
                 id__in=product_ids
-            ).order_by('-rating', '-created_at')[:limit - len(sorted_trending)])
+            ).annotate(
+                avg_rating=Avg('reviews__rating')
+            ).order_by(
+                F('avg_rating').desc(nulls_last=True),
+                '-created_at'
+            )[:limit - len(sorted_trending)])
             sorted_trending.extend(featured)
 
         return sorted_trending
 
     @staticmethod
-    def get_you_may_also_like(user_id: int, current_product_id: int, limit: int = 6) -> List[Product]:
+    def get_you_may_also_like(user_id: int, current_product_id: int, limit: int = 6,
+                              recently_viewed_ids: List[int] = None,
+                              ranking: str = 'control') -> List[Product]:
         """
-        Hybrid recommendations combining similar products and personalized suggestions.
+        Hybrid recommendations combining similar products, products viewed together
+        with the user's recent browsing, and personalized suggestions.
 
         Args:
             user_id: ID of the user
             current_product_id: ID of the product user is viewing
             limit: Maximum number of recommendations to return
+            recently_viewed_ids: Product IDs the user viewed recently, most recent first
+            ranking: Name of the ranking strategy to order candidates with
 
         Returns:
             List of recommended Product objects
         """
-        # Get half from similar products
+        per_source = max(limit // 2, 1)
+
         similar = RecommendationEngine.get_similar_products(
             current_product_id,
-            limit=limit // 2
+            limit=per_source,
+            ranking=ranking
+        )
+
+        # Browsing signal: co-views of the current product plus recent history
+        browsed_ids = [current_product_id] + [
+            pid for pid in (recently_viewed_ids or []) if pid != current_product_id
+        ]
+        viewed_together = RecommendationEngine.get_viewed_together(
+            browsed_ids,
+            limit=per_source
         )
 
-        # Get half from personalized recommendations
         personalized = RecommendationEngine.get_personalized_recommendations(
             user_id,
-            limit=limit // 2
+            limit=per_source,
+            ranking=ranking
         )
 
         # Combine and deduplicate
         recommendations = []
-        seen_ids = set()
-
-        # Alternate between similar and personalized
-        for i in range(max(len(similar), len(personalized))):
-            if i < len(similar) and similar[i].id not in seen_ids:
-                recommendations.append(similar[i])
-                seen_ids.add(similar[i].id)
-
-            if i < len(personalized) and personalized[i].id not in seen_ids:
-                recommendations.append(personalized[i])
-                seen_ids.add(personalized[i].id)
+        seen_ids = {current_product_id}
+        sources = [similar, viewed_together, personalized]
+
+        # Round-robin across sources
+        for i in range(max(len(source) for source in sources)):
+            for source in sources:
+                if i < len(source) and source[i].id not in seen_ids:
+                    recommendations.append(source[i])
+                    seen_ids.add(source[i].id)
 
             if len(recommendations) >= limit:
                 break
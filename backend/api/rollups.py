@@ -0,0 +1,385 @@
+"""
+Sales rollups: daily ``SalesAnalytics`` rows, the hourly ``SalesCube`` and the
+daily distinct-customer sketches.
+
+The dashboard only reads these precomputed tables; this module keeps them up
+to date. ``rollup_incremental`` finds the periods (days, hours) of the orders
+changed since each table's watermark (via the ``updated_at`` index),
+recomputes just those periods and writes them, then advances the watermark,
+so each run costs in proportion to what changed rather than to history.
+``backfill`` recomputes whole months, several in parallel.
+
+Totals cover live and archived orders alike (archiving moves an order but
+does not change its period). Daily totals exclude cancelled orders; the cube
+keeps status as a dimension. Periods are in ``TIME_ZONE`` by order creation
+time.
+"""
+import calendar
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate, TruncHour, TruncMonth
+from django.utils import timezone
+
+from . import sketches
+from .models import (
+    ArchivedOrder, ArchivedOrderItem, Order, OrderItem, Product, RollupWatermark, SalesAnalytics, SalesCube
+)
+
+WATERMARK = 'sales_daily'
+CUBE_WATERMARK = 'sales_cube'
+CENT = Decimal('0.01')
+ZERO = Decimal('0')
+DAYS_PER_QUERY = 31
+HOURS_PER_QUERY = 24 * 31
+DAY = timedelta(days=1)
+HOUR = timedelta(hours=1)
+
+# (order model, item model, item's path to the order creation time)
+SOURCES = (
+    (Order, OrderItem, 'order__created_at'),
+    (ArchivedOrder, ArchivedOrderItem, 'order_created_at'),
+)
+ROLLUP_FIELDS = ['total_orders', 'total_revenue', 'total_items_sold', 'avg_order_value', 'unique_customers']
+
+
+def _start_of(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _periods_filter(starts, step, field):
+    """OR of ``[start, start + step)`` ranges for sorted ``starts``, consecutive periods merged."""
+    query = Q()
+    first = last = starts[0]
+    for start in starts[1:] + [None]:
+        if start is not None and start == last + step:
+            last = start
+            continue
+        query |= Q(**{f'{field}__gte': first, f'{field}__lt': last + step})
+        if start is not None:
+            first = last = start
+    return query
+
+
+def _days_filter(days, field):
+    return _periods_filter([_start_of(day) for day in sorted(days)], DAY, field)
+
+
+def compute_days(days):
+    """
+    Compute the totals for ``days`` from the order tables.
+
+    Returns:
+        Unsaved SalesAnalytics rows, one per day (zero rows for days without orders)
+    """
+    orders = {day: 0 for day in days}
+    revenue = {day: ZERO for day in days}
+    items = {day: 0 for day in days}
+    customers = {day: set() for day in days}
+
+    for order_model, item_model, order_created_at in SOURCES:
+        per_customer = order_model.objects.filter(
+            _days_filter(days, 'created_at')
+        ).exclude(status='cancelled').annotate(
+            day=TruncDate('created_at')
+        ).order_by().values_list('day', 'user_id').annotate(count=Count('id'), revenue=Sum('final_price'))
+        for day, user_id, count, amount in per_customer:
+            orders[day] += count
+            revenue[day] += amount
+            customers[day].add(user_id)
+
+        sold = item_model.objects.filter(
+            _days_filter(days, order_created_at)
+        ).exclude(order__status='cancelled').annotate(
+            day=TruncDate(order_created_at)
+        ).order_by().values_list('day').annotate(quantity=Sum('quantity'))
+        for day, quantity in sold:
+            items[day] += quantity
+
+    return [
+        SalesAnalytics(
+            date=day,
+            total_orders=orders[day],
+            total_revenue=revenue[day],
+            total_items_sold=items[day],
+            avg_order_value=(revenue[day] / orders[day]).quantize(CENT) if orders[day] else ZERO,
+            unique_customers=len(customers[day]),
+        )
+        for day in days
+    ]
+
+
+def compute_customers(days):
+    """
+    Distinct customers of ``days``, overall and per category.
+
+    Returns:
+        ``{(day, category_id): {user_id, ...}}`` with category 0 for all categories
+    """
+    customers = {}
+    for order_model, item_model, order_created_at in SOURCES:
+        orders = order_model.objects.filter(
+            _days_filter(days, 'created_at')
+        ).exclude(status='cancelled').annotate(
+            day=TruncDate('created_at')
+        ).order_by().values_list('day', 'user_id').distinct()
+        for day, user_id in orders:
+            customers.setdefault((day, sketches.ALL_CATEGORIES), set()).add(user_id)
+
+        # Archived items keep a bare product id, mapped to categories below
+        product = 'product__category_id' if item_model is OrderItem else 'product_id'
+        items = list(item_model.objects.filter(
+            _days_filter(days, order_created_at)
+        ).exclude(order__status='cancelled').annotate(
+            day=TruncDate(order_created_at)
+        ).order_by().values_list('day', product, 'order__user_id').distinct())
+        if item_model is not OrderItem and items:
+            categories = dict(
+                Product.objects.filter(id__in={row[1] for row in items}).values_list('id', 'category_id')
+            )
+            items = [(day, categories.get(product_id), user_id) for day, product_id, user_id in items]
+        for day, category_id, user_id in items:
+            if category_id:
+                customers.setdefault((day, category_id), set()).add(user_id)
+    return customers
+
+
+def rollup_days(days):
+    """
+    Recompute and upsert ``SalesAnalytics`` and the customer sketches for ``days``.
+
+    Returns:
+        Number of days
+    """
+    days = sorted(set(days))
+    for start in range(0, len(days), DAYS_PER_QUERY):
+        chunk = days[start:start + DAYS_PER_QUERY]
+        SalesAnalytics.objects.bulk_create(
+            compute_days(chunk),
+            update_conflicts=True,
+            unique_fields=['date'],
+            update_fields=ROLLUP_FIELDS + ['updated_at'],
+        )
+        sketches.replace_customer_sketches(chunk, compute_customers(chunk))
+    return len(days)
+
+
+def compute_hours(hours):
+    """
+    Compute the cube cells for ``hours`` (aware datetimes on the hour).
+
+    Returns:
+        Unsaved SalesCube rows for the cells that have sales
+    """
+    hours = sorted(hours)
+    cells = {}
+
+    def add(key, orders, quantity, revenue):
+        cell = cells.get(key)
+        if cell is None:
+            cells[key] = [orders, quantity, revenue]
+        else:
+            cell[0] += orders
+            cell[1] += quantity
+            cell[2] += revenue
+
+    live = OrderItem.objects.filter(
+        _periods_filter(hours, HOUR, 'order__created_at')
+    ).annotate(
+        hour=TruncHour('order__created_at')
+    ).order_by().values_list('hour', 'product__category_id', 'order__status').annotate(
+        orders=Count('order_id', distinct=True), quantity=Sum('quantity'), revenue=Sum('total')
+    )
+    for hour, category_id, status, orders, quantity, revenue in live:
+        add((hour, category_id, status), orders, quantity, revenue)
+
+    # Archived items keep a bare product id: group by order and product, then map to categories
+    archived = list(
+        ArchivedOrderItem.objects.filter(
+            _periods_filter(hours, HOUR, 'order_created_at')
+        ).annotate(
+            hour=TruncHour('order_created_at')
+        ).order_by().values_list('hour', 'order_id', 'product_id', 'order__status').annotate(
+            quantity=Sum('quantity'), revenue=Sum('total')
+        )
+    )
+    if archived:
+        categories = dict(
+            Product.objects.filter(id__in={row[2] for row in archived}).values_list('id', 'category_id')
+        )
+        counted = set()
+        for hour, order_id, product_id, status, quantity, revenue in archived:
+            key = (hour, categories.get(product_id), status)
+            add(key, 0 if (key, order_id) in counted else 1, quantity, revenue)
+            counted.add((key, order_id))
+
+    return [
+        SalesCube(hour=hour, category_id=category_id, status=status,
+                  order_count=orders, items_sold=quantity, revenue=revenue)
+        for (hour, category_id, status), (orders, quantity, revenue) in cells.items()
+    ]
+
+
+def rollup_hours(hours):
+    """Recompute the cube cells for ``hours``. Returns the number of hours."""
+    hours = sorted(set(hours))
+    for start in range(0, len(hours), HOURS_PER_QUERY):
+        chunk = hours[start:start + HOURS_PER_QUERY]
+        with transaction.atomic():
+            SalesCube.objects.filter(_periods_filter(chunk, HOUR, 'hour')).delete()
+            SalesCube.objects.bulk_create(compute_hours(chunk), batch_size=1000)
+    return len(hours)
+
+
+CUBE_PERIODS = {'hour': None, 'day': TruncDate, 'month': TruncMonth}
+CUBE_DIMENSIONS = ('hour', 'day', 'month', 'category', 'status')
+
+
+def query_cube(start=None, end=None, group_by=('day',), statuses=None, category_ids=None):
+    """
+    Answer a dashboard query by summing cube cells.
+
+    Args:
+        start / end: ``[start, end)`` range of order creation times
+        group_by: Any of ``CUBE_DIMENSIONS``, at most one period
+        statuses: Only these order statuses
+        category_ids: Only these categories
+
+    Returns:
+        List of dicts with the requested dimensions (``period``,
+        ``category_id`` and ``category_name``, ``status``) and ``order_count``,
+        ``items_sold`` and ``revenue``. ``order_count`` counts an order once
+        per category it has items in.
+
+    Raises:
+        ValueError: Unknown dimension or more than one period
+    """
+    unknown = [dimension for dimension in group_by if dimension not in CUBE_DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown dimension: {', '.join(unknown)}")
+    periods = [dimension for dimension in group_by if dimension in CUBE_PERIODS]
+    if len(periods) > 1:
+        raise ValueError('Group by at most one of hour, day, month')
+
+    cells = SalesCube.objects.all()
+    if start:
+        cells = cells.filter(hour__gte=start)
+    if end:
+        cells = cells.filter(hour__lt=end)
+    if statuses:
+        cells = cells.filter(status__in=statuses)
+    if category_ids:
+        cells = cells.filter(category_id__in=category_ids)
+
+    fields = []
+    if periods:
+        trunc = CUBE_PERIODS[periods[0]]
+        cells = cells.annotate(period=trunc('hour') if trunc else F('hour'))
+        fields.append('period')
+    if 'category' in group_by:
+        fields += ['category_id', 'category__name']
+    if 'status' in group_by:
+        fields.append('status')
+
+    rows = cells.order_by().values(*fields).annotate(
+        order_count=Sum('order_count'), items_sold=Sum('items_sold'), total_revenue=Sum('revenue')
+    ).order_by(*fields)
+    return [
+        {
+            **{('category_name' if field == 'category__name' else field): row[field] for field in fields},
+            'order_count': row['order_count'],
+            'items_sold': row['items_sold'],
+            'revenue': row['total_revenue'],
+        }
+        for row in rows
+    ]
+
+
+def _changed_periods(watermark, until, trunc):
+    return sorted(
+        Order.objects.filter(
+            updated_at__gte=watermark.position,
+            updated_at__lt=until,
+        ).annotate(period=trunc('created_at')).order_by().values_list('period', flat=True).distinct()
+    )
+
+
+def rollup_incremental(lag_seconds=None):
+    """
+    Roll up the days and hours of orders changed since the watermarks.
+
+    Orders changed in the last ``SALES_ROLLUP_LAG_SECONDS`` are left for the
+    next run, so transactions still in flight when the window closes are not
+    skipped. Concurrent runs queue on the watermark rows.
+
+    Returns:
+        Tuple of (days, hours) recomputed, each sorted
+    """
+    lag = settings.SALES_ROLLUP_LAG_SECONDS if lag_seconds is None else lag_seconds
+    changed = []
+    for name, trunc, rollup in ((WATERMARK, TruncDate, rollup_days), (CUBE_WATERMARK, TruncHour, rollup_hours)):
+        with transaction.atomic():
+            watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(
+                name=name,
+                defaults={'position': timezone.make_aware(datetime(2000, 1, 1))},
+            )
+            until = timezone.now() - timedelta(seconds=lag)
+            periods = _changed_periods(watermark, until, trunc) if until > watermark.position else []
+            if periods:
+                rollup(periods)
+            if until > watermark.position:
+                watermark.position = until
+                watermark.save(update_fields=['position', 'updated_at'])
+        changed.append(periods)
+    return tuple(changed)
+
+
+def _month_days(year, month):
+    """Days of the month, up to today."""
+    today = timezone.localdate()
+    days = (date(year, month, day) for day in range(1, calendar.monthrange(year, month)[1] + 1))
+    return [day for day in days if day <= today]
+
+
+def _rollup_month(month):
+    days = _month_days(*month)
+    rollup_hours([_start_of(day) + HOUR * hour for day in days for hour in range(24)])
+    return rollup_days(days)
+
+
+def _rollup_month_in_worker(month):
+    try:
+        return _rollup_month(month)
+    finally:
+        # Each worker thread has its own connection
+        connection.close()
+
+
+def months_between(first, last):
+    """``[(year, month), ...]`` from ``first`` to ``last`` inclusive, both ``(year, month)``."""
+    months = []
+    year, month = first
+    while (year, month) <= tuple(last):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def backfill(months, workers=4):
+    """
+    Recompute whole months (daily rows and cube), ``workers`` months at a time.
+
+    Safe to run alongside the incremental job: both upsert the same rows from
+    the order tables.
+
+    Returns:
+        Number of days recomputed
+    """
+    if workers <= 1:
+        return sum(_rollup_month(month) for month in months)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return sum(pool.map(_rollup_month_in_worker, months))
@@ -6,4 +6,6 @@ from . import consumers
 
 websocket_urlpatterns = [
     re_path(r'ws/products/$', consumers.ProductConsumer.as_asgi()),
+    re_path(r'ws/orders/$', consumers.OrderConsumer.as_asgi()),
+    re_path(r'ws/dashboard/$', consumers.DashboardConsumer.as_asgi()),
 ]
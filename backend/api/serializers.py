@@ -1,8 +1,9 @@
 """
 Serializers for ClassyCouture API.
 """
+from django.conf import settings
 from rest_framework import serializers
-from .models import Product, Category, Review, Newsletter
+from .models import Product, Category, Review, Newsletter, ClickEvent
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -60,7 +61,7 @@ class ProductSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'name', 'description', 'price', 'discounted_price',
             'image_url', 'rating', 'review_count', 'featured', 'new_arrival',
-            'inventory', 'sku', 'on_sale', 'discount_percent',
+            'inventory', 'available_inventory', 'sku', 'on_sale', 'discount_percent',
             'is_in_stock', 'category_name', 'created_at', 'updated_at'
         ]
 
@@ -112,3 +113,30 @@ class NewsletterSerializer(serializers.ModelSerializer):
             newsletter.is_active = True
             newsletter.save()
         return newsletter
+
+
+class ClickEventSerializer(serializers.Serializer):
+    """Validates a single clickstream event."""
+    type = serializers.ChoiceField(choices=ClickEvent.EVENT_TYPES)
+    product_id = serializers.IntegerField(required=False, min_value=1, max_value=2**32 - 1)
+    query = serializers.CharField(required=False, allow_blank=True, max_length=200)
+    occurred_at = serializers.DateTimeField(required=False)
+
+    def validate(self, attrs):
+        """Product events need a product, search events need a query."""
+        if attrs['type'] == 'search':
+            if not attrs.get('query'):
+                raise serializers.ValidationError({'query': 'Search events require a query.'})
+        elif not attrs.get('product_id'):
+            raise serializers.ValidationError({'product_id': 'Product events require a product_id.'})
+        return attrs
+
+
+class ClickEventBatchSerializer(serializers.Serializer):
+    """Validates a batch of clickstream events posted by the frontend."""
+    session_id = serializers.CharField(required=False, allow_blank=True, max_length=64, default='')
+    events = serializers.ListField(
+        child=ClickEventSerializer(),
+        allow_empty=False,
+        max_length=settings.CLICKSTREAM_MAX_EVENTS_PER_REQUEST,
+    )
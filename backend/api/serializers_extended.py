@@ -2,11 +2,13 @@
 Extended serializers for ClassyCouture API - Admin, Auth, Orders, User Features.
 """
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth.models import User
 from .models import (
     UserProfile, Banner, Voucher, SalesAnalytics,
     Order, OrderItem, OrderTracking, Refund,
-    Watchlist, Complaint, Referral, Product
+    Watchlist, Complaint, Referral, Product, InventoryHold,
+    ArchivedOrder, ArchivedOrderItem
 )
 
 
@@ -30,8 +32,10 @@ class UserProfileSerializer(serializers.ModelSerializer):
         model = UserProfile
         fields = [
             'id', 'user', 'phone', 'address', 'city', 'country', 'postal_code',
-            'referral_code', 'referral_points', 'total_referrals', 'is_admin'
+            'referral_code', 'referral_points', 'total_referrals', 'is_admin',
+            'order_count', 'lifetime_value', 'first_order_at', 'last_order_at', 'cohort_month'
         ]
+        read_only_fields = ['order_count', 'lifetime_value', 'first_order_at', 'last_order_at', 'cohort_month']
 
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
@@ -86,9 +90,10 @@ class VoucherSerializer(serializers.ModelSerializer):
         model = Voucher
         fields = [
             'id', 'code', 'description', 'discount_type', 'discount_value',
-            'min_purchase', 'max_uses', 'current_uses', 'is_active',
+            'min_purchase', 'max_uses', 'max_uses_per_user', 'current_uses', 'is_active',
             'start_date', 'end_date', 'can_use', 'is_expired'
         ]
+        read_only_fields = ['current_uses']
 
     def get_can_use(self, obj):
         return obj.can_use
@@ -96,6 +101,13 @@ class VoucherSerializer(serializers.ModelSerializer):
     def get_is_expired(self, obj):
         return obj.is_expired
 
+    def update(self, instance, validated_data):
+        # Only write the edited columns: current_uses changes concurrently at checkout
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        instance.save(update_fields=list(validated_data) + ['updated_at'])
+        return instance
+
 
 class SalesAnalyticsSerializer(serializers.ModelSerializer):
     """Sales analytics serializer."""
@@ -159,6 +171,69 @@ class OrderSerializer(serializers.ModelSerializer):
         ]
 
 
+class OrderSummarySerializer(serializers.ModelSerializer):
+    """
+    Flat order representation for list views.
+
+    Expects the queryset to be annotated with ``item_count`` and to
+    select_related ``user`` (see ``OrderViewSet.get_queryset``).
+    """
+    username = serializers.CharField(source='user.username', read_only=True)
+    item_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Order
+        fields = [
+            'id', 'order_id', 'user', 'username', 'total_price', 'discount_amount',
+            'final_price', 'voucher_code', 'status', 'payment_status', 'item_count',
+            'created_at', 'updated_at'
+        ]
+
+
+class ArchivedOrderItemSerializer(serializers.ModelSerializer):
+    """Archived order item serializer."""
+
+    class Meta:
+        model = ArchivedOrderItem
+        fields = ['id', 'product_id', 'product_name', 'quantity', 'price_at_purchase', 'total']
+
+
+class ArchivedOrderSerializer(serializers.ModelSerializer):
+    """Archived order, shaped like ``OrderSerializer`` plus an ``archived`` flag."""
+    items = ArchivedOrderItemSerializer(many=True, read_only=True)
+    username = serializers.CharField(source='user.username', read_only=True, default=None)
+    archived = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ArchivedOrder
+        fields = [
+            'id', 'order_id', 'user', 'username', 'total_price', 'discount_amount',
+            'final_price', 'voucher_code', 'status', 'shipping_address', 'phone',
+            'payment_method', 'payment_status', 'notes', 'items', 'tracking', 'refund',
+            'created_at', 'updated_at', 'archived_at', 'archived'
+        ]
+
+    def get_archived(self, obj):
+        return True
+
+
+class ArchivedOrderSummarySerializer(serializers.ModelSerializer):
+    """Archived order in the ``OrderSummarySerializer`` shape."""
+    username = serializers.CharField(source='user.username', read_only=True, default=None)
+    archived = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ArchivedOrder
+        fields = [
+            'id', 'order_id', 'user', 'username', 'total_price', 'discount_amount',
+            'final_price', 'voucher_code', 'status', 'payment_status', 'item_count',
+            'created_at', 'updated_at', 'archived'
+        ]
+
+    def get_archived(self, obj):
+        return True
+
+
 class OrderCreateSerializer(serializers.ModelSerializer):
     """Serializer for creating orders."""
 
@@ -170,6 +245,65 @@ class OrderCreateSerializer(serializers.ModelSerializer):
         ]
 
 
+class CheckoutItemSerializer(serializers.Serializer):
+    """A single cart line submitted at checkout."""
+    product_id = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1, max_value=100)
+
+
+class CheckoutSerializer(serializers.Serializer):
+    """Checkout request. Prices are always computed server-side."""
+    items = CheckoutItemSerializer(many=True, allow_empty=False, max_length=100)
+    voucher_code = serializers.CharField(required=False, allow_blank=True, max_length=50)
+    shipping_address = serializers.CharField()
+    phone = serializers.CharField(max_length=20)
+    payment_method = serializers.CharField(max_length=50)
+    notes = serializers.CharField(required=False, allow_blank=True, default='')
+
+
+class ShipmentUpdateSerializer(serializers.Serializer):
+    """One warehouse shipment record for the bulk order update endpoint."""
+    order_id = serializers.CharField(max_length=50)
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES, required=False)
+    carrier = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    tracking_number = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    location = serializers.CharField(max_length=200, required=False, allow_blank=True)
+    eta = serializers.DateTimeField(required=False, allow_null=True)
+
+
+# ============================================================================
+# INVENTORY SERIALIZERS
+# ============================================================================
+
+class InventoryHoldSerializer(serializers.ModelSerializer):
+    """Inventory hold serializer."""
+    product_name = serializers.CharField(source='product.name', read_only=True)
+
+    class Meta:
+        model = InventoryHold
+        fields = ['id', 'product', 'product_name', 'quantity', 'status', 'expires_at']
+
+
+class PlaceHoldSerializer(serializers.Serializer):
+    """Request to hold stock for a cart line."""
+    product_id = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1, max_value=settings.INVENTORY_HOLD_MAX_QUANTITY)
+
+
+class CartLineSerializer(serializers.Serializer):
+    """Set a cart line's quantity; 0 removes the line."""
+    product_id = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=0, max_value=settings.CART_MAX_QUANTITY)
+
+
+class CartCheckoutSerializer(serializers.Serializer):
+    """Checkout of the caller's server-side cart."""
+    shipping_address = serializers.CharField()
+    phone = serializers.CharField(max_length=20)
+    payment_method = serializers.CharField(max_length=50)
+    notes = serializers.CharField(required=False, allow_blank=True, default='')
+
+
 # ============================================================================
 # USER FEATURE SERIALIZERS
 # ============================================================================
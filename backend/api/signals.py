@@ -1,100 +1,65 @@
 """
 Django signals for real-time product updates.
-Broadcasts changes to all connected WebSocket clients.
+
+Product changes are handed to the coalescing publisher in ``api.broadcasts``
+once the saving transaction commits; nothing is serialized or sent inside
+``save()``.
 """
+from functools import partial
+
+from django.db import transaction
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-from .models import Product
-from .serializers import ProductSerializer
+from .broadcasts import loaded_topics, product_broadcasts, product_topics
+from .models import Product, Voucher, VoucherCampaign
+from .pricing import invalidate_vouchers
+
+
+@receiver(post_save, sender=Voucher)
+@receiver(post_delete, sender=Voucher)
+@receiver(post_save, sender=VoucherCampaign)
+@receiver(post_delete, sender=VoucherCampaign)
+def voucher_changed(sender, instance, **kwargs):
+    """Drop this worker's compiled voucher rules so edits apply immediately."""
+    invalidate_vouchers()
 
 
 @receiver(post_save, sender=Product)
 def product_updated(sender, instance, created, **kwargs):
     """
     Signal handler for product creation/update.
-    Broadcasts the update to all connected WebSocket clients.
+    Queues a broadcast to the product's topic subscribers after commit (and to
+    the topics it matched as loaded), plus a price change when the saved price
+    differs from the loaded one.
     """
-    channel_layer = get_channel_layer()
-
-    # Serialize the product data
-    serializer = ProductSerializer(instance)
-    product_data = serializer.data
-
-    # Prepare the message
-    message_type = 'product_created' if created else 'product_updated'
-
-    # Broadcast to all clients in the product_updates group
-    if channel_layer:
-        async_to_sync(channel_layer.group_send)(
-            'product_updates',
-            {
-                'type': 'product_update',
-                'data': {
-                    'type': message_type,
-                    'product': product_data,
-                    'is_new_arrival': instance.new_arrival,
-                    'is_featured': instance.featured,
-                    'is_on_sale': instance.on_sale,
-                }
-            }
-        )
-
-    print(f'📢 WebSocket broadcast: {message_type} - {instance.name}')
+    old_topics = loaded_topics(instance)
+    transaction.on_commit(partial(product_broadcasts.product_saved, instance.id, created, old_topics))
+    # Deferred fields stay unloaded: never query for them here
+    loaded_price, price = getattr(instance, '_loaded_price', None), instance.__dict__.get('price')
+    if loaded_price is not None and price is not None and loaded_price != price:
+        broadcast_price_change(instance, loaded_price, price, loaded_topics(instance, False))
+    instance._loaded_price = price
+    instance._loaded_topic_state = instance.topic_state()
 
 
 @receiver(post_delete, sender=Product)
 def product_deleted(sender, instance, **kwargs):
     """
     Signal handler for product deletion.
-    Notifies all connected clients about the deletion.
+    Queues a deletion notice for the product's topic subscribers after commit.
     """
-    channel_layer = get_channel_layer()
+    topics = product_topics(instance)
+    topics += [topic for topic in loaded_topics(instance) if topic not in topics]
+    transaction.on_commit(partial(product_broadcasts.product_deleted, instance.id, instance.name, topics))
 
-    if channel_layer:
-        async_to_sync(channel_layer.group_send)(
-            'product_updates',
-            {
-                'type': 'product_update',
-                'data': {
-                    'type': 'product_deleted',
-                    'product_id': instance.id,
-                    'product_name': instance.name,
-                }
-            }
-        )
 
-    print(f'📢 WebSocket broadcast: product_deleted - {instance.name}')
-
-
-def broadcast_price_change(product, old_price, new_price):
+def broadcast_price_change(product, old_price, new_price, old_topics=()):
     """
     Utility function to broadcast price changes.
     Can be called manually when you want to notify about price drops.
     """
-    channel_layer = get_channel_layer()
-
-    if channel_layer and old_price != new_price:
-        price_dropped = new_price < old_price
-
-        async_to_sync(channel_layer.group_send)(
-            'product_updates',
-            {
-                'type': 'product_update',
-                'data': {
-                    'type': 'price_change',
-                    'product_id': product.id,
-                    'product_name': product.name,
-                    'old_price': float(old_price),
-                    'new_price': float(new_price),
-                    'price_dropped': price_dropped,
-                    'discount_percent': ((old_price - new_price) / old_price * 100) if price_dropped else 0
-                }
-            }
-        )
-
-        print(f'📢 WebSocket broadcast: price_change - {product.name} (${old_price} → ${new_price})')
+    if old_price != new_price:
+        transaction.on_commit(partial(product_broadcasts.price_changed, product, old_price, new_price, old_topics))
 
 
 def broadcast_stock_update(product, old_stock, new_stock):
@@ -102,29 +67,5 @@ def broadcast_stock_update(product, old_stock, new_stock):
     Utility function to broadcast stock changes.
     Notifies clients when products are restocked or running low.
     """
-    channel_layer = get_channel_layer()
-
-    if channel_layer and old_stock != new_stock:
-        restocked = new_stock > old_stock
-        low_stock = new_stock > 0 and new_stock < 10
-        out_of_stock = new_stock == 0
-
-        async_to_sync(channel_layer.group_send)(
-            'product_updates',
-            {
-                'type': 'product_update',
-                'data': {
-                    'type': 'stock_update',
-                    'product_id': product.id,
-                    'product_name': product.name,
-                    'old_stock': old_stock,
-                    'new_stock': new_stock,
-                    'restocked': restocked,
-                    'low_stock': low_stock,
-                    'out_of_stock': out_of_stock,
-                }
-            }
-        )
-
-        status = 'restocked' if restocked else 'low stock' if low_stock else 'out of stock' if out_of_stock else 'updated'
-        print(f'📢 WebSocket broadcast: stock_update - {product.name} ({old_stock} → {new_stock}) [{status}]')
+    if old_stock != new_stock:
+        transaction.on_commit(partial(product_broadcasts.stock_changed, product, old_stock, new_stock))
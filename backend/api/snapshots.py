@@ -0,0 +1,318 @@
+"""
+Columnar analytics snapshots.
+
+``write_snapshot`` exports a star schema for offline analysis, so analysts
+stop running joins against the production database:
+
+- ``order_items``: one fact row per order item (order id, order time, customer,
+  product, status code, quantity, line revenue in cents)
+- ``products``: product id, category id, list price in cents
+- ``categories``: category id and name
+- ``customers``: user id and signup time
+
+Each table is one ``<table>.npz`` file with a NumPy array per column (or one
+``<table>.parquet`` file if pyarrow is installed and asked for). Rows are
+read in keyset chunks and each chunk is appended to per-column spill files
+(or written as a Parquet row group), so memory use is bounded by the chunk
+size, not the snapshot size. Times are ``datetime64[s]`` in UTC and money is
+``int64`` cents.
+
+The KPI helpers below work on a loaded snapshot with vectorized NumPy only::
+
+    snapshot = snapshots.load('/data/snapshot-20250101')
+    categories, months, revenue = snapshots.revenue_by_category_month(snapshot)
+"""
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import timezone as dt_timezone
+
+import numpy as np
+from django.contrib.auth.models import User
+
+from .models import ArchivedOrderItem, Category, Order, OrderItem, Product
+
+FORMATS = ('npz', 'parquet')
+STATUSES = tuple(value for value, _ in Order.STATUS_CHOICES)
+STATUS_CODES = {value: code for code, value in enumerate(STATUSES)}
+
+ORDER_ITEM_COLUMNS = (
+    ('order_id', np.int64),
+    ('created_at', 'datetime64[s]'),
+    ('user_id', np.int64),
+    ('product_id', np.int64),
+    ('status', np.int8),
+    ('quantity', np.int32),
+    ('revenue_cents', np.int64),
+)
+PRODUCT_COLUMNS = (('product_id', np.int64), ('category_id', np.int64), ('price_cents', np.int64))
+CATEGORY_COLUMNS = (('category_id', np.int64), ('name', '<U100'))
+CUSTOMER_COLUMNS = (('user_id', np.int64), ('date_joined', 'datetime64[s]'))
+
+
+def _cents(amount):
+    return int(amount * 100) if amount is not None else 0
+
+
+def _seconds(moment):
+    if moment is None:
+        return np.datetime64('NaT')
+    return np.datetime64(moment.astimezone(dt_timezone.utc).replace(tzinfo=None), 's')
+
+
+def _keyset(queryset, fields, chunk_size):
+    """Yield lists of ``values_list('id', *fields)`` rows, ``chunk_size`` at a time, in id order."""
+    last_id = 0
+    queryset = queryset.order_by('id')
+    while True:
+        rows = list(queryset.filter(id__gt=last_id).values_list('id', *fields)[:chunk_size])
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield rows
+
+
+class _NpzWriter:
+    """
+    Appends chunks to per-column spill files, then packs them into one ``.npz``.
+
+    ``labels`` are small ``{name: [str]}`` lookup arrays stored alongside.
+    """
+
+    def __init__(self, path, columns, spill_dir, labels=None):
+        self.path = path
+        self.labels = labels or {}
+        self.columns = [(name, np.dtype(dtype)) for name, dtype in columns]
+        self.spills = {name: open(os.path.join(spill_dir, f'{os.path.basename(path)}.{name}'), 'w+b')
+                       for name, _ in self.columns}
+        self.rows = 0
+
+    def write(self, arrays):
+        for name, dtype in self.columns:
+            np.asarray(arrays[name], dtype=dtype).tofile(self.spills[name])
+        self.rows += len(arrays[self.columns[0][0]])
+
+    def close(self):
+        with zipfile.ZipFile(self.path, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+            for name, dtype in self.columns:
+                spill = self.spills[name]
+                spill.seek(0)
+                with archive.open(f'{name}.npy', 'w', force_zip64=True) as member:
+                    np.lib.format.write_array_header_1_0(member, {
+                        'descr': np.lib.format.dtype_to_descr(dtype),
+                        'fortran_order': False,
+                        'shape': (self.rows,),
+                    })
+                    shutil.copyfileobj(spill, member)
+                spill.close()
+            for name, values in self.labels.items():
+                with archive.open(f'{name}.npy', 'w') as member:
+                    np.lib.format.write_array(member, np.array(values), allow_pickle=False)
+
+
+class _ParquetWriter:
+    """Writes each chunk as a Parquet row group; ``labels`` go in the schema metadata."""
+
+    def __init__(self, path, columns, spill_dir, labels=None):
+        import pyarrow
+        import pyarrow.parquet
+
+        self.pyarrow = pyarrow
+        self.columns = [(name, np.dtype(dtype)) for name, dtype in columns]
+        schema = pyarrow.schema([
+            (name, pyarrow.string() if dtype.kind == 'U' else pyarrow.from_numpy_dtype(dtype))
+            for name, dtype in self.columns
+        ]).with_metadata({name: ','.join(values) for name, values in (labels or {}).items()})
+        self.writer = pyarrow.parquet.ParquetWriter(path, schema, compression='zstd')
+        self.rows = 0
+
+    def write(self, arrays):
+        self.writer.write_table(self.pyarrow.table({
+            name: np.asarray(arrays[name], dtype=dtype) for name, dtype in self.columns
+        }))
+        self.rows += len(arrays[self.columns[0][0]])
+
+    def close(self):
+        self.writer.close()
+
+
+def _writer(output_dir, table, columns, output_format, spill_dir, labels=None):
+    path = os.path.join(output_dir, f'{table}.{output_format}')
+    if output_format == 'parquet':
+        return _ParquetWriter(path, columns, spill_dir, labels)
+    return _NpzWriter(path, columns, spill_dir, labels)
+
+
+def _order_item_chunks(include_archived, chunk_size):
+    sources = [(OrderItem.objects.all(), 'order__created_at')]
+    if include_archived:
+        sources.append((ArchivedOrderItem.objects.all(), 'order_created_at'))
+    for queryset, created_at in sources:
+        fields = ('order_id', created_at, 'order__user_id', 'product_id', 'order__status', 'quantity', 'total')
+        for rows in _keyset(queryset, fields, chunk_size):
+            yield {
+                'order_id': [row[1] for row in rows],
+                'created_at': [_seconds(row[2]) for row in rows],
+                'user_id': [row[3] for row in rows],
+                'product_id': [row[4] if row[4] is not None else -1 for row in rows],
+                'status': [STATUS_CODES.get(row[5], -1) for row in rows],
+                'quantity': [row[6] for row in rows],
+                'revenue_cents': [_cents(row[7]) for row in rows],
+            }
+
+
+def _dimension_chunks(queryset, fields, convert, chunk_size):
+    for rows in _keyset(queryset, fields, chunk_size):
+        yield convert(rows)
+
+
+def write_snapshot(output_dir, output_format='npz', include_archived=False, chunk_size=50000):
+    """
+    Write a star-schema snapshot to ``output_dir``.
+
+    Returns:
+        ``{table: rows}``
+    """
+    if output_format not in FORMATS:
+        raise ValueError(f'Unknown format: {output_format}')
+    os.makedirs(output_dir, exist_ok=True)
+
+    tables = (
+        ('order_items', ORDER_ITEM_COLUMNS, _order_item_chunks(include_archived, chunk_size)),
+        ('products', PRODUCT_COLUMNS, _dimension_chunks(
+            Product.objects.all(), ('category_id', 'price'),
+            lambda rows: {
+                'product_id': [row[0] for row in rows],
+                'category_id': [row[1] for row in rows],
+                'price_cents': [_cents(row[2]) for row in rows],
+            },
+            chunk_size,
+        )),
+        ('categories', CATEGORY_COLUMNS, _dimension_chunks(
+            Category.objects.all(), ('name',),
+            lambda rows: {'category_id': [row[0] for row in rows], 'name': [row[1] for row in rows]},
+            chunk_size,
+        )),
+        ('customers', CUSTOMER_COLUMNS, _dimension_chunks(
+            User.objects.all(), ('date_joined',),
+            lambda rows: {'user_id': [row[0] for row in rows], 'date_joined': [_seconds(row[1]) for row in rows]},
+            chunk_size,
+        )),
+    )
+    counts = {}
+    with tempfile.TemporaryDirectory(dir=output_dir) as spill_dir:
+        for table, columns, chunks in tables:
+            labels = {'status_labels': STATUSES} if table == 'order_items' else None
+            writer = _writer(output_dir, table, columns, output_format, spill_dir, labels)
+            for arrays in chunks:
+                writer.write(arrays)
+            writer.close()
+            counts[table] = writer.rows
+    return counts
+
+
+# ----------------------------------------------------------------------------
+# KPI helpers (NumPy only, no database access)
+# ----------------------------------------------------------------------------
+
+def load(snapshot_dir):
+    """Load an ``npz`` snapshot as ``{table: {column: array}}``."""
+    snapshot = {}
+    for table in ('order_items', 'products', 'categories', 'customers'):
+        with np.load(os.path.join(snapshot_dir, f'{table}.npz'), allow_pickle=False) as data:
+            snapshot[table] = {name: data[name] for name in data.files}
+    return snapshot
+
+
+def _counted(facts, exclude_statuses):
+    labels = list(facts['status_labels'])
+    excluded = [labels.index(status) for status in exclude_statuses if status in labels]
+    return ~np.isin(facts['status'], excluded)
+
+
+def revenue_by_category_month(snapshot, exclude_statuses=('cancelled',)):
+    """
+    Revenue per category and calendar month.
+
+    Returns:
+        Tuple of (category_ids, months, revenue) where ``revenue[i, j]`` is the
+        revenue in cents of category ``category_ids[i]`` in ``months[j]``
+        (``datetime64[M]``); items of unknown products are left out
+    """
+    facts = snapshot['order_items']
+    products = snapshot['products']
+    keep = _counted(facts, exclude_statuses)
+    product_ids = facts['product_id'][keep]
+
+    # Fact -> product dimension join: products are sorted by id
+    position = np.searchsorted(products['product_id'], product_ids)
+    position = np.minimum(position, len(products['product_id']) - 1)
+    known = products['product_id'][position] == product_ids if len(products['product_id']) else np.zeros(0, bool)
+
+    categories = products['category_id'][position[known]]
+    months = facts['created_at'][keep][known].astype('datetime64[M]')
+    revenue = facts['revenue_cents'][keep][known]
+
+    category_ids, category_index = np.unique(categories, return_inverse=True)
+    month_values, month_index = np.unique(months, return_inverse=True)
+    table = np.zeros((len(category_ids), len(month_values)), dtype=np.int64)
+    np.add.at(table, (category_index, month_index), revenue)
+    return category_ids, month_values, table
+
+
+def cohort_activity(users, months, amounts=None):
+    """
+    Group activity by first-order cohort and months since.
+
+    Args:
+        users: User id per order (or item)
+        months: ``datetime64[M]`` per order
+        amounts: Optional revenue per order, summed per cell
+
+    Returns:
+        Tuple of (cohorts, active, revenue): ``active[i, k]`` is the number of
+        customers first ordering in ``cohorts[i]`` who ordered ``k`` months
+        later, ``revenue[i, k]`` their spend then (None without ``amounts``)
+    """
+    months = months.astype('datetime64[M]').astype(np.int64)
+    if not len(users):
+        empty = np.zeros((0, 0), dtype=np.int64)
+        return np.array([], dtype='datetime64[M]'), empty, empty if amounts is not None else None
+
+    # First month per user, broadcast back to every row
+    order = np.lexsort((months, users))
+    users, months = users[order], months[order]
+    starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]])
+    first_month = np.repeat(months[starts], np.diff(np.r_[starts, len(users)]))
+    offset = months - first_month
+
+    cohort_values, cohort_index = np.unique(first_month, return_inverse=True)
+    shape = (len(cohort_values), int(offset.max()) + 1)
+    # Distinct (user, month) pairs count once towards activity
+    distinct = np.r_[True, (users[1:] != users[:-1]) | (months[1:] != months[:-1])]
+    active = np.zeros(shape, dtype=np.int64)
+    np.add.at(active, (cohort_index[distinct], offset[distinct]), 1)
+
+    revenue = None
+    if amounts is not None:
+        revenue = np.zeros(shape, dtype=np.int64)
+        np.add.at(revenue, (cohort_index, offset), amounts[order])
+    return cohort_values.astype('datetime64[M]'), active, revenue
+
+
+def cohort_retention(snapshot, exclude_statuses=('cancelled',)):
+    """
+    Monthly cohort retention by first order month.
+
+    Returns:
+        Tuple of (cohorts, sizes, retention) where ``retention[i, k]`` is the
+        share of customers whose first order was in ``cohorts[i]``
+        (``datetime64[M]``) who ordered again ``k`` months later
+        (``retention[:, 0]`` is 1)
+    """
+    facts = snapshot['order_items']
+    keep = _counted(facts, exclude_statuses)
+    cohorts, active, _ = cohort_activity(facts['user_id'][keep], facts['created_at'][keep])
+    sizes = active[:, 0] if len(cohorts) else np.array([], dtype=np.int64)
+    return cohorts, sizes, active / sizes[:, None] if len(cohorts) else np.zeros((0, 0))
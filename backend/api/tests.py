@@ -1,11 +1,53 @@
 """
 Tests for ClassyCouture API.
 """
-from django.test import TestCase, Client
+from django.test import AsyncClient, TestCase, TransactionTestCase, Client, override_settings
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
-from .models import Category, Product, Review, Newsletter
-from datetime import datetime
+from django.contrib.admin import site as admin_site
+from django.contrib.auth.models import AnonymousUser, User
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core import mail
+from django.core.exceptions import ValidationError
+from django.core.cache import cache
+from django.core.management import call_command
+from . import cart as carts
+from . import (
+    archive, customer_stats, experiments, fulfillment, inventory, live_sales, outbox, pricing, recently_viewed,
+    rollups, sketches, snapshots, vouchers
+)
+from .models import (
+    Category, Product, Review, Newsletter, ClickEvent, CoViewCount, Complaint,
+    Experiment, ExperimentEvent, ExperimentResult, Voucher, Order, OrderItem,
+    InventoryHold, InventoryStripe, Cart, UserProfile, OrderTracking, Refund, OutboxEvent,
+    ArchivedOrder, ArchivedOrderItem, VoucherRedemption, VoucherCampaign, VoucherCode, SalesAnalytics,
+    CustomerCohort, DailySketch
+)
+from .admin import VoucherAdmin
+from .broadcasts import ListingSnapshots, listings, product_broadcasts
+from .checkout import CheckoutError, checkout
+from .clickstream import event_buffer
+from .routing import websocket_urlpatterns
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from decimal import Decimal
+from django.utils import timezone
+from io import StringIO
+from unittest import skipUnless
+import asyncio
+import json
+import tempfile
+
+import numpy as np
+
+# Socket tests must not depend on a running Redis
+IN_MEMORY_CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
 
 
 class ProductAPITestCase(TestCase):
@@ -190,3 +232,1699 @@ class NewsletterAPITestCase(TestCase):
             content_type='application/json'
         )
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(BUFFERED_WRITES_BACKGROUND=False)
+class ClickstreamAPITestCase(TestCase):
+    """Test clickstream event ingestion."""
+
+    def setUp(self):
+        """Set up test client."""
+        self.client = Client()
+        event_buffer.flush()
+
+    def test_events_are_buffered_then_flushed(self):
+        """Test events are accepted without a synchronous insert."""
+        response = self.client.post(
+            '/api/events/',
+            {
+                'session_id': 'abc123',
+                'events': [
+                    {'type': 'view', 'product_id': 1},
+                    {'type': 'add_to_cart', 'product_id': 1},
+                    {'type': 'search', 'query': 'blazer'},
+                ]
+            },
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.json()['accepted'], 3)
+        self.assertEqual(ClickEvent.objects.count(), 0)
+
+        self.assertEqual(event_buffer.flush(), 3)
+        self.assertEqual(ClickEvent.objects.filter(session_id='abc123').count(), 3)
+
+    def test_invalid_event_rejected(self):
+        """Test product events without a product id are rejected."""
+        response = self.client.post(
+            '/api/events/',
+            {'events': [{'type': 'view'}]},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(event_buffer.pending_count(), 0)
+
+    def test_product_id_beyond_recently_viewed_range_rejected(self):
+        """Test product ids that do not fit the recently-viewed array are rejected."""
+        response = self.client.post(
+            '/api/events/',
+            {'session_id': 'abc123', 'events': [{'type': 'view', 'product_id': 2**32}]},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(event_buffer.pending_count(), 0)
+
+
+@override_settings(BUFFERED_WRITES_BACKGROUND=False)
+class CoViewRecommendationTestCase(TestCase):
+    """Test session co-view recommendations."""
+
+    def setUp(self):
+        """Set up catalog and clear session tails."""
+        cache.clear()
+        event_buffer.flush()
+        self.client = Client()
+        category = Category.objects.create(name='Co-view', image_url='https://example.com/c.jpg')
+        self.products = [
+            Product.objects.create(
+                name=f'Product {i}', price=10, inventory=5,
+                image_url='https://example.com/p.jpg', category=category
+            )
+            for i in range(3)
+        ]
+
+    def post_views(self, session_id, products):
+        self.client.post(
+            '/api/events/',
+            {'session_id': session_id, 'events': [{'type': 'view', 'product_id': p.id} for p in products]},
+            content_type='application/json'
+        )
+
+    def test_counts_accumulate_across_batches(self):
+        """Test pairs are counted within and across flushed batches."""
+        a, b, c = self.products
+        self.post_views('s1', [a, b])
+        event_buffer.flush()
+        self.post_views('s1', [c])
+        self.post_views('s2', [a, b])
+        event_buffer.flush()
+
+        counts = {
+            (row.product_id, row.other_product_id): row.count
+            for row in CoViewCount.objects.all()
+        }
+        self.assertEqual(counts[(a.id, b.id)], 2)
+        self.assertEqual(counts[(b.id, a.id)], 2)
+        self.assertEqual(counts[(c.id, a.id)], 1)
+
+    def test_viewed_together_endpoint(self):
+        """Test anonymous lookup by recently viewed ids."""
+        a, b, c = self.products
+        self.post_views('s1', [a, b])
+        self.post_views('s2', [a, b, c])
+        event_buffer.flush()
+
+        response = self.client.get(f'/api/recommendations/viewed-together/?ids={a.id}&limit=2')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        ids = [p['id'] for p in response.json()['data']]
+        self.assertEqual(ids, [b.id, c.id])
+
+
+@override_settings(BUFFERED_WRITES_BACKGROUND=False, RECENTLY_VIEWED_SIZE=3)
+class RecentlyViewedTestCase(TestCase):
+    """Test the recently-viewed ring buffer."""
+
+    def setUp(self):
+        """Set up a user and catalog."""
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username='viewer', password='secret123')
+        category = Category.objects.create(name='Recent', image_url='https://example.com/c.jpg')
+        self.products = [
+            Product.objects.create(
+                name=f'Product {i}', price=10, inventory=5,
+                image_url='https://example.com/p.jpg', category=category
+            )
+            for i in range(4)
+        ]
+
+    def tearDown(self):
+        event_buffer.flush()
+
+    def test_ring_dedupes_and_truncates(self):
+        """Test re-views move to the front and the oldest entries fall off."""
+        self.assertEqual(recently_viewed.push([1, 2, 3, 2, 4], session_id='s1'), [4, 2, 3])
+        self.assertEqual(recently_viewed.get_recent(session_id='s1'), [4, 2, 3])
+        self.assertEqual(len(cache.get('rv:s:s1')), 12)
+
+    def test_recently_viewed_endpoint(self):
+        """Test views posted as events are returned hydrated, most recent first."""
+        self.client.force_login(self.user)
+        a, b, c, d = self.products
+        self.client.post(
+            '/api/events/',
+            {'events': [{'type': 'view', 'product_id': p.id} for p in (a, b, c, d)]},
+            content_type='application/json'
+        )
+        response = self.client.get('/api/profile/recently_viewed/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([p['id'] for p in response.json()['data']], [d.id, c.id, b.id])
+
+        response = self.client.get(f'/api/recommendations/you-may-also-like/{a.id}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn(a.id, [p['id'] for p in response.json()['data']])
+
+
+@override_settings(BUFFERED_WRITES_BACKGROUND=False)
+class ExperimentTestCase(TestCase):
+    """Test A/B assignment, logging and aggregation."""
+
+    def setUp(self):
+        """Set up a running ranking experiment."""
+        self.client = Client()
+        Experiment.objects.create(
+            key='recommendation_ranking',
+            variants={'control': 50, 'rating_first': 50},
+        )
+        experiments.reload_config()
+
+    def tearDown(self):
+        experiments.event_writer.flush()
+        experiments.reload_config()
+
+    def test_assignment_is_deterministic_and_balanced(self):
+        """Test the same unit always gets the same variant and traffic splits evenly."""
+        first = [experiments.assign('recommendation_ranking', f's:{i}') for i in range(2000)]
+        second = [experiments.assign('recommendation_ranking', f's:{i}') for i in range(2000)]
+        self.assertEqual(first, second)
+        self.assertAlmostEqual(first.count('control') / 2000, 0.5, delta=0.05)
+        self.assertIsNone(experiments.assign('unknown', 's:1'))
+
+    def test_exposures_logged_and_aggregated(self):
+        """Test recommendation requests log exposures that the batch job rolls up."""
+        category = Category.objects.create(name='Exp', image_url='https://example.com/c.jpg')
+        product = Product.objects.create(
+            name='Exp Product', price=10, inventory=5,
+            image_url='https://example.com/p.jpg', category=category
+        )
+        for i in range(3):
+            response = self.client.get(
+                f'/api/recommendations/similar/{product.id}/',
+                HTTP_X_SESSION_ID=f'session-{i}'
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(ExperimentEvent.objects.count(), 0)
+
+        experiments.event_writer.flush()
+        call_command('aggregate_experiments', stdout=StringIO())
+        results = ExperimentResult.objects.filter(experiment_key='recommendation_ranking')
+        self.assertEqual(sum(r.exposed_units for r in results), 3)
+
+    def test_conversions_only_count_exposed_units(self):
+        """Test conversions of units never exposed to the experiment are not counted."""
+        experiments.expose('recommendation_ranking', 's:seen')
+        experiments.log_conversion('s:seen', value=Decimal('20.00'))
+        for i in range(3):
+            experiments.log_conversion(f's:unseen-{i}', value=Decimal('5.00'))
+        experiments.event_writer.flush()
+        call_command('aggregate_experiments', stdout=StringIO())
+        results = ExperimentResult.objects.filter(experiment_key='recommendation_ranking')
+        self.assertEqual(sum(r.converted_units for r in results), 1)
+        self.assertEqual(sum(r.revenue for r in results), Decimal('20.00'))
+        self.assertTrue(all(r.conversion_rate <= 1 for r in results))
+
+    def test_invalid_variants_rejected_and_skipped(self):
+        """Test bad variant weights fail validation and do not break running experiments."""
+        for variants in ({}, [1, 2], {'control': 'fifty'}, {'control': -1, 'b': 2}, {'control': 0}):
+            with self.assertRaises(ValidationError):
+                Experiment(key='bad', variants=variants).full_clean()
+        Experiment.objects.create(key='broken', variants={'control': 'fifty'})
+        experiments.reload_config()
+        self.assertIsNone(experiments.assign('broken', 's:1'))
+        self.assertIsNotNone(experiments.assign('recommendation_ranking', 's:1'))
+
+
+class CheckoutAPITestCase(TestCase):
+    """Test the atomic checkout endpoint."""
+
+    def setUp(self):
+        """Set up a user, products and a voucher."""
+        self.client = Client()
+        self.user = User.objects.create_user(username='buyer', password='secret123')
+        self.client.force_login(self.user)
+        category = Category.objects.create(name='Checkout', image_url='https://example.com/c.jpg')
+        self.shirt = Product.objects.create(
+            name='Shirt', price=Decimal('40.00'), inventory=5,
+            image_url='https://example.com/p.jpg', category=category
+        )
+        self.scarf = Product.objects.create(
+            name='Scarf', price=Decimal('20.00'), inventory=1, on_sale=True, discount_percent=50,
+            image_url='https://example.com/p.jpg', category=category
+        )
+        self.voucher = Voucher.objects.create(
+            code='SAVE10', discount_type='percentage', discount_value=10, max_uses=1,
+            start_date=timezone.now() - timedelta(days=1),
+            end_date=timezone.now() + timedelta(days=1)
+        )
+
+    def post_checkout(self, items, **extra):
+        return self.client.post(
+            '/api/orders/checkout/',
+            {
+                'items': items,
+                'shipping_address': '1 Main St',
+                'phone': '555',
+                'payment_method': 'card',
+                'total_price': '0.01',
+                **extra
+            },
+            content_type='application/json'
+        )
+
+    def test_checkout_prices_server_side_and_decrements_stock(self):
+        """Test totals are computed on the server and stock is decremented."""
+        response = self.post_checkout(
+            [{'product_id': self.shirt.id, 'quantity': 2}, {'product_id': self.scarf.id, 'quantity': 1}],
+            voucher_code='SAVE10'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        data = response.json()['data']
+        self.assertEqual(Decimal(data['total_price']), Decimal('90.00'))
+        self.assertEqual(Decimal(data['discount_amount']), Decimal('9.00'))
+        self.assertEqual(Decimal(data['final_price']), Decimal('81.00'))
+        self.assertEqual(len(data['items']), 2)
+
+        self.shirt.refresh_from_db()
+        self.voucher.refresh_from_db()
+        self.assertEqual(self.shirt.inventory, 3)
+        self.assertEqual(self.voucher.current_uses, 1)
+        redemption = VoucherRedemption.objects.get(voucher=self.voucher)
+        self.assertEqual((redemption.user, redemption.order_id), (self.user, data['id']))
+
+    def test_insufficient_stock_rolls_back(self):
+        """Test a failed decrement leaves no order, items or stock changes."""
+        response = self.post_checkout(
+            [{'product_id': self.shirt.id, 'quantity': 1}, {'product_id': self.scarf.id, 'quantity': 2}]
+        )
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.json()['code'], 'out_of_stock')
+        self.assertEqual(Order.objects.count(), 0)
+        self.assertEqual(OrderItem.objects.count(), 0)
+        self.shirt.refresh_from_db()
+        self.assertEqual(self.shirt.inventory, 5)
+
+    def test_voucher_minimum_purchase(self):
+        """Test vouchers are validated against the server-side subtotal."""
+        self.voucher.min_purchase = 100
+        self.voucher.save()
+        response = self.post_checkout([{'product_id': self.shirt.id, 'quantity': 1}], voucher_code='SAVE10')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json()['code'], 'voucher_min_purchase')
+
+    def test_cancel_gives_back_stock_and_voucher_use(self):
+        """Test cancelling returns the stock and the voucher use taken at checkout, once."""
+        UserProfile.objects.create(user=self.user, referral_code='BUY1')
+        response = self.post_checkout(
+            [{'product_id': self.shirt.id, 'quantity': 2}, {'product_id': self.scarf.id, 'quantity': 1}],
+            voucher_code='SAVE10'
+        )
+        order_id = response.json()['data']['id']
+        for expected in (status.HTTP_200_OK, status.HTTP_400_BAD_REQUEST):
+            self.assertEqual(self.client.post(f'/api/orders/{order_id}/cancel/').status_code, expected)
+
+        self.shirt.refresh_from_db()
+        self.scarf.refresh_from_db()
+        self.voucher.refresh_from_db()
+        self.assertEqual((self.shirt.inventory, self.scarf.inventory), (5, 1))
+        self.assertEqual(self.voucher.current_uses, 0)
+        self.assertFalse(VoucherRedemption.objects.filter(voucher=self.voucher).exists())
+
+    def test_bulk_cancel_restocks_hot_skus(self):
+        """Test warehouse cancellations return stock, to the stripes for hot SKUs."""
+        inventory.enable_hot_mode(self.shirt.id, 2)
+        response = self.post_checkout([{'product_id': self.shirt.id, 'quantity': 3}])
+        order = Order.objects.get(id=response.json()['data']['id'])
+        self.assertEqual(fulfillment.apply_shipment_updates([{'order_id': order.order_id, 'status': 'cancelled'}]), {})
+        self.assertEqual(
+            fulfillment.apply_shipment_updates([{'order_id': order.order_id, 'status': 'cancelled'}]), {}
+        )
+        self.shirt.refresh_from_db()
+        self.assertEqual(self.shirt.inventory, 5)
+        self.assertEqual(sum(InventoryStripe.objects.filter(product=self.shirt).values_list('quantity', flat=True)), 5)
+
+
+class VoucherRedemptionTestCase(TestCase):
+    """Test atomic voucher redemption and cached validation."""
+
+    def setUp(self):
+        """Set up two users and a voucher with two uses, one per user."""
+        self.alice = User.objects.create_user(username='alice')
+        self.bob = User.objects.create_user(username='bob')
+        self.voucher = Voucher.objects.create(
+            code='TWICE', discount_type='fixed', discount_value=5, max_uses=2, max_uses_per_user=1,
+            start_date=timezone.now() - timedelta(days=1),
+            end_date=timezone.now() + timedelta(days=1)
+        )
+
+    def test_redeem_stops_at_max_uses(self):
+        """Test uses beyond max_uses are refused and not counted."""
+        carol = User.objects.create_user(username='carol')
+        vouchers.redeem(self.voucher.id, self.alice)
+        vouchers.redeem(self.voucher.id, self.bob)
+        with self.assertRaises(vouchers.VoucherError):
+            vouchers.redeem(self.voucher.id, carol)
+        self.voucher.refresh_from_db()
+        self.assertEqual(self.voucher.current_uses, 2)
+        self.assertEqual(VoucherRedemption.objects.filter(voucher=self.voucher).count(), 2)
+
+    def test_per_user_limit_gives_the_use_back(self):
+        """Test a second use by the same user is refused without consuming a use."""
+        vouchers.redeem(self.voucher.id, self.alice, max_uses_per_user=1)
+        with self.assertRaises(vouchers.VoucherError) as caught:
+            vouchers.redeem(self.voucher.id, self.alice, max_uses_per_user=1)
+        self.assertEqual(caught.exception.code, 'voucher_used')
+        self.voucher.refresh_from_db()
+        self.assertEqual(self.voucher.current_uses, 1)
+
+    def test_validate_code_uses_cached_rules(self):
+        """Test anyone can validate a code and repeat checks skip the database."""
+        pricing.invalidate_vouchers()
+        client = Client()
+        response = client.post('/api/vouchers/validate_code/', {'code': 'TWICE'}, content_type='application/json')
+        self.assertTrue(response.json()['valid'])
+        with self.assertNumQueries(0):
+            vouchers.validate('TWICE')
+        response = client.post('/api/vouchers/validate_code/', {'code': 'NOPE'}, content_type='application/json')
+        self.assertEqual(response.json()['code'], 'voucher_not_found')
+
+    def test_admin_edit_keeps_concurrent_uses(self):
+        """Test saving a stale voucher in the admin does not reset current_uses."""
+        stale = Voucher.objects.get(id=self.voucher.id)
+        vouchers.redeem(self.voucher.id, self.alice)
+        vouchers.redeem(self.voucher.id, self.bob)
+        stale.description = 'Two uses only'
+        VoucherAdmin(Voucher, admin_site).save_model(None, stale, None, change=True)
+        self.voucher.refresh_from_db()
+        self.assertEqual(self.voucher.current_uses, 2)
+        self.assertEqual(self.voucher.description, 'Two uses only')
+
+
+class VoucherCampaignTestCase(TestCase):
+    """Test bulk campaign code generation, lookup and single use."""
+
+    def setUp(self):
+        """Set up a campaign and a product."""
+        self.campaign = VoucherCampaign.objects.create(
+            name='Spring', code_prefix='SPR', discount_type='fixed', discount_value=5,
+            start_date=timezone.now() - timedelta(days=1),
+            end_date=timezone.now() + timedelta(days=1)
+        )
+        category = Category.objects.create(name='Codes', image_url='https://example.com/c.jpg')
+        self.product = Product.objects.create(
+            name='Hat', price=Decimal('30.00'), inventory=5,
+            image_url='https://example.com/p.jpg', category=category
+        )
+
+    def test_generate_command(self):
+        """Test the command writes the requested number of unique prefixed codes."""
+        out = StringIO()
+        call_command('generate_voucher_codes', self.campaign.id, count=2500, batch_size=1000, stdout=out)
+        self.assertIn('codes/s', out.getvalue())
+        codes = list(VoucherCode.objects.values_list('code', flat=True))
+        self.assertEqual(len(codes), 2500)
+        self.assertEqual(len(set(codes)), 2500)
+        self.assertTrue(all(code.startswith('SPR') and len(code) == 15 for code in codes))
+
+    def test_code_lookup_and_single_use(self):
+        """Test a code is found with one indexed query and can be used once."""
+        code = VoucherCode.objects.create(code='SPRTESTCODE', campaign=self.campaign)
+        user = User.objects.create_user(username='shopper')
+        pricing.invalidate_vouchers()
+        pricing.compiled_voucher('SPRTESTCODE')
+        with self.assertNumQueries(1):
+            compiled = pricing.compiled_voucher('SPRTESTCODE')
+        self.assertEqual((compiled.code_id, compiled.campaign_id), (code.id, self.campaign.id))
+
+        items = [{'product_id': self.product.id, 'quantity': 1}]
+        order = checkout(user, items, 'x', '1', 'card', voucher_code='SPRTESTCODE')
+        self.assertEqual(order.final_price, Decimal('25.00'))
+        code.refresh_from_db()
+        self.assertEqual((code.redeemed_by, code.order_id), (user, order.id))
+        with self.assertRaises(CheckoutError):
+            checkout(user, items, 'x', '1', 'card', voucher_code='SPRTESTCODE')
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs concurrent writers')
+class VoucherConcurrencyTestCase(TransactionTestCase):
+    """Test parallel redemptions never overshoot max_uses."""
+
+    def test_parallel_redemptions(self):
+        """Test 300 concurrent redemptions of a 100-use voucher take exactly 100 uses."""
+        voucher = Voucher.objects.create(
+            code='RUSH', discount_type='percentage', discount_value=10, max_uses=100,
+            start_date=timezone.now() - timedelta(days=1),
+            end_date=timezone.now() + timedelta(days=1)
+        )
+        users = User.objects.bulk_create([User(username=f'rush{index}') for index in range(300)])
+
+        def attempt(user):
+            try:
+                vouchers.redeem(voucher.id, user)
+                return True
+            except vouchers.VoucherError:
+                return False
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            results = list(pool.map(attempt, users))
+
+        voucher.refresh_from_db()
+        self.assertEqual(sum(results), 100)
+        self.assertEqual(voucher.current_uses, 100)
+        self.assertEqual(VoucherRedemption.objects.filter(voucher=voucher).count(), 100)
+
+
+class InventoryHoldTestCase(TestCase):
+    """Test cart inventory holds."""
+
+    def setUp(self):
+        """Set up a scarce product."""
+        self.client = Client()
+        category = Category.objects.create(name='Drop', image_url='https://example.com/c.jpg')
+        self.product = Product.objects.create(
+            name='Limited Sneaker', price=Decimal('100.00'), inventory=3,
+            image_url='https://example.com/p.jpg', category=category
+        )
+
+    def place(self, session_id, quantity):
+        return self.client.post(
+            '/api/holds/place/',
+            {'product_id': self.product.id, 'quantity': quantity},
+            content_type='application/json',
+            HTTP_X_SESSION_ID=session_id
+        )
+
+    def test_holds_reserve_available_stock(self):
+        """Test holds reduce availability and cannot exceed stock."""
+        self.assertEqual(self.place('alice', 2).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.place('bob', 2).status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.place('bob', 1).status_code, status.HTTP_201_CREATED)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved, 3)
+        self.assertFalse(self.product.is_in_stock)
+
+        # Resizing a hold only reserves the difference
+        self.assertEqual(self.place('alice', 1).status_code, status.HTTP_201_CREATED)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved, 2)
+
+    def test_checkout_converts_own_hold(self):
+        """Test checkout can sell held units to the holder but not to others."""
+        self.place('alice', 3)
+        buyer = User.objects.create_user(username='alice', password='secret123')
+        self.client.force_login(buyer)
+        order_data = {
+            'items': [{'product_id': self.product.id, 'quantity': 2}],
+            'shipping_address': '1 Main St', 'phone': '555', 'payment_method': 'card'
+        }
+
+        response = self.client.post('/api/orders/checkout/', order_data, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        response = self.client.post(
+            '/api/orders/checkout/', order_data, content_type='application/json', HTTP_X_SESSION_ID='alice'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.inventory, self.product.reserved), (1, 0))
+        self.assertEqual(InventoryHold.objects.get().status, 'converted')
+
+    def test_sweeper_releases_expired_holds(self):
+        """Test expired holds are released and stock becomes available again."""
+        self.place('alice', 2)
+        self.place('bob', 1)
+        InventoryHold.objects.filter(owner_key='s:alice').update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        call_command('release_expired_holds', stdout=StringIO())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved, 1)
+        self.assertEqual(InventoryHold.objects.get(owner_key='s:alice').status, 'released')
+
+
+class HotSkuStripeTestCase(TestCase):
+    """Test striped stock counters for hot SKUs."""
+
+    def setUp(self):
+        """Set up a product in hot SKU mode."""
+        self.client = Client()
+        self.user = User.objects.create_user(username='hot', password='secret123')
+        category = Category.objects.create(name='Hot', image_url='https://example.com/c.jpg')
+        self.product = Product.objects.create(
+            name='Hyped Jacket', price=Decimal('80.00'), inventory=10,
+            image_url='https://example.com/p.jpg', category=category
+        )
+        inventory.enable_hot_mode(self.product.id, 4)
+
+    def test_enable_hot_mode_splits_stock(self):
+        """Test stock is spread evenly across the stripes."""
+        quantities = list(InventoryStripe.objects.filter(product=self.product).order_by('index')
+                          .values_list('quantity', flat=True))
+        self.assertEqual(quantities, [3, 3, 2, 2])
+
+    def test_checkout_decrements_stripes_and_fold_mirrors_total(self):
+        """Test checkouts draw from stripes and the fold job updates inventory."""
+        self.client.force_login(self.user)
+        response = self.client.post(
+            '/api/orders/checkout/',
+            {
+                'items': [{'product_id': self.product.id, 'quantity': 5}],
+                'shipping_address': '1 Main St', 'phone': '555', 'payment_method': 'card'
+            },
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        total = sum(InventoryStripe.objects.filter(product=self.product).values_list('quantity', flat=True))
+        self.assertEqual(total, 5)
+
+        call_command('fold_inventory_stripes', stdout=StringIO())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.inventory, 5)
+
+        response = self.client.post(
+            '/api/orders/checkout/',
+            {
+                'items': [{'product_id': self.product.id, 'quantity': 6}],
+                'shipping_address': '1 Main St', 'phone': '555', 'payment_method': 'card'
+            },
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_holds_rejected_for_hot_sku(self):
+        """Test cart holds are not placed on hot SKUs."""
+        response = self.client.post(
+            '/api/holds/place/',
+            {'product_id': self.product.id, 'quantity': 1},
+            content_type='application/json',
+            HTTP_X_SESSION_ID='alice'
+        )
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_disable_hot_mode_restores_single_counter(self):
+        """Test leaving hot mode folds stripes back into the product row."""
+        inventory.decrement_striped(self.product.id, 4, 7)
+        inventory.disable_hot_mode(self.product.id)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.inventory, self.product.stock_stripes), (3, 0))
+        self.assertFalse(InventoryStripe.objects.filter(product=self.product).exists())
+
+
+class CartPricingTestCase(TestCase):
+    """Test the server-side cart and batch pricing engine."""
+
+    def setUp(self):
+        """Set up products bought together in a past order."""
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username='shopper', password='secret123')
+        UserProfile.objects.create(user=self.user, referral_code='SHOPPER1')
+        self.category = Category.objects.create(name='Cart', image_url='https://example.com/c.jpg')
+        self.suit = Product.objects.create(
+            name='Suit', price=Decimal('200.00'), inventory=5,
+            image_url='https://example.com/p.jpg', category=self.category
+        )
+        self.tie = Product.objects.create(
+            name='Tie', price=Decimal('40.00'), inventory=5, on_sale=True, discount_percent=50,
+            image_url='https://example.com/p.jpg', category=self.category
+        )
+        order = Order.objects.create(
+            user=self.user, total_price=240, final_price=240,
+            shipping_address='x', phone='1', payment_method='card'
+        )
+        OrderItem.objects.create(order=order, product=self.suit, quantity=1, price_at_purchase=200)
+        OrderItem.objects.create(order=order, product=self.tie, quantity=1, price_at_purchase=40)
+
+    def set_item(self, product, quantity):
+        return self.client.post(
+            '/api/cart/set_item/',
+            {'product_id': product.id, 'quantity': quantity},
+            content_type='application/json',
+            HTTP_X_SESSION_ID='cart-session'
+        )
+
+    def test_cart_is_priced_with_sale_and_bundle_discounts(self):
+        """Test line totals, bundle discount and savings are computed server-side."""
+        self.set_item(self.suit, 1)
+        response = self.set_item(self.tie, 2)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        data = response.json()['data']
+        self.assertEqual(Decimal(data['subtotal']), Decimal('240.00'))
+        # One suit + tie pair at 10% off (200 + 20)
+        self.assertEqual(Decimal(data['bundle_discount']), Decimal('22.00'))
+        self.assertEqual(Decimal(data['final_price']), Decimal('218.00'))
+        # Sale savings (2 x 20) plus the bundle discount
+        self.assertEqual(Decimal(data['savings']), Decimal('62.00'))
+        self.assertEqual(Cart.objects.get().lines, {str(self.suit.id): 1, str(self.tie.id): 2})
+
+        self.set_item(self.tie, 0)
+        data = self.client.get('/api/cart/', HTTP_X_SESSION_ID='cart-session').json()['data']
+        self.assertEqual([line['product_id'] for line in data['lines']], [self.suit.id])
+
+    def test_warm_cart_priced_with_one_query(self):
+        """Test a 50-line cart is priced with a single product query once caches are warm."""
+        products = Product.objects.bulk_create([
+            Product(name=f'Item {i}', price=Decimal('10.00'), image_url='https://example.com/p.jpg',
+                    category=self.category)
+            for i in range(50)
+        ])
+        items = [{'product_id': product.id, 'quantity': 1} for product in products]
+        pricing.price_cart(items)
+
+        with self.assertNumQueries(1):
+            cart = pricing.price_cart(items)
+        self.assertEqual(cart.final_price, Decimal('500.00'))
+
+    def test_invalid_voucher_is_priced_out(self):
+        """Test a voucher below its minimum purchase is reported but not applied."""
+        Voucher.objects.create(
+            code='BIG50', discount_type='fixed', discount_value=50, min_purchase=1000,
+            start_date=timezone.now() - timedelta(days=1), end_date=timezone.now() + timedelta(days=1)
+        )
+        self.set_item(self.suit, 1)
+        response = self.client.post(
+            '/api/cart/apply_voucher/', {'code': 'BIG50'},
+            content_type='application/json', HTTP_X_SESSION_ID='cart-session'
+        )
+        data = response.json()['data']
+        self.assertEqual(Decimal(data['voucher_discount']), Decimal('0'))
+        self.assertIn('Minimum purchase', data['voucher_error'])
+
+    def test_session_cart_merges_on_login_and_checks_out(self):
+        """Test the anonymous cart follows the user and checkout empties it."""
+        self.set_item(self.suit, 1)
+        self.set_item(self.tie, 1)
+        self.client.post(
+            '/api/auth/login/', {'username': 'shopper', 'password': 'secret123'},
+            content_type='application/json', HTTP_X_SESSION_ID='cart-session'
+        )
+        self.assertEqual(Cart.objects.get().owner_key, f'u:{self.user.id}')
+
+        self.client.force_login(self.user)
+        response = self.client.post(
+            '/api/cart/checkout/',
+            {'shipping_address': '1 Main St', 'phone': '555', 'payment_method': 'card'},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Decimal(response.json()['data']['final_price']), Decimal('198.00'))
+        self.assertFalse(Cart.objects.exists())
+
+    def test_login_while_authenticated_keeps_the_cart(self):
+        """Test logging in again merges only the session cart, never the account's own."""
+        self.client.force_login(self.user)
+        self.set_item(self.suit, 2)
+        response = self.client.post(
+            '/api/auth/login/', {'username': 'shopper', 'password': 'secret123'},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Cart.objects.get(owner_key=f'u:{self.user.id}').lines, {str(self.suit.id): 2})
+        self.assertEqual(carts.merge(f'u:{self.user.id}', f'u:{self.user.id}').lines, {str(self.suit.id): 2})
+
+
+class OrderQueryBudgetTestCase(TestCase):
+    """Test order endpoints load with a fixed number of queries."""
+
+    def setUp(self):
+        """Set up an admin and a batch of orders with items, tracking and refunds."""
+        self.client = Client()
+        self.admin = User.objects.create_user(username='ops', password='secret123')
+        UserProfile.objects.create(user=self.admin, referral_code='OPS1', is_admin=True)
+        self.client.force_login(self.admin)
+        category = Category.objects.create(name='Orders', image_url='https://example.com/c.jpg')
+        self.products = [
+            Product.objects.create(
+                name=f'Product {i}', price=Decimal('10.00'), inventory=10,
+                image_url='https://example.com/p.jpg', category=category
+            )
+            for i in range(3)
+        ]
+
+    def create_orders(self, count):
+        for _ in range(count):
+            buyer = User.objects.create_user(username=f'buyer-{User.objects.count()}')
+            order = Order.objects.create(
+                user=buyer, total_price=30, final_price=30,
+                shipping_address='x', phone='1', payment_method='card'
+            )
+            for product in self.products:
+                OrderItem.objects.create(order=order, product=product, quantity=1, price_at_purchase=10)
+            OrderTracking.objects.create(order=order, carrier='UPS')
+            Refund.objects.create(order=order, reason='Too small', amount=30, processed_by=self.admin)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries), response
+
+    def test_list_query_count_is_constant(self):
+        """Test the order list does not issue per-order queries."""
+        self.create_orders(2)
+        small, _ = self.count_queries('/api/orders/')
+        self.create_orders(20)
+        large, response = self.count_queries('/api/orders/')
+        self.assertEqual(small, large)
+        self.assertLessEqual(large, 5)
+
+        first = response.json()['results'][0]
+        self.assertEqual(first['item_count'], 3)
+        self.assertNotIn('items', first)
+
+    def test_detail_is_fully_nested(self):
+        """Test a single order includes items, tracking and refund within budget."""
+        self.create_orders(1)
+        order = Order.objects.get()
+        queries, response = self.count_queries(f'/api/orders/{order.id}/')
+        self.assertLessEqual(queries, 6)
+        data = response.json()
+        self.assertEqual(len(data['items']), 3)
+        self.assertEqual(data['tracking']['carrier'], 'UPS')
+        self.assertEqual(data['refund']['processed_by_username'], 'ops')
+
+
+class OutboxTestCase(TestCase):
+    """Test the transactional outbox for order status changes."""
+
+    def setUp(self):
+        """Set up a customer with a pending order."""
+        self.client = Client()
+        self.user = User.objects.create_user(username='customer', email='customer@example.com', password='x')
+        UserProfile.objects.create(user=self.user, referral_code='CUST1')
+        self.order = Order.objects.create(
+            user=self.user, total_price=50, final_price=50,
+            shipping_address='x', phone='1', payment_method='card'
+        )
+
+    def test_cancel_writes_event_and_worker_sends_email(self):
+        """Test cancelling records an outbox event that the worker delivers."""
+        self.client.force_login(self.user)
+        response = self.client.post(f'/api/orders/{self.order.id}/cancel/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        event = OutboxEvent.objects.get(handler='order_email')
+        self.assertEqual(event.payload['status'], 'cancelled')
+        self.assertEqual(event.payload['previous_status'], 'pending')
+        self.assertEqual(len(mail.outbox), 0)
+
+        call_command('process_outbox', stdout=StringIO())
+        event.refresh_from_db()
+        self.assertEqual(event.status, 'done')
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn(self.order.order_id, mail.outbox[0].subject)
+
+        # A second cancel is rejected and publishes nothing
+        response = self.client.post(f'/api/orders/{self.order.id}/cancel/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(OutboxEvent.objects.filter(handler='order_email').count(), 1)
+
+    @override_settings(OUTBOX_MAX_ATTEMPTS=2)
+    def test_failing_handler_is_retried_then_failed(self):
+        """Test failures back off and stop after the maximum attempts."""
+        @outbox.register('test_failing', 'test.topic')
+        def failing(event):
+            raise RuntimeError('downstream unavailable')
+
+        outbox.publish('test.topic', {'value': 1})
+        self.assertEqual(outbox.process_batch(handlers=['test_failing']), (0, 1))
+        event = OutboxEvent.objects.get(handler='test_failing')
+        self.assertEqual((event.status, event.attempts), ('pending', 1))
+        self.assertGreater(event.available_at, timezone.now())
+        self.assertIn('downstream unavailable', event.last_error)
+
+        OutboxEvent.objects.filter(id=event.id).update(available_at=timezone.now())
+        outbox.process_batch(handlers=['test_failing'])
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), ('failed', 2))
+
+    def test_crashed_worker_only_replays_unfinished_events(self):
+        """Test claimed events are leased and only unfinished ones are claimed again."""
+        delivered = []
+        outbox.register('test_recording', 'test.lease')(lambda event: delivered.append(event.payload['value']))
+        for value in range(3):
+            outbox.publish('test.lease', {'value': value})
+
+        claimed = outbox.claim(handlers=['test_recording'])
+        self.assertEqual(len(claimed), 3)
+        self.assertTrue(outbox.deliver(claimed[0]))  # then the worker dies
+        self.assertEqual(outbox.claim(handlers=['test_recording']), [])
+
+        OutboxEvent.objects.filter(status='processing').update(available_at=timezone.now())
+        self.assertEqual(outbox.process_batch(handlers=['test_recording']), (2, 0))
+        self.assertEqual(delivered, [0, 1, 2])
+        self.assertEqual(
+            sorted(OutboxEvent.objects.filter(handler='test_recording').values_list('status', 'attempts')),
+            [('done', 1), ('done', 2), ('done', 2)]
+        )
+
+
+class BulkOrderUpdateTestCase(TestCase):
+    """Test the bulk shipment update endpoint."""
+
+    def setUp(self):
+        """Set up an admin and some orders."""
+        self.client = Client()
+        admin = User.objects.create_user(username='warehouse', password='x')
+        UserProfile.objects.create(user=admin, referral_code='WH1', is_admin=True)
+        self.client.force_login(admin)
+        customer = User.objects.create_user(username='buyer', email='buyer@example.com')
+        self.orders = [
+            Order.objects.create(
+                user=customer, total_price=10, final_price=10,
+                shipping_address='x', phone='1', payment_method='card'
+            )
+            for _ in range(3)
+        ]
+        OrderTracking.objects.create(order=self.orders[0], carrier='DHL', tracking_number='OLD')
+        self.orders[2].status = 'cancelled'
+        self.orders[2].save()
+
+    @override_settings(ORDER_BULK_UPDATE_CHUNK=2)
+    def test_bulk_update_applies_valid_records(self):
+        """Test statuses and tracking are applied and failures reported per record."""
+        first, second, cancelled = self.orders
+        response = self.client.post('/api/orders/bulk_update_status/', {'updates': [
+            {'order_id': first.order_id, 'status': 'shipped', 'location': 'Leeds'},
+            {'order_id': second.order_id, 'status': 'shipped', 'carrier': 'UPS', 'tracking_number': '1Z'},
+            {'order_id': cancelled.order_id, 'status': 'shipped'},
+            {'order_id': 'ORD-MISSING', 'status': 'shipped'},
+            {'order_id': second.order_id, 'status': 'teleported'},
+        ]}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        data = response.json()['data']
+        self.assertEqual((data['updated'], data['failed']), (2, 3))
+        results = data['results']
+        self.assertTrue(results[0]['success'] and results[1]['success'])
+        self.assertIn('already cancelled', results[2]['error'])
+        self.assertEqual(results[3]['error'], 'Order not found')
+        self.assertIn('status', results[4]['errors'])
+
+        first.refresh_from_db()
+        self.assertEqual(first.status, 'shipped')
+        tracking = OrderTracking.objects.get(order=first)
+        self.assertEqual((tracking.carrier, tracking.tracking_number, tracking.current_location),
+                         ('DHL', 'OLD', 'Leeds'))
+
+        # One batched event per chunk, not one per order
+        events = OutboxEvent.objects.filter(handler='order_email').order_by('id')
+        self.assertEqual([len(event.payload['changes']) for event in events], [2])
+
+    def test_bulk_update_upserts_tracking_in_chunks(self):
+        """Test new tracking rows are created and statements do not grow with the batch."""
+        updates = [
+            {'order_id': order.order_id, 'status': 'processing', 'carrier': 'UPS'}
+            for order in self.orders[:2]
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/orders/bulk_update_status/', {'updates': updates},
+                                        content_type='application/json')
+        self.assertEqual(response.json()['data']['updated'], 2)
+        self.assertEqual(OrderTracking.objects.filter(carrier='UPS').count(), 2)
+        self.assertLessEqual(len(queries), 12)
+
+    def test_bulk_update_reports_failures_for_unclean_ids(self):
+        """Test ids that need cleaning (padding, numbers) still get their fulfillment error."""
+        response = self.client.post('/api/orders/bulk_update_status/', {'updates': [
+            {'order_id': ' ORD-MISSING ', 'status': 'shipped'},
+            {'order_id': 404, 'status': 'shipped'},
+        ]}, content_type='application/json')
+        data = response.json()['data']
+        self.assertEqual((data['updated'], data['failed']), (0, 2))
+        self.assertEqual([result['order_id'] for result in data['results']], ['ORD-MISSING', '404'])
+        self.assertEqual({result['error'] for result in data['results']}, {'Order not found'})
+
+    def test_non_admin_rejected(self):
+        """Test customers cannot use the bulk endpoint."""
+        customer = User.objects.get(username='buyer')
+        UserProfile.objects.create(user=customer, referral_code='BUY1')
+        self.client.force_login(customer)
+        response = self.client.post('/api/orders/bulk_update_status/', {'updates': [{'order_id': 'x'}]},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class OrderConsumerTestCase(TransactionTestCase):
+    """Test per-user order push over WebSockets."""
+
+    def setUp(self):
+        """Set up two customers, one with a pending order."""
+        self.alice = User.objects.create_user(username='alice')
+        self.bob = User.objects.create_user(username='bob')
+        self.order = Order.objects.create(
+            user=self.alice, total_price=10, final_price=10,
+            shipping_address='x', phone='1', payment_method='card'
+        )
+
+    def test_order_updates_reach_only_the_owner(self):
+        """Test status changes are pushed to the owner's group, not broadcast."""
+        async def scenario():
+            application = URLRouter(websocket_urlpatterns)
+            alice = WebsocketCommunicator(application, '/ws/orders/')
+            alice.scope['user'] = self.alice
+            bob = WebsocketCommunicator(application, '/ws/orders/')
+            bob.scope['user'] = self.bob
+            self.assertTrue((await alice.connect())[0])
+            self.assertTrue((await bob.connect())[0])
+
+            snapshot = await alice.receive_json_from()
+            self.assertEqual(snapshot['type'], 'open_orders')
+            self.assertEqual(snapshot['data'][0]['order_number'], self.order.order_id)
+            self.assertEqual((await bob.receive_json_from())['data'], [])
+
+            await database_sync_to_async(self.ship_order)()
+            update = await alice.receive_json_from()
+            self.assertEqual(update['type'], 'order_update')
+            self.assertEqual(update['data']['status'], 'shipped')
+            self.assertEqual(update['data']['tracking']['carrier'], 'UPS')
+            self.assertTrue(await bob.receive_nothing())
+
+            await alice.disconnect()
+            await bob.disconnect()
+
+        async_to_sync(scenario)()
+
+    def ship_order(self):
+        fulfillment.apply_shipment_updates([
+            {'order_id': self.order.order_id, 'status': 'shipped', 'carrier': 'UPS'}
+        ])
+        outbox.process_batch(handlers=['order_push'])
+
+    def test_anonymous_connection_rejected(self):
+        """Test unauthenticated sockets are closed."""
+        async def scenario():
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/orders/')
+            communicator.scope['user'] = AnonymousUser()
+            connected, _ = await communicator.connect()
+            self.assertFalse(connected)
+
+        async_to_sync(scenario)()
+
+
+class LiveSalesTestCase(TestCase):
+    """Test the live dashboard counters and their event feed."""
+
+    def setUp(self):
+        """Set up a low-stock product and a fresh counter state."""
+        category = Category.objects.create(name='Live', image_url='https://example.com/c.jpg')
+        self.product = Product.objects.create(
+            name='Boot', price=Decimal('60.00'), inventory=12,
+            image_url='https://example.com/p.jpg', category=category
+        )
+        self.user = User.objects.create_user(username='buyer')
+        self.state = live_sales.state
+        live_sales.state = live_sales.LiveSales()
+        self.addCleanup(setattr, live_sales, 'state', self.state)
+
+    def test_windows_slide(self):
+        """Test orders leave each window once they are older than it."""
+        window = live_sales.RollingWindow(60, 1, track_products=True)
+        window.add(1000.0, Decimal('10'), [(1, 2)], 1000.0)
+        window.add(1030.0, Decimal('5'), [(1, 1)], 1030.0)
+        window.expire(1061.0)
+        self.assertEqual((window.orders, window.revenue, window.products[1]), (1, Decimal('5'), 1))
+        window.add(900.0, Decimal('99'), [], 1061.0)
+        self.assertEqual(window.orders, 1)
+
+    def test_checkout_feeds_only_the_dedicated_worker(self):
+        """Test order.placed reaches the dashboard handler, which general workers skip."""
+        live_sales.state.sync_stock()
+        checkout(self.user, [{'product_id': self.product.id, 'quantity': 3}], 'x', '1', 'card')
+        self.assertEqual(outbox.process_batch(), (0, 0))
+        self.assertEqual(outbox.process_batch(handlers=[live_sales.HANDLER]), (1, 0))
+
+        snapshot = live_sales.state.snapshot()
+        self.assertEqual(snapshot['windows']['minute'], {'orders': 1, 'revenue': '180.00'})
+        self.assertEqual(snapshot['top_products'], [{'product_id': self.product.id, 'name': 'Boot', 'quantity': 3}])
+        self.assertEqual(snapshot['low_stock'], 1)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class DashboardConsumerTestCase(TransactionTestCase):
+    """Test the admin-only live dashboard socket."""
+
+    def test_admins_receive_ticks(self):
+        """Test one broadcast reaches admins and other users cannot connect."""
+        admin = User.objects.create_user(username='boss', is_staff=True)
+        customer = User.objects.create_user(username='customer')
+
+        async def scenario():
+            application = URLRouter(websocket_urlpatterns)
+            viewer = WebsocketCommunicator(application, '/ws/dashboard/')
+            viewer.scope['user'] = admin
+            self.assertTrue((await viewer.connect())[0])
+            outsider = WebsocketCommunicator(application, '/ws/dashboard/')
+            outsider.scope['user'] = customer
+            connected, code = await outsider.connect()
+            self.assertEqual((connected, code), (False, 4403))
+
+            await database_sync_to_async(live_sales.broadcast)()
+            tick = await viewer.receive_json_from()
+            self.assertEqual(tick['type'], 'sales_tick')
+            self.assertEqual(set(tick['data']['windows']), {'minute', 'hour', 'day'})
+            await viewer.disconnect()
+
+        async_to_sync(scenario)()
+
+
+class OrderArchiveTestCase(TestCase):
+    """Test moving old orders to the archive and looking them up."""
+
+    def setUp(self):
+        """Set up a customer with old and recent orders."""
+        self.client = Client()
+        self.user = User.objects.create_user(username='loyal', password='x')
+        UserProfile.objects.create(user=self.user, referral_code='LOYAL1')
+        category = Category.objects.create(name='Archive', image_url='https://example.com/c.jpg')
+        self.product = Product.objects.create(
+            name='Coat', price=Decimal('120.00'), image_url='https://example.com/p.jpg', category=category
+        )
+        self.old = self.create_order('delivered', days_ago=400)
+        OrderTracking.objects.create(order=self.old, carrier='UPS')
+        Refund.objects.create(order=self.old, reason='Wrong size', amount=120)
+        self.recent = self.create_order('delivered', days_ago=10)
+        self.old_pending = self.create_order('pending', days_ago=400)
+
+    def create_order(self, order_status, days_ago):
+        order = Order.objects.create(
+            user=self.user, total_price=120, final_price=120, status=order_status,
+            shipping_address='x', phone='1', payment_method='card'
+        )
+        OrderItem.objects.create(order=order, product=self.product, quantity=1, price_at_purchase=120)
+        moment = timezone.now() - timedelta(days=days_ago)
+        Order.objects.filter(id=order.id).update(created_at=moment, updated_at=moment)
+        return order
+
+    def test_archive_moves_only_old_finished_orders(self):
+        """Test old delivered orders move with items and snapshots; others stay."""
+        call_command('archive_orders', '--months', '12', '--batch-size', '1', stdout=StringIO())
+
+        self.assertFalse(Order.objects.filter(id=self.old.id).exists())
+        self.assertFalse(OrderTracking.objects.exists())
+        self.assertEqual(set(Order.objects.values_list('id', flat=True)), {self.recent.id, self.old_pending.id})
+
+        archived = ArchivedOrder.objects.get()
+        self.assertEqual((archived.id, archived.order_id), (self.old.id, self.old.order_id))
+        self.assertEqual(archived.item_count, 1)
+        self.assertEqual(archived.tracking['carrier'], 'UPS')
+        self.assertEqual(archived.refund['reason'], 'Wrong size')
+        self.assertEqual(ArchivedOrderItem.objects.get(order=archived).product_name, 'Coat')
+
+    def test_orders_with_complaints_stay_live(self):
+        """Test archiving skips orders whose items have complaints, so the complaints survive."""
+        complaint = Complaint.objects.create(
+            order_item=self.old.items.get(), user=self.user, title='Torn', description='Seam came apart'
+        )
+        call_command('archive_orders', stdout=StringIO())
+
+        self.assertTrue(Complaint.objects.filter(id=complaint.id).exists())
+        self.assertTrue(Order.objects.filter(id=self.old.id).exists())
+        self.assertFalse(ArchivedOrder.objects.exists())
+
+    def test_lookup_and_my_orders_include_archive(self):
+        """Test archived orders stay reachable by order number."""
+        call_command('archive_orders', stdout=StringIO())
+        self.client.force_login(self.user)
+
+        response = self.client.get('/api/orders/lookup/', {'order_id': self.old.order_id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()['data']
+        self.assertTrue(data['archived'])
+        self.assertEqual(data['items'][0]['product_name'], 'Coat')
+
+        response = self.client.get('/api/orders/lookup/', {'order_id': self.recent.order_id})
+        self.assertNotIn('archived', response.json()['data'])
+
+        response = self.client.get('/api/orders/my_orders/', {'include_archived': 'true'})
+        self.assertEqual(len(response.json()['data']), 3)
+
+
+class OrderExportTestCase(TestCase):
+    """Test streaming order exports."""
+
+    def setUp(self):
+        """Set up an admin and orders with items."""
+        self.client = Client()
+        self.admin = admin = User.objects.create_user(username='finance', password='x')
+        UserProfile.objects.create(user=admin, referral_code='FIN1', is_admin=True)
+        self.client.force_login(admin)
+        category = Category.objects.create(name='Export', image_url='https://example.com/c.jpg')
+        product = Product.objects.create(
+            name='Belt, leather', price=Decimal('25.00'), image_url='https://example.com/p.jpg', category=category
+        )
+        self.orders = []
+        for order_status in ('delivered', 'delivered', 'cancelled'):
+            order = Order.objects.create(
+                user=admin, total_price=50, final_price=50, status=order_status,
+                shipping_address='x', phone='1', payment_method='card'
+            )
+            OrderItem.objects.create(order=order, product=product, quantity=2, price_at_purchase=25)
+            self.orders.append(order)
+
+    def test_csv_export_streams_filtered_rows(self):
+        """Test the CSV export streams one row per item, filtered by status."""
+        response = self.client.get('/api/orders/export/', {'output': 'csv', 'status': 'delivered'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:2], ['id', 'order_id'])
+        self.assertEqual(len(lines), 3)
+        self.assertIn('"Belt, leather"', lines[1])
+
+    def test_asgi_export_streams_asynchronously(self):
+        """Test under ASGI the export is served from an async iterator, not buffered."""
+        client = AsyncClient()
+        client.force_login(self.admin)
+
+        async def scenario():
+            response = await client.get('/api/orders/export/', {'output': 'csv'})
+            self.assertTrue(response.is_async)
+            self.assertTrue(hasattr(response.streaming_content, '__aiter__'))
+            return b''.join([chunk async for chunk in response.streaming_content])
+
+        self.assertEqual(len(async_to_sync(scenario)().decode().splitlines()), 4)
+
+    def test_date_to_includes_the_named_day(self):
+        """Test a plain date_to covers the whole day it names."""
+        today = timezone.localdate()
+        response = self.client.get('/api/orders/export/', {'output': 'jsonl', 'date_to': today.isoformat()})
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 3)
+        yesterday = (today - timedelta(days=1)).isoformat()
+        response = self.client.get('/api/orders/export/', {'output': 'jsonl', 'date_to': yesterday})
+        self.assertEqual(b''.join(response.streaming_content), b'')
+
+    def test_jsonl_export_in_small_chunks(self):
+        """Test keyset chunking returns every order exactly once."""
+        out = StringIO()
+        call_command('export_orders', '--format', 'jsonl', '--chunk-size', '2', stdout=out, stderr=StringIO())
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([record['order_id'] for record in records], [order.order_id for order in self.orders])
+        self.assertEqual(records[0]['items'][0]['quantity'], 2)
+
+    def test_invalid_date_rejected(self):
+        """Test malformed date filters are rejected."""
+        response = self.client.get('/api/orders/export/', {'date_from': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SalesRollupTestCase(TestCase):
+    """Test the incremental daily sales rollup."""
+
+    def setUp(self):
+        """Set up two customers with orders today and yesterday."""
+        self.alice = User.objects.create_user(username='alice')
+        self.bob = User.objects.create_user(username='bob')
+        category = Category.objects.create(name='Rollup', image_url='https://example.com/c.jpg')
+        self.product = Product.objects.create(
+            name='Coat', price=Decimal('50.00'), image_url='https://example.com/p.jpg', category=category
+        )
+        self.today = timezone.localdate()
+        self.yesterday = self.today - timedelta(days=1)
+        self.first = self.make_order(self.alice, Decimal('50.00'), 1)
+        self.make_order(self.bob, Decimal('100.00'), 2)
+        self.make_order(self.bob, Decimal('70.00'), 1, status='cancelled')
+        self.old = self.make_order(self.alice, Decimal('30.00'), 3, days_ago=1)
+        admin = User.objects.create_user(username='analyst')
+        UserProfile.objects.create(user=admin, referral_code='ANL1', is_admin=True)
+        self.admin_client = Client()
+        self.admin_client.force_login(admin)
+
+    def make_order(self, user, final_price, quantity, status='pending', days_ago=0):
+        order = Order.objects.create(
+            user=user, total_price=final_price, final_price=final_price, status=status,
+            shipping_address='x', phone='1', payment_method='card'
+        )
+        OrderItem.objects.create(order=order, product=self.product, quantity=quantity, price_at_purchase=final_price)
+        if days_ago:
+            Order.objects.filter(id=order.id).update(created_at=timezone.now() - timedelta(days=days_ago))
+        return order
+
+    def test_incremental_rollup(self):
+        """Test changed days are computed, and later runs only touch days that changed again."""
+        self.assertEqual(rollups.rollup_incremental(lag_seconds=0)[0], [self.yesterday, self.today])
+        today = SalesAnalytics.objects.get(date=self.today)
+        self.assertEqual(
+            (today.total_orders, today.total_revenue, today.total_items_sold, today.unique_customers),
+            (2, Decimal('150.00'), 3, 2)
+        )
+        self.assertEqual(today.avg_order_value, Decimal('75.00'))
+        self.assertEqual(rollups.rollup_incremental(lag_seconds=0)[0], [])
+
+        Order.objects.filter(id=self.first.id).update(status='cancelled', updated_at=timezone.now())
+        self.assertEqual(rollups.rollup_incremental(lag_seconds=0)[0], [self.today])
+        today.refresh_from_db()
+        self.assertEqual((today.total_orders, today.unique_customers), (1, 1))
+
+    def test_backfill_includes_archived_orders(self):
+        """Test a backfill counts archived orders and the dashboard summary reads the rows."""
+        Order.objects.filter(id=self.old.id).update(status='delivered', updated_at=timezone.now() - timedelta(days=400))
+        self.assertEqual(archive.archive_batch(archive.archive_cutoff()), 1)
+
+        call_command(
+            'rollup_sales', backfill=True, first=f'{self.yesterday:%Y-%m}', last=f'{self.today:%Y-%m}',
+            workers=1, stdout=StringIO()
+        )
+        yesterday = SalesAnalytics.objects.get(date=self.yesterday)
+        self.assertEqual((yesterday.total_orders, yesterday.total_items_sold), (1, 3))
+
+        cube = rollups.query_cube(group_by=['day'])
+        self.assertEqual([(row['period'], row['items_sold']) for row in cube], [(self.yesterday, 3), (self.today, 4)])
+
+        response = self.admin_client.get('/api/analytics/summary/', {'date_from': f'{self.yesterday}'})
+        data = response.json()['data']
+        self.assertEqual((data['days'], data['total_orders']), (2, 3))
+        self.assertEqual(Decimal(str(data['total_revenue'])), Decimal('180.00'))
+
+    def test_cube_rolls_up_by_category_and_status(self):
+        """Test cube cells follow status changes and answer roll-ups over any range."""
+        hats = Category.objects.create(name='Hats', image_url='https://example.com/c.jpg')
+        cap = Product.objects.create(name='Cap', price=Decimal('10.00'), image_url='https://example.com/p.jpg', category=hats)
+        OrderItem.objects.create(order=self.first, product=cap, quantity=2, price_at_purchase=Decimal('10.00'))
+        rollups.rollup_incremental(lag_seconds=0)
+        Order.objects.filter(id=self.first.id).update(status='shipped', updated_at=timezone.now())
+        self.assertEqual(len(rollups.rollup_incremental(lag_seconds=0)[1]), 1)
+
+        response = self.admin_client.get('/api/analytics/cube/', {
+            'date_from': f'{self.today}', 'date_to': f'{self.today}', 'group_by': 'category,status',
+        })
+        cells = {(row['category_name'], row['status']): row for row in response.json()['data']}
+        self.assertEqual(set(cells), {('Rollup', 'pending'), ('Rollup', 'cancelled'), ('Rollup', 'shipped'), ('Hats', 'shipped')})
+        self.assertEqual((cells['Hats', 'shipped']['items_sold'], cells['Hats', 'shipped']['order_count']), (2, 1))
+        self.assertEqual(Decimal(str(cells['Rollup', 'shipped']['revenue'])), Decimal('50.00'))
+
+        response = self.admin_client.get('/api/analytics/cube/', {'group_by': 'day,month'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_impossible_dates_are_rejected(self):
+        """Test well-formed but impossible dates are a 400, not a server error."""
+        for url in ('/api/analytics/', '/api/analytics/summary/', '/api/analytics/unique/'):
+            response = self.admin_client.get(url, {'date_to': '2025-02-30'})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(response.json()['error'], 'Invalid date: 2025-02-30')
+
+    def test_sales_figures_are_admin_only(self):
+        """Test anonymous and non-admin users cannot read the summary, unique counts or cube."""
+        customer = Client()
+        customer.force_login(self.alice)
+        UserProfile.objects.create(user=self.alice, referral_code='ALC1')
+        for url in ('/api/analytics/summary/', '/api/analytics/unique/', '/api/analytics/cube/'):
+            for client in (Client(), customer):
+                self.assertEqual(client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+            self.assertEqual(self.admin_client.get(url).status_code, status.HTTP_200_OK)
+
+
+class AnalyticsSnapshotTestCase(TestCase):
+    """Test the columnar snapshot export and its NumPy KPIs."""
+
+    def setUp(self):
+        """Set up two categories and three customers ordering across two months."""
+        self.coats = Category.objects.create(name='Coats', image_url='https://example.com/c.jpg')
+        self.hats = Category.objects.create(name='Hats', image_url='https://example.com/c.jpg')
+        self.coat = Product.objects.create(
+            name='Coat', price=Decimal('80.00'), image_url='https://example.com/p.jpg', category=self.coats
+        )
+        self.hat = Product.objects.create(
+            name='Hat', price=Decimal('15.00'), image_url='https://example.com/p.jpg', category=self.hats
+        )
+        alice, bob, carol = (User.objects.create_user(username=name) for name in ('alice', 'bob', 'carol'))
+        self.january = timezone.make_aware(datetime(2025, 1, 10, 12))
+        self.february = timezone.make_aware(datetime(2025, 2, 10, 12))
+        self.make_order(alice, self.january, [(self.coat, 1), (self.hat, 2)])
+        self.make_order(bob, self.january, [(self.hat, 1)])
+        self.make_order(alice, self.february, [(self.coat, 1)])
+        self.make_order(carol, self.february, [(self.coat, 3)], status='cancelled')
+
+    def make_order(self, user, created_at, lines, status='delivered'):
+        order = Order.objects.create(
+            user=user, total_price=0, final_price=0, status=status,
+            shipping_address='x', phone='1', payment_method='card'
+        )
+        for product, quantity in lines:
+            OrderItem.objects.create(order=order, product=product, quantity=quantity, price_at_purchase=product.price)
+        Order.objects.filter(id=order.id).update(created_at=created_at)
+
+    def test_snapshot_and_kpis(self):
+        """Test a chunked npz export loads back and answers KPIs without queries."""
+        with tempfile.TemporaryDirectory() as directory:
+            out = StringIO()
+            call_command('export_snapshot', output=directory, chunk_size=2, stdout=out)
+            self.assertIn('order_items: 5', out.getvalue())
+
+            with self.assertNumQueries(0):
+                snapshot = snapshots.load(directory)
+                categories, months, revenue = snapshots.revenue_by_category_month(snapshot)
+                cohorts, sizes, retention = snapshots.cohort_retention(snapshot)
+
+        self.assertEqual(snapshot['order_items']['created_at'][0], np.datetime64('2025-01-10T12:00:00'))
+        self.assertEqual(list(categories), [self.coats.id, self.hats.id])
+        self.assertEqual([str(month) for month in months], ['2025-01', '2025-02'])
+        self.assertEqual(revenue.tolist(), [[8000, 8000], [4500, 0]])
+        self.assertEqual(sizes.tolist(), [2])
+        self.assertEqual(retention.tolist(), [[1.0, 0.5]])
+
+
+class CustomerStatsTestCase(TestCase):
+    """Test the vectorized customer stats and cohort table."""
+
+    def setUp(self):
+        """Set up customers ordering across three months, one of them archived."""
+        self.alice, self.bob, self.carol = (User.objects.create_user(username=name) for name in ('alice', 'bob', 'carol'))
+        self.admin = User.objects.create_user(username='ops', password='pass123')
+        for user, code in ((self.alice, 'A1'), (self.bob, 'B1'), (self.carol, 'C1')):
+            UserProfile.objects.create(user=user, referral_code=code)
+        UserProfile.objects.create(user=self.admin, referral_code='OPS1', is_admin=True)
+
+        self.make_order(self.alice, datetime(2025, 1, 5), '10.00')
+        self.make_order(self.alice, datetime(2025, 1, 20), '5.50')
+        self.make_order(self.bob, datetime(2025, 1, 9), '20.00')
+        self.make_order(self.alice, datetime(2025, 3, 2), '30.00')
+        self.make_order(self.carol, datetime(2025, 2, 14), '99.00', status='cancelled')
+        self.make_order(self.bob, datetime(2025, 2, 1), '7.25')
+        self.assertEqual(archive.archive_batch(timezone.make_aware(datetime(2025, 2, 2))), 4)
+
+    def make_order(self, user, created_at, amount, status='delivered'):
+        order = Order.objects.create(
+            user=user, total_price=Decimal(amount), final_price=Decimal(amount), status=status,
+            shipping_address='x', phone='1', payment_method='card'
+        )
+        created_at = timezone.make_aware(created_at)
+        Order.objects.filter(id=order.id).update(created_at=created_at, updated_at=created_at)
+
+    def test_compute_writes_profiles_and_cohorts(self):
+        """Test per-customer stats (archived orders included, cancelled excluded) and cohort cells."""
+        out = StringIO()
+        call_command('compute_customer_stats', chunk_size=2, batch_size=1, stdout=out)
+        self.assertIn('2 customers from 5 orders', out.getvalue())
+
+        alice = UserProfile.objects.get(user=self.alice)
+        self.assertEqual(alice.order_count, 3)
+        self.assertEqual(alice.lifetime_value, Decimal('45.50'))
+        self.assertEqual(alice.first_order_at, timezone.make_aware(datetime(2025, 1, 5)))
+        self.assertEqual(alice.last_order_at, timezone.make_aware(datetime(2025, 3, 2)))
+        self.assertEqual(str(alice.cohort_month), '2025-01-01')
+        self.assertEqual(UserProfile.objects.get(user=self.carol).order_count, 0)
+
+        cells = list(CustomerCohort.objects.values_list('months_since', 'cohort_size', 'active_customers', 'revenue'))
+        self.assertEqual(cells, [
+            (0, 2, 2, Decimal('35.50')), (1, 2, 1, Decimal('7.25')), (2, 2, 1, Decimal('30.00'))
+        ])
+
+    def test_stale_stats_are_reset(self):
+        """Test a customer whose orders are all cancelled since the last run is reset."""
+        self.make_order(self.carol, datetime(2025, 3, 9), '12.00')
+        customer_stats.compute()
+        self.assertEqual(UserProfile.objects.get(user=self.carol).order_count, 1)
+
+        Order.objects.filter(user=self.carol).update(status='cancelled')
+        customer_stats.compute()
+        carol = UserProfile.objects.get(user=self.carol)
+        self.assertEqual((carol.order_count, carol.lifetime_value, carol.cohort_month), (0, Decimal('0'), None))
+
+    def test_cohorts_endpoint(self):
+        """Test the cohort table is served to admins only."""
+        customer_stats.compute()
+        client = Client()
+        url = reverse('analytics-cohorts')
+        self.assertEqual(client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+        client.login(username='ops', password='pass123')
+        response = client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()['data']
+        self.assertEqual(data['customers'], 2)
+        self.assertEqual(data['repeat_rate'], 1.0)
+        self.assertEqual(data['cohorts'][0]['cohort'], '2025-01')
+        self.assertEqual(data['cohorts'][0]['retention'], [1.0, 0.5, 0.5])
+
+        response = client.get(url, {'date_from': '2025-02-30'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(BUFFERED_WRITES_BACKGROUND=False)
+class DistinctSketchTestCase(TestCase):
+    """Test HyperLogLog distinct counts and the daily sketches."""
+
+    def test_estimate_and_merge(self):
+        """Test estimates stay within the error bound and merging counts overlap once."""
+        first = sketches.DistinctSketch().add(range(0, 60000))
+        second = sketches.DistinctSketch().add(range(40000, 100000))
+        self.assertLess(abs(first.count() - 60000), 60000 * 3 * first.relative_error)
+
+        merged = sketches.DistinctSketch(registers=first.to_bytes()).merge(second)
+        self.assertLess(abs(merged.count() - 100000), 100000 * 3 * merged.relative_error)
+        self.assertEqual(merged.merge(second).count(), merged.count())
+        self.assertEqual(sketches.DistinctSketch().add(['a', 'b', 'a']).count(), 2)
+
+    def test_rollup_and_clickstream_fill_sketches(self):
+        """Test the rollup stores customer sketches and flushed events add visitors."""
+        category = Category.objects.create(name='Sketch', image_url='https://example.com/c.jpg')
+        product = Product.objects.create(
+            name='Coat', price=Decimal('50.00'), image_url='https://example.com/p.jpg', category=category
+        )
+        alice, bob = (User.objects.create_user(username=name) for name in ('alice', 'bob'))
+        for user, days_ago in ((alice, 0), (alice, 1), (bob, 1)):
+            order = Order.objects.create(
+                user=user, total_price=10, final_price=10, shipping_address='x', phone='1', payment_method='card'
+            )
+            OrderItem.objects.create(order=order, product=product, quantity=1, price_at_purchase=10)
+            Order.objects.filter(id=order.id).update(created_at=timezone.now() - timedelta(days=days_ago))
+        rollups.rollup_incremental(lag_seconds=0)
+
+        self.assertEqual(sketches.estimate(sketches.CUSTOMERS)['estimate'], 2)
+        self.assertEqual(sketches.estimate(sketches.CUSTOMERS, date_from=timezone.localdate())['estimate'], 1)
+        self.assertEqual(sketches.estimate(sketches.CUSTOMERS, category_id=category.id)['estimate'], 2)
+
+        event_buffer.flush()
+        self.client.post('/api/events/', {'session_id': 's1', 'events': [{'type': 'view', 'product_id': product.id}]},
+                         content_type='application/json')
+        event_buffer.flush()
+        self.client.post('/api/events/', {'session_id': 's2', 'events': [{'type': 'search', 'query': 'coat'}]},
+                         content_type='application/json')
+        self.client.post('/api/events/', {'session_id': 's1', 'events': [{'type': 'search', 'query': 'hat'}]},
+                         content_type='application/json')
+        event_buffer.flush()
+
+        admin = User.objects.create_user(username='analyst')
+        UserProfile.objects.create(user=admin, referral_code='ANL1', is_admin=True)
+        self.client.force_login(admin)
+        response = self.client.get('/api/analytics/unique/', {'metric': 'visitors'})
+        self.assertEqual(response.json()['data']['estimate'], 2)
+        response = self.client.get('/api/analytics/unique/', {'metric': 'visitors', 'category': category.id})
+        self.assertEqual(response.json()['data']['estimate'], 1)
+        self.assertEqual(DailySketch.objects.filter(metric='visitors').count(), 2)
+
+
+@override_settings(BUFFERED_WRITES_BACKGROUND=False, WS_MAX_SUBSCRIPTIONS=3, CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class ProductBroadcastTestCase(TransactionTestCase):
+    """Test product changes are broadcast after commit, coalesced and routed to topics."""
+
+    def setUp(self):
+        """Set up a category and an empty publisher queue."""
+        product_broadcasts.flush()
+        self.category = Category.objects.create(name='Live', image_url='https://example.com/c.jpg')
+        self.other = Category.objects.create(name='Quiet', image_url='https://example.com/c.jpg')
+
+    def connect(self, topics):
+        return WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/products/?topics={topics}')
+
+    def test_saves_are_coalesced_and_routed_by_topic(self):
+        """Test many saves and a delete become one message per topic, sent only to subscribers."""
+        async def scenario():
+            viewer = self.connect(f'category.{self.category.id}')
+            self.assertTrue((await viewer.connect())[0])
+            self.assertEqual((await viewer.receive_json_from())['topics'], [f'category.{self.category.id}'])
+            self.assertEqual((await viewer.receive_json_from())['type'], 'new_arrivals')
+            bystander = self.connect(f'category.{self.other.id}')
+            self.assertTrue((await bystander.connect())[0])
+            await bystander.receive_json_from()
+            await bystander.receive_json_from()
+
+            def change_products():
+                with transaction.atomic():
+                    product = Product.objects.create(
+                        name='Scarf', price=Decimal('20.00'), image_url='https://example.com/p.jpg',
+                        category=self.category
+                    )
+                    for inventory in (5, 4, 3):
+                        product.inventory = inventory
+                        product.save()
+                    gone = Product.objects.create(
+                        name='Gloves', price=Decimal('9.00'), image_url='https://example.com/p.jpg',
+                        category=self.category
+                    )
+                    gone.delete()
+                return product
+
+            product = await database_sync_to_async(change_products)()
+            self.assertTrue(await viewer.receive_nothing())
+            self.assertEqual(product_broadcasts.pending_count(), 2)
+
+            await database_sync_to_async(product_broadcasts.flush)()
+            message = await viewer.receive_json_from()
+            self.assertEqual((message['type'], message['topic']), ('product_updates', f'category.{self.category.id}'))
+            self.assertEqual([update['type'] for update in message['data']], ['product_created', 'product_deleted'])
+            self.assertEqual(message['data'][0]['product']['id'], product.id)
+            self.assertEqual(message['data'][0]['product']['inventory'], 3)
+            self.assertTrue(await bystander.receive_nothing())
+            await viewer.disconnect()
+            await bystander.disconnect()
+
+        async_to_sync(scenario)()
+
+    def test_subscriptions_are_validated_and_limited(self):
+        """Test unknown topics are rejected and subscriptions stop at the per-connection limit."""
+        async def scenario():
+            viewer = self.connect('')
+            self.assertTrue((await viewer.connect())[0])
+            await viewer.receive_json_from()
+            await viewer.send_json_to({'type': 'subscribe', 'topics': [
+                'featured', 'everything', 'product.1', 'product.2', 'product.3'
+            ]})
+            reply = await viewer.receive_json_from()
+            self.assertEqual(reply['topics'], ['featured', 'product.1', 'product.2'])
+            self.assertEqual((reply['invalid'], reply['over_limit']), (['everything'], ['product.3']))
+
+            await viewer.send_json_to({'type': 'unsubscribe', 'topics': ['product.1']})
+            self.assertEqual((await viewer.receive_json_from())['topics'], ['featured', 'product.2'])
+            await viewer.disconnect()
+
+        async_to_sync(scenario)()
+
+    def test_rolled_back_saves_are_not_broadcast(self):
+        """Test nothing is queued for a transaction that rolls back."""
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            Product.objects.create(
+                name='Hat', price=Decimal('15.00'), image_url='https://example.com/p.jpg', category=self.category
+            )
+            raise RuntimeError
+        self.assertEqual(product_broadcasts.pending_count(), 0)
+
+    def test_price_drops_and_stock_changes_coalesce(self):
+        """Test a saved price cut reaches price_drops and stock updates keep the net change."""
+        product = Product.objects.create(
+            name='Belt', price=Decimal('25.00'), image_url='https://example.com/p.jpg', category=self.category
+        )
+        product_broadcasts.flush()
+        product = Product.objects.get(id=product.id)
+        product.price = Decimal('20.00')
+        product.save()
+        product_broadcasts.stock_changed(product, 10, 6)
+        product_broadcasts.stock_changed(product, 6, 2)
+
+        async def scenario():
+            layer = get_channel_layer()
+            channels = {}
+            for topic in ('price_drops', f'product.{product.id}'):
+                channels[topic] = await layer.new_channel()
+                await layer.group_add(f'products.{topic}', channels[topic])
+            await database_sync_to_async(product_broadcasts.flush)(layer)
+            return {topic: json.loads((await layer.receive(channel))['text']) for topic, channel in channels.items()}
+
+        messages = async_to_sync(scenario)()
+        self.assertEqual([update['type'] for update in messages['price_drops']['data']], ['price_change'])
+        self.assertEqual(messages['price_drops']['data'][0]['new_price'], 20.0)
+        updates = messages[f'product.{product.id}']['data']
+        self.assertEqual([update['type'] for update in updates], ['product_updated', 'price_change', 'stock_update'])
+        self.assertEqual((updates[2]['old_stock'], updates[2]['new_stock'], updates[2]['low_stock']), (10, 2, True))
+
+    def test_changes_reach_the_topics_a_product_leaves(self):
+        """Test moving a product out of a category and flag still notifies the old topics."""
+        product = Product.objects.create(
+            name='Tie', price=Decimal('30.00'), image_url='https://example.com/p.jpg',
+            category=self.category, featured=True
+        )
+        product_broadcasts.flush()
+        product = Product.objects.get(id=product.id)
+        product.category = self.other
+        product.featured = False
+        product.price = Decimal('25.00')
+        product.save()
+
+        async def scenario():
+            layer = get_channel_layer()
+            channels = {}
+            for topic in (f'category.{self.category.id}', 'featured', f'category.{self.other.id}'):
+                channels[topic] = await layer.new_channel()
+                await layer.group_add(f'products.{topic}', channels[topic])
+            await database_sync_to_async(product_broadcasts.flush)(layer)
+            return {
+                topic: json.loads((await asyncio.wait_for(layer.receive(channel), 1))['text'])
+                for topic, channel in channels.items()
+            }
+
+        messages = async_to_sync(scenario)()
+        self.assertEqual(
+            [update['type'] for update in messages[f'category.{self.category.id}']['data']],
+            ['product_updated', 'price_change']
+        )
+        self.assertEqual([update['type'] for update in messages['featured']['data']], ['product_updated'])
+        self.assertFalse(messages['featured']['data'][0]['is_featured'])
+        self.assertEqual(messages[f'category.{self.other.id}']['data'][0]['product']['id'], product.id)
+
+
+@override_settings(BUFFERED_WRITES_BACKGROUND=False, CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class ProductListingSnapshotTestCase(TransactionTestCase):
+    """Test sockets get the shared new arrivals snapshot on connect."""
+
+    def setUp(self):
+        """Set up one new arrival and a cold snapshot."""
+        listings.invalidate(set(), ListingSnapshots.LISTINGS)
+        self.category = Category.objects.create(name='Snap', image_url='https://example.com/c.jpg')
+        Product.objects.create(
+            name='Boots', price=Decimal('90.00'), image_url='https://example.com/p.jpg',
+            category=self.category, new_arrival=True
+        )
+        product_broadcasts.flush()
+
+    def connect_and_receive(self):
+        async def scenario():
+            viewer = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/products/')
+            await viewer.connect()
+            message = await viewer.receive_json_from()
+            await viewer.disconnect()
+            return message
+
+        with CaptureQueriesContext(connection) as queries:
+            message = async_to_sync(scenario)()
+        return message, len(queries)
+
+    def test_connects_are_served_from_memory(self):
+        """Test only the first connect queries and a relevant change refreshes the snapshot."""
+        message, queries = self.connect_and_receive()
+        self.assertEqual([product['name'] for product in message['data']], ['Boots'])
+        self.assertGreater(queries, 0)
+        for _ in range(3):
+            self.assertEqual(self.connect_and_receive()[1], 0)
+
+        # An unrelated change keeps the snapshot, a new arrival drops it
+        Product.objects.create(name='Belt', price=Decimal('20.00'), image_url='https://example.com/p.jpg',
+                               category=self.category)
+        product_broadcasts.flush()
+        self.assertEqual(self.connect_and_receive()[1], 0)
+        Product.objects.create(name='Hat', price=Decimal('25.00'), image_url='https://example.com/p.jpg',
+                               category=self.category, new_arrival=True)
+        product_broadcasts.flush()
+        message, queries = self.connect_and_receive()
+        self.assertEqual([product['name'] for product in message['data']], ['Hat', 'Boots'])
+        self.assertGreater(queries, 0)
+
+    def test_changes_in_another_process_drop_the_snapshot(self):
+        """Test a list built by another process stops being served once a change bumps its version."""
+        other_process = ListingSnapshots()
+        other_process.VERSION_CHECK_SECONDS = 0
+        other_process.ensure('new_arrivals')
+        self.assertIsNotNone(other_process.get('new_arrivals'))
+
+        # This process has no snapshot of its own, but the change is published to new_arrivals
+        listings.invalidate(set(), ListingSnapshots.LISTINGS)
+        product = Product.objects.get(name='Boots')
+        product.new_arrival = False
+        product.save()
+        product_broadcasts.flush()
+        self.assertIsNone(other_process.get('new_arrivals'))
+        self.assertEqual(json.loads(other_process.ensure('new_arrivals'))['data'], [])
+        self.assertIsNotNone(other_process.get('new_arrivals'))
@@ -7,12 +7,13 @@ from .views import (
     ProductViewSet, CategoryViewSet, ReviewViewSet, NewsletterViewSet,
     similar_products, frequently_bought_together, personalized_recommendations,
     trending_products, you_may_also_like, bundle_suggestions,
-    new_arrivals, best_sellers
+    new_arrivals, best_sellers, viewed_together, track_events,
+    experiment_assignments
 )
 from .views_extended import (
     AuthViewSet, BannerViewSet, VoucherViewSet, SalesAnalyticsViewSet,
     OrderViewSet, RefundViewSet, UserProfileViewSet, WatchlistViewSet,
-    ComplaintViewSet, ReferralViewSet
+    ComplaintViewSet, ReferralViewSet, InventoryHoldViewSet, CartViewSet
 )
 
 # Create router for viewsets
@@ -36,6 +37,10 @@ router.register(r'analytics', SalesAnalyticsViewSet, basename='analytics')
 router.register(r'orders', OrderViewSet, basename='order')
 router.register(r'refunds', RefundViewSet, basename='refund')
 
+# Inventory & cart
+router.register(r'holds', InventoryHoldViewSet, basename='hold')
+router.register(r'cart', CartViewSet, basename='cart')
+
 # User features
 router.register(r'profile', UserProfileViewSet, basename='profile')
 router.register(r'watchlist', WatchlistViewSet, basename='watchlist')
@@ -55,4 +60,11 @@ urlpatterns = [
     path('recommendations/bundles/<int:product_id>/', bundle_suggestions, name='bundle-suggestions'),
     path('recommendations/new-arrivals/', new_arrivals, name='new-arrivals'),
     path('recommendations/best-sellers/', best_sellers, name='best-sellers'),
+    path('recommendations/viewed-together/', viewed_together, name='viewed-together'),
+
+    # Experiments
+    path('experiments/assignments/', experiment_assignments, name='experiment-assignments'),
+
+    # Clickstream
+    path('events/', track_events, name='track-events'),
 ]
@@ -204,7 +204,15 @@ class NewsletterViewSet(viewsets.ViewSet):
 
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from .recommendation_engine import RecommendationEngine
+from .recommendation_engine import RecommendationEngine, RANKING_EXPERIMENT
+from .serializers import ClickEventBatchSerializer
+from . import clickstream, experiments, recently_viewed
+
+
+def _ranking_for(request):
+    """Assign the request to a ranking variant and log the exposure."""
+    unit_id = experiments.unit_for_request(request)
+    return experiments.expose(RANKING_EXPERIMENT, unit_id) or 'control'
 
 
 @api_view(['GET'])
@@ -218,7 +226,7 @@ def similar_products(request, product_id):
     - limit: Number of products to return (default: 6)
     """
     limit = int(request.query_params.get('limit', 6))
-    products = RecommendationEngine.get_similar_products(product_id, limit)
+    products = RecommendationEngine.get_similar_products(product_id, limit, ranking=_ranking_for(request))
     serializer = ProductSerializer(products, many=True)
     return Response({'data': serializer.data})
 
@@ -250,7 +258,11 @@ def personalized_recommendations(request):
     - limit: Number of products to return (default: 8)
     """
     limit = int(request.query_params.get('limit', 8))
-    products = RecommendationEngine.get_personalized_recommendations(request.user.id, limit)
+    products = RecommendationEngine.get_personalized_recommendations(
+        request.user.id,
+        limit,
+        ranking=_ranking_for(request)
+    )
     serializer = ProductSerializer(products, many=True)
     return Response({'data': serializer.data})
 
@@ -282,7 +294,13 @@ def you_may_also_like(request, product_id):
     - limit: Number of products to return (default: 6)
     """
     limit = int(request.query_params.get('limit', 6))
-    products = RecommendationEngine.get_you_may_also_like(request.user.id, product_id, limit)
+    products = RecommendationEngine.get_you_may_also_like(
+        request.user.id,
+        product_id,
+        limit,
+        recently_viewed_ids=recently_viewed.get_recent(user_id=request.user.id),
+        ranking=_ranking_for(request)
+    )
     serializer = ProductSerializer(products, many=True)
     return Response({'data': serializer.data})
 
@@ -332,3 +350,88 @@ def best_sellers(request):
     products = RecommendationEngine.get_best_sellers(limit)
     serializer = ProductSerializer(products, many=True)
     return Response({'data': serializer.data})
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def viewed_together(request):
+    """
+    Get products viewed together with the shopper's recently viewed products.
+    Does not require authentication.
+
+    GET /api/recommendations/viewed-together/?ids=12,7,3
+    Query params:
+    - ids: Comma-separated recently viewed product IDs, most recent first (max 20)
+    - limit: Number of products to return (default: 8)
+    """
+    limit = int(request.query_params.get('limit', 8))
+    try:
+        product_ids = [
+            int(pid) for pid in request.query_params.get('ids', '').split(',') if pid.strip()
+        ][:20]
+    except ValueError:
+        return Response({'error': 'ids must be comma-separated integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+    products = RecommendationEngine.get_viewed_together(product_ids, limit)
+    serializer = ProductSerializer(products, many=True)
+    return Response({'data': serializer.data})
+
+
+# ===========================
+# Experiment API Views
+# ===========================
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def experiment_assignments(request):
+    """
+    Get the caller's variant in every running experiment.
+
+    GET /api/experiments/assignments/
+    Anonymous callers identify themselves with the X-Session-ID header
+    or the session_id query param.
+    """
+    unit_id = experiments.unit_for_request(request)
+    assignments = {
+        key: experiment.assign(unit_id)
+        for key, experiment in experiments.active_experiments().items()
+    } if unit_id else {}
+    return Response({'data': assignments})
+
+
+# ===========================
+# Clickstream API Views
+# ===========================
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def track_events(request):
+    """
+    Record a batch of storefront events (views, add-to-cart, searches).
+
+    POST /api/events/
+    Expected POST data:
+    {
+        "session_id": "c0ffee...",
+        "events": [
+            {"type": "view", "product_id": 12},
+            {"type": "search", "query": "linen shirt"}
+        ]
+    }
+
+    Events are buffered and written asynchronously; the response only
+    acknowledges receipt.
+    """
+    serializer = ClickEventBatchSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(
+            {'success': False, 'errors': serializer.errors},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    queued = clickstream.record_events(
+        serializer.validated_data['events'],
+        user=request.user,
+        session_id=serializer.validated_data['session_id'],
+    )
+    return Response({'success': True, 'accepted': len(queued)}, status=status.HTTP_202_ACCEPTED)
@@ -1,23 +1,49 @@
 """
 Extended views for ClassyCouture API - Admin, Auth, Orders, User Features.
 """
-from rest_framework import viewsets, status
+from decimal import Decimal, InvalidOperation
+
+from rest_framework import viewsets, status, serializers
 from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError
 from rest_framework.response import Response
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
+from django.conf import settings
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
-from django.db.models import Sum
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.db.models import Count, Prefetch, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from . import archive
+from . import cart as carts
+from . import customer_stats
+from . import experiments
+from . import exports
+from . import fulfillment
+from . import inventory
+from . import order_events
+from .checkout import CheckoutError, checkout as place_order, release_orders
+from . import recently_viewed as recent_views
+from . import rollups
+from . import sketches
+from . import vouchers
 from .models import (
     UserProfile, Banner, Voucher, SalesAnalytics,
     Order, OrderItem, OrderTracking, Refund,
-    Watchlist, Complaint, Referral, Product
+    Watchlist, Complaint, Referral, Product, InventoryHold, ArchivedOrder
 )
+from .serializers import ProductSerializer
 from .serializers_extended import (
     UserSerializer, UserProfileSerializer, UserRegistrationSerializer, UserLoginSerializer,
     BannerSerializer, VoucherSerializer, SalesAnalyticsSerializer,
-    OrderSerializer, OrderItemSerializer, OrderTrackingSerializer, RefundSerializer, OrderCreateSerializer,
+    OrderSerializer, OrderSummarySerializer, OrderItemSerializer, OrderTrackingSerializer, RefundSerializer,
+    OrderCreateSerializer, ArchivedOrderSerializer, ArchivedOrderSummarySerializer,
+    CheckoutSerializer, InventoryHoldSerializer, PlaceHoldSerializer,
+    CartLineSerializer, CartCheckoutSerializer, ShipmentUpdateSerializer,
     WatchlistSerializer, ComplaintSerializer, ReferralSerializer
 )
 
@@ -73,6 +99,11 @@ class AuthViewSet(viewsets.ViewSet):
                 status=status.HTTP_401_UNAUTHORIZED
             )
 
+        # Carry the anonymous session's cart over to the account (never another user's cart)
+        session_keys = [key for key in inventory.owner_keys_for_request(request) if key.startswith('s:')]
+        if session_keys:
+            carts.merge(session_keys[0], f'u:{user.id}')
+
         profile = user.profile
         return Response(
             {
@@ -114,34 +145,178 @@ class VoucherViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_permissions(self):
-        if self.action == 'retrieve':
+        if self.action in ('retrieve', 'validate_code'):
             return [AllowAny()]
         return [IsAdminUser()]
 
     @action(detail=False, methods=['post'])
     def validate_code(self, request):
-        """Validate voucher code."""
+        """
+        Validate voucher code.
+
+        Answered from the cached voucher rules; the use itself is only taken
+        at checkout.
+        """
         code = request.data.get('code')
         if not code:
             return Response({'valid': False, 'error': 'Code required'})
 
+        amount = request.data.get('amount')
         try:
-            voucher = Voucher.objects.get(code=code)
-            if voucher.can_use:
-                return Response({
-                    'valid': True,
-                    'voucher': VoucherSerializer(voucher).data
-                })
-            return Response({'valid': False, 'error': 'Voucher expired or max uses reached'})
-        except Voucher.DoesNotExist:
-            return Response({'valid': False, 'error': 'Voucher not found'})
+            voucher = vouchers.validate(code, request.user, Decimal(str(amount)) if amount else None)
+        except InvalidOperation:
+            return Response({'valid': False, 'error': 'Invalid amount'})
+        except vouchers.VoucherError as exc:
+            return Response({'valid': False, 'error': exc.message, 'code': exc.code})
+        return Response({
+            'valid': True,
+            'voucher': {
+                'id': voucher.id,
+                'code': voucher.code,
+                'discount_type': 'percentage' if voucher.percentage else 'fixed',
+                'discount_value': str(voucher.value),
+                'min_purchase': str(voucher.min_purchase),
+                'end_date': voucher.end_date,
+            }
+        })
 
 
 class SalesAnalyticsViewSet(viewsets.ReadOnlyModelViewSet):
-    """Sales analytics viewset."""
-    queryset = SalesAnalytics.objects.all()
+    """
+    Sales analytics viewset.
+
+    Serves the daily rows precomputed by ``rollup_sales``; nothing here
+    touches the order tables. Filter with ``?date_from=`` / ``?date_to=``
+    (inclusive, YYYY-MM-DD). The summary, unique, cube and cohorts actions
+    are for admins only.
+    """
     serializer_class = SalesAnalyticsSerializer
-    permission_classes = [AllowAny]  # Frontend admin dashboard handles staff checks
+    permission_classes = [AllowAny]  # Actions with revenue or customer figures check is_admin themselves
+
+    def get_queryset(self):
+        queryset = SalesAnalytics.objects.all()
+        date_from, date_to = self._date_range()
+        if date_from:
+            queryset = queryset.filter(date__gte=date_from)
+        if date_to:
+            queryset = queryset.filter(date__lte=date_to)
+        return queryset
+
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        """Totals over the filtered days."""
+        denied = self._require_admin(request)
+        if denied:
+            return denied
+        totals = self.get_queryset().aggregate(
+            days=Count('id'),
+            total_orders=Sum('total_orders'),
+            total_revenue=Sum('total_revenue'),
+            total_items_sold=Sum('total_items_sold'),
+        )
+        orders = totals['total_orders'] or 0
+        revenue = totals['total_revenue'] or Decimal('0')
+        totals.update(
+            total_orders=orders,
+            total_revenue=revenue,
+            total_items_sold=totals['total_items_sold'] or 0,
+            avg_order_value=(revenue / orders).quantize(Decimal('0.01')) if orders else Decimal('0'),
+            unique_customers=sketches.estimate(sketches.CUSTOMERS, *self._date_range())['estimate'],
+        )
+        return Response({'data': totals})
+
+    def _require_admin(self, request):
+        """A 403 response unless the caller is an admin (revenue and customer figures), else None."""
+        profile = getattr(request.user, 'profile', None)
+        if profile is None or not profile.is_admin:
+            return Response({'success': False, 'error': 'Admin access required'}, status=status.HTTP_403_FORBIDDEN)
+        return None
+
+    def _date_range(self):
+        dates = []
+        for name in ('date_from', 'date_to'):
+            value = self.request.query_params.get(name) or ''
+            try:
+                dates.append(parse_date(value))
+            except ValueError:
+                # Well-formed but impossible, e.g. 2025-02-30
+                raise ParseError(f'Invalid date: {value}')
+        return tuple(dates)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, ParseError):
+            return Response({'success': False, 'error': str(exc.detail)}, status=status.HTTP_400_BAD_REQUEST)
+        return super().handle_exception(exc)
+
+    @action(detail=False, methods=['get'])
+    def unique(self, request):
+        """
+        Estimated distinct customers or visitors over a date range, from the daily sketches.
+
+        GET /api/analytics/unique/?metric=visitors&date_from=2025-01-01&date_to=2025-03-31&category=3
+
+        Query params:
+        - metric: customers (default) or visitors
+        - date_from / date_to: inclusive, YYYY-MM-DD
+        - category: category id (default: all categories)
+        """
+        denied = self._require_admin(request)
+        if denied:
+            return denied
+        metric = request.query_params.get('metric', sketches.CUSTOMERS)
+        if metric not in (sketches.CUSTOMERS, sketches.VISITORS):
+            return Response({'success': False, 'error': f'Unknown metric: {metric}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            category_id = int(request.query_params.get('category') or sketches.ALL_CATEGORIES)
+        except ValueError:
+            return Response({'success': False, 'error': 'category must be an id'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'data': {'metric': metric, **sketches.estimate(metric, *self._date_range(), category_id)}})
+
+    @action(detail=False, methods=['get'])
+    def cube(self, request):
+        """
+        Sales by period, category and/or status over any range, from the cube.
+
+        GET /api/analytics/cube/?date_from=2025-01-01&date_to=2025-03-31&group_by=month,category
+
+        Query params:
+        - date_from / date_to: order creation range, dates inclusive
+        - group_by: comma-separated, any of hour|day|month (one), category, status
+        - status: comma-separated statuses
+        - category: comma-separated category ids
+        """
+        denied = self._require_admin(request)
+        if denied:
+            return denied
+        params = request.query_params
+        try:
+            rows = rollups.query_cube(
+                exports.parse_bound(params.get('date_from')),
+                exports.parse_bound(params.get('date_to'), end=True),
+                [value for value in params.get('group_by', 'day').split(',') if value],
+                [value for value in params.get('status', '').split(',') if value],
+                [int(value) for value in params.get('category', '').split(',') if value],
+            )
+        except ValueError as exc:
+            return Response({'success': False, 'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'data': rows})
+
+    @action(detail=False, methods=['get'])
+    def cohorts(self, request):
+        """
+        Monthly customer cohorts, as last computed by ``compute_customer_stats``.
+
+        GET /api/analytics/cohorts/?date_from=2025-01-01&date_to=2025-06-30
+
+        Each cohort lists retention (share of its customers ordering again),
+        active customers and revenue for 0, 1, 2... months after the first
+        order, with repeat rate and average lifetime value across customers.
+        """
+        denied = self._require_admin(request)
+        if denied:
+            return denied
+        return Response({'data': customer_stats.cohort_report(*self._date_range())})
 
 
 # ============================================================================
@@ -149,19 +324,144 @@ class SalesAnalyticsViewSet(viewsets.ReadOnlyModelViewSet):
 # ============================================================================
 
 class OrderViewSet(viewsets.ModelViewSet):
-    """Order management viewset."""
+    """
+    Order management viewset.
+
+    List views return flat summaries with an item count; the full nested
+    representation (items, tracking, refund) is only built for single orders.
+    Both load with a fixed number of queries regardless of page size.
+    """
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    summary_actions = ('list', 'my_orders')
 
     def get_queryset(self):
         """Users see only their orders, admins see all."""
         if self.request.user.profile.is_admin:
-            return Order.objects.all()
-        return Order.objects.filter(user=self.request.user)
+            queryset = Order.objects.all()
+        else:
+            queryset = Order.objects.filter(user=self.request.user)
+
+        if self.action in self.summary_actions:
+            return queryset.select_related('user').annotate(item_count=Count('items')).order_by('-created_at')
+        return queryset.select_related('user', 'tracking', 'refund__processed_by').prefetch_related(
+            Prefetch('items', queryset=OrderItem.objects.select_related('product'))
+        )
+
+    def get_serializer_class(self):
+        if self.action in self.summary_actions:
+            return OrderSummarySerializer
+        return super().get_serializer_class()
 
     def perform_create(self, serializer):
         """Create order for current user."""
-        serializer.save(user=self.request.user)
+        order = serializer.save(user=self.request.user)
+        experiments.log_conversion(experiments.unit_for_request(self.request), value=order.final_price)
+
+    def perform_update(self, serializer):
+        """Save the order and publish a status change event with it."""
+        previous_status = serializer.instance.status
+        with transaction.atomic():
+            order = serializer.save()
+            order_events.status_changed(order, previous_status)
+
+    @action(detail=False, methods=['post'])
+    def checkout(self, request):
+        """
+        Place an order atomically.
+
+        Prices the cart server-side, validates the voucher, decrements stock and
+        creates the order and its items in one transaction.
+
+        Expected POST data:
+        {
+            "items": [{"product_id": 1, "quantity": 2}],
+            "voucher_code": "SAVE10",
+            "shipping_address": "...",
+            "phone": "...",
+            "payment_method": "card"
+        }
+        """
+        serializer = CheckoutSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({'success': False, 'errors': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        data = serializer.validated_data
+        try:
+            order = place_order(
+                request.user,
+                data['items'],
+                shipping_address=data['shipping_address'],
+                phone=data['phone'],
+                payment_method=data['payment_method'],
+                voucher_code=data.get('voucher_code') or None,
+                notes=data['notes'],
+                hold_owner_keys=inventory.owner_keys_for_request(request),
+            )
+        except CheckoutError as exc:
+            error_status = status.HTTP_409_CONFLICT if exc.code == 'out_of_stock' else status.HTTP_400_BAD_REQUEST
+            return Response(
+                {'success': False, 'error': exc.message, 'code': exc.code, **exc.details},
+                status=error_status
+            )
+
+        experiments.log_conversion(experiments.unit_for_request(request), value=order.final_price)
+        return Response(
+            {'success': True, 'data': OrderSerializer(order).data},
+            status=status.HTTP_201_CREATED
+        )
+
+    @action(detail=False, methods=['post'])
+    def bulk_update_status(self, request):
+        """
+        Apply shipment updates from a warehouse integration (admins only).
+
+        Expected POST data (up to ORDER_BULK_UPDATE_MAX records):
+        {
+            "updates": [
+                {"order_id": "ORD-...", "status": "shipped", "carrier": "UPS",
+                 "tracking_number": "1Z...", "location": "Leeds", "eta": "2025-01-31T12:00:00Z"}
+            ]
+        }
+
+        Every field but order_id is optional. Returns one result per record, in order.
+        """
+        if not request.user.profile.is_admin:
+            return Response({'success': False, 'error': 'Admin access required'}, status=status.HTTP_403_FORBIDDEN)
+
+        updates = request.data.get('updates')
+        if not isinstance(updates, list) or not updates:
+            return Response({'success': False, 'error': 'updates must be a non-empty list'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(updates) > settings.ORDER_BULK_UPDATE_MAX:
+            return Response(
+                {'success': False, 'error': f'At most {settings.ORDER_BULK_UPDATE_MAX} updates per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Validate record by record so one bad row does not reject the batch
+        validator = ShipmentUpdateSerializer()
+        valid = []
+        results = []
+        for record in updates:
+            order_id = record.get('order_id') if isinstance(record, dict) else None
+            try:
+                valid.append(validator.run_validation(record))
+                # Keyed like the fulfillment errors: the cleaned string (trimmed, never a number)
+                results.append({'order_id': valid[-1]['order_id'], 'success': True})
+            except serializers.ValidationError as exc:
+                results.append({'order_id': order_id, 'success': False, 'errors': exc.detail})
+
+        errors = fulfillment.apply_shipment_updates(valid)
+        for result in results:
+            if result['success'] and result['order_id'] in errors:
+                result.update(success=False, error=errors[result['order_id']])
+
+        failed = sum(1 for result in results if not result['success'])
+        return Response({
+            'success': failed == 0,
+            'data': {'updated': len(results) - failed, 'failed': failed, 'results': results}
+        })
 
     @action(detail=True, methods=['get'])
     def tracking(self, request, pk=None):
@@ -178,17 +478,92 @@ class OrderViewSet(viewsets.ModelViewSet):
     def cancel(self, request, pk=None):
         """Cancel order if possible."""
         order = self.get_object()
-        if order.status == 'pending':
-            order.status = 'cancelled'
-            order.save()
+        with transaction.atomic():
+            cancelled = Order.objects.filter(pk=order.pk, status='pending').update(
+                status='cancelled',
+                updated_at=timezone.now()
+            )
+            if cancelled:
+                order.status = 'cancelled'
+                release_orders([order.pk])
+                order_events.status_changed(order, 'pending')
+        if cancelled:
             return Response({'success': True, 'message': 'Order cancelled'})
         return Response({'success': False, 'error': 'Order cannot be cancelled'}, status=status.HTTP_400_BAD_REQUEST)
 
     @action(detail=False, methods=['get'])
     def my_orders(self, request):
-        """Get current user's orders."""
+        """
+        Get current user's orders.
+
+        Pass include_archived=true to append orders that have been moved to the
+        archive.
+        """
         orders = self.get_queryset()
-        serializer = self.get_serializer(orders, many=True)
+        data = self.get_serializer(orders, many=True).data
+        if request.query_params.get('include_archived', '').lower() in ('1', 'true'):
+            archived = ArchivedOrder.objects.filter(user=request.user).select_related('user')
+            data = list(data) + ArchivedOrderSummarySerializer(archived, many=True).data
+        return Response({'data': data})
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream orders with their items for finance (admins only).
+
+        GET /api/orders/export/?output=csv&date_from=2025-01-01&date_to=2025-01-31&status=delivered
+
+        Query params:
+        - output: csv (one row per item) or jsonl (one line per order)
+        - date_from / date_to: created_at range, dates inclusive
+        - status: comma-separated statuses
+        - include_archived: true to include archived orders
+        """
+        if not request.user.profile.is_admin:
+            return Response({'success': False, 'error': 'Admin access required'}, status=status.HTTP_403_FORBIDDEN)
+
+        output = request.query_params.get('output', 'csv')
+        if output not in exports.ENCODERS:
+            return Response({'success': False, 'error': 'output must be csv or jsonl'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            date_from = exports.parse_bound(request.query_params.get('date_from'))
+            date_to = exports.parse_bound(request.query_params.get('date_to'), end=True)
+        except ValueError as exc:
+            return Response({'success': False, 'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        statuses = [value for value in request.query_params.get('status', '').split(',') if value]
+
+        encode, content_type = exports.ENCODERS[output]
+        orders = exports.iter_orders(
+            date_from, date_to, statuses,
+            include_archived=request.query_params.get('include_archived', '').lower() in ('1', 'true'),
+        )
+        rows = exports.metered(encode(orders))
+        if isinstance(request._request, ASGIRequest):
+            # Django would buffer a sync iterator whole before sending it over ASGI
+            rows = exports.aiter_rows(rows)
+        response = StreamingHttpResponse(rows, content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="orders-{timezone.now():%Y%m%d-%H%M%S}.{output}"'
+        )
+        return response
+
+    @action(detail=False, methods=['get'])
+    def lookup(self, request):
+        """
+        Find an order by its number, whether live or archived.
+
+        GET /api/orders/lookup/?order_id=ORD-...
+        """
+        order_number = request.query_params.get('order_id')
+        if not order_number:
+            return Response({'success': False, 'error': 'order_id required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        user = None if request.user.profile.is_admin else request.user
+        order, archived = archive.find_order(order_number, user=user)
+        if order is None:
+            return Response({'success': False, 'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+        serializer = ArchivedOrderSerializer(order) if archived else OrderSerializer(order)
         return Response({'data': serializer.data})
 
 
@@ -230,6 +605,171 @@ class RefundViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
 
 
+# ============================================================================
+# INVENTORY & CART VIEWS
+# ============================================================================
+
+class InventoryHoldViewSet(viewsets.ViewSet):
+    """
+    Cart stock reservations.
+
+    Anonymous shoppers identify themselves with the X-Session-ID header;
+    holds expire after INVENTORY_HOLD_TTL seconds unless refreshed.
+    """
+    permission_classes = [AllowAny]
+
+    def _owner_key(self, request):
+        keys = inventory.owner_keys_for_request(request)
+        return keys[0] if keys else None
+
+    def list(self, request):
+        """Get the caller's active holds."""
+        holds = InventoryHold.objects.filter(
+            owner_key__in=inventory.owner_keys_for_request(request),
+            status='active'
+        ).select_related('product')
+        return Response({'data': InventoryHoldSerializer(holds, many=True).data})
+
+    @action(detail=False, methods=['post'])
+    def place(self, request):
+        """Place or resize a hold on a product."""
+        owner_key = self._owner_key(request)
+        if owner_key is None:
+            return Response({'success': False, 'error': 'Session required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = PlaceHoldSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({'success': False, 'errors': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            hold = inventory.place_hold(
+                owner_key,
+                serializer.validated_data['product_id'],
+                serializer.validated_data['quantity']
+            )
+        except inventory.HoldError as exc:
+            error_status = status.HTTP_404_NOT_FOUND if exc.code == 'not_found' else status.HTTP_409_CONFLICT
+            return Response({'success': False, 'error': exc.message, 'code': exc.code}, status=error_status)
+
+        return Response(
+            {'success': True, 'data': InventoryHoldSerializer(hold).data},
+            status=status.HTTP_201_CREATED
+        )
+
+    @action(detail=False, methods=['post'])
+    def release(self, request):
+        """Release the caller's hold on a product."""
+        owner_key = self._owner_key(request)
+        try:
+            product_id = int(request.data.get('product_id'))
+        except (TypeError, ValueError):
+            return Response({'success': False, 'error': 'product_id required'}, status=status.HTTP_400_BAD_REQUEST)
+        if owner_key is None or not inventory.release_hold(owner_key, product_id):
+            return Response({'success': False, 'error': 'Hold not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'success': True, 'message': 'Hold released'})
+
+
+class CartViewSet(viewsets.ViewSet):
+    """
+    Server-side cart, priced on every read.
+
+    Anonymous shoppers identify themselves with the X-Session-ID header; the
+    session cart is merged into the user's cart on login.
+    """
+    permission_classes = [AllowAny]
+
+    def _owner_key(self, request):
+        keys = inventory.owner_keys_for_request(request)
+        return keys[0] if keys else None
+
+    def _priced_response(self, cart, response_status=status.HTTP_200_OK):
+        priced, voucher_error = carts.priced(cart)
+        data = priced.as_dict()
+        data['voucher_error'] = voucher_error
+        return Response({'success': True, 'data': data}, status=response_status)
+
+    def list(self, request):
+        """Get the caller's priced cart."""
+        owner_key = self._owner_key(request)
+        if owner_key is None:
+            return Response({'success': False, 'error': 'Session required'}, status=status.HTTP_400_BAD_REQUEST)
+        return self._priced_response(carts.get_cart(owner_key))
+
+    @action(detail=False, methods=['post'])
+    def set_item(self, request):
+        """Add, resize or remove (quantity 0) a cart line."""
+        owner_key = self._owner_key(request)
+        if owner_key is None:
+            return Response({'success': False, 'error': 'Session required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = CartLineSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({'success': False, 'errors': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            cart = carts.set_line(
+                owner_key,
+                serializer.validated_data['product_id'],
+                serializer.validated_data['quantity']
+            )
+        except carts.CartError as exc:
+            error_status = status.HTTP_404_NOT_FOUND if exc.code == 'not_found' else status.HTTP_400_BAD_REQUEST
+            return Response({'success': False, 'error': exc.message, 'code': exc.code}, status=error_status)
+        return self._priced_response(cart)
+
+    @action(detail=False, methods=['post'])
+    def apply_voucher(self, request):
+        """Attach a voucher code to the cart; an empty code removes it."""
+        owner_key = self._owner_key(request)
+        if owner_key is None:
+            return Response({'success': False, 'error': 'Session required'}, status=status.HTTP_400_BAD_REQUEST)
+        code = (request.data.get('code') or '').strip()[:50]
+        return self._priced_response(carts.set_voucher(owner_key, code))
+
+    @action(detail=False, methods=['post'])
+    def clear(self, request):
+        """Empty the cart."""
+        owner_key = self._owner_key(request)
+        if owner_key is not None:
+            carts.clear(owner_key)
+        return Response({'success': True, 'message': 'Cart cleared'})
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
+    def checkout(self, request):
+        """Place an order for the cart's contents and empty it."""
+        serializer = CartCheckoutSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({'success': False, 'errors': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        owner_key = f'u:{request.user.id}'
+        cart = carts.get_cart(owner_key)
+        data = serializer.validated_data
+        try:
+            order = place_order(
+                request.user,
+                cart.items,
+                shipping_address=data['shipping_address'],
+                phone=data['phone'],
+                payment_method=data['payment_method'],
+                voucher_code=cart.voucher_code or None,
+                notes=data['notes'],
+                hold_owner_keys=inventory.owner_keys_for_request(request),
+            )
+        except CheckoutError as exc:
+            error_status = status.HTTP_409_CONFLICT if exc.code == 'out_of_stock' else status.HTTP_400_BAD_REQUEST
+            return Response(
+                {'success': False, 'error': exc.message, 'code': exc.code, **exc.details},
+                status=error_status
+            )
+
+        carts.clear(owner_key)
+        experiments.log_conversion(experiments.unit_for_request(request), value=order.final_price)
+        return Response(
+            {'success': True, 'data': OrderSerializer(order).data},
+            status=status.HTTP_201_CREATED
+        )
+
+
 # ============================================================================
 # USER FEATURE VIEWS
 # ============================================================================
@@ -254,6 +794,18 @@ class UserProfileViewSet(viewsets.ViewSet):
             return Response({'success': True, 'data': serializer.data})
         return Response({'success': False, 'errors': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['get'])
+    def recently_viewed(self, request):
+        """Get current user's recently viewed products, most recent first."""
+        product_ids = recent_views.get_recent(user_id=request.user.id)
+        products = Product.objects.filter(
+            id__in=product_ids
+        ).select_related('category').prefetch_related('reviews')
+        product_dict = {p.id: p for p in products}
+        ordered = [product_dict[pid] for pid in product_ids if pid in product_dict]
+        serializer = ProductSerializer(ordered, many=True)
+        return Response({'data': serializer.data})
+
 
 class WatchlistViewSet(viewsets.ViewSet):
     """Watchlist views."""
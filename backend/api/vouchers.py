@@ -0,0 +1,199 @@
+"""
+Voucher validation and redemption.
+
+Validation is read-only and answered from the pricing engine's compiled
+voucher rules (cached per worker for ``PRICING_RULES_TTL`` seconds), so a
+burst of "is this code valid?" requests does not touch the voucher row.
+Because usage only grows, a cached "used up" answer stays correct and a
+cached "still available" answer is only advisory.
+
+Redemption is authoritative: one conditional
+``UPDATE ... SET current_uses = current_uses + 1 WHERE current_uses < max_uses``
+checks activity, the date window and the usage limit and takes the use in a
+single statement, so concurrent checkouts can never push ``current_uses``
+past ``max_uses``. The row lock that UPDATE takes is held until the
+surrounding transaction commits, which also serializes the per-user limit
+check and the ``VoucherRedemption`` insert that follow it.
+
+Campaign codes (``VoucherCampaign``/``VoucherCode``) are single-use: they are
+generated in bulk by ``generate_voucher_codes`` and redeemed by marking the
+code row with the same kind of conditional update.
+"""
+import secrets
+from collections import Counter
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Voucher, VoucherCode, VoucherRedemption
+from .pricing import PricingError, compiled_voucher
+
+# Crockford base32 (no I, L, O, U): 32 symbols, so each one is 5 random bits
+CODE_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+
+class VoucherError(Exception):
+    """Raised when a voucher cannot be used."""
+
+    def __init__(self, message, code='voucher_invalid'):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+
+
+def validate(code, user=None, amount=None):
+    """
+    Check whether ``code`` can be used, without taking a use.
+
+    Args:
+        code: Voucher code
+        user: Also check the per-user limit for this user
+        amount: Also check the minimum purchase against this amount
+
+    Returns:
+        The CompiledVoucher
+
+    Raises:
+        VoucherError: Unknown code, inactive, expired, used up or below the
+            minimum purchase.
+    """
+    voucher = compiled_voucher(code)
+    if voucher is None:
+        raise VoucherError('Voucher not found', 'voucher_not_found')
+    try:
+        voucher.discount(Decimal(amount) if amount is not None else voucher.min_purchase)
+    except PricingError as exc:
+        raise VoucherError(exc.message, exc.code)
+    if voucher.max_uses_per_user is not None and user is not None and user.is_authenticated:
+        used = VoucherRedemption.objects.filter(voucher_id=voucher.id, user=user).count()
+        if used >= voucher.max_uses_per_user:
+            raise VoucherError('You have already used this voucher', 'voucher_used')
+    return voucher
+
+
+def redeem(voucher_id, user, order=None, discount_amount=0, max_uses_per_user=None):
+    """
+    Take one use of a voucher for ``user``.
+
+    Call inside the transaction that places the order; if it rolls back the
+    use is given back. Touch the voucher last in that transaction, as with
+    other hot rows, so its lock is held as briefly as possible.
+
+    Args:
+        voucher_id: Voucher pk
+        user: User redeeming the voucher
+        order: Order the voucher is applied to
+        discount_amount: Discount granted, recorded on the redemption
+        max_uses_per_user: Per-user limit, if the voucher has one
+
+    Returns:
+        The VoucherRedemption
+
+    Raises:
+        VoucherError: The voucher is inactive, expired, used up or this user
+            has reached their limit.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        redeemed = Voucher.objects.filter(
+            pk=voucher_id,
+            is_active=True,
+            start_date__lte=now,
+            end_date__gte=now,
+        ).filter(
+            Q(max_uses__isnull=True) | Q(current_uses__lt=F('max_uses'))
+        ).update(current_uses=F('current_uses') + 1)
+        if not redeemed:
+            raise VoucherError('Voucher expired or max uses reached')
+
+        if max_uses_per_user is not None:
+            used = VoucherRedemption.objects.filter(voucher_id=voucher_id, user=user).count()
+            if used >= max_uses_per_user:
+                # Leaving the atomic block gives the use back
+                raise VoucherError('You have already used this voucher', 'voucher_used')
+
+        return VoucherRedemption.objects.create(
+            voucher_id=voucher_id,
+            user=user,
+            order_id=order.id if order is not None else None,
+            discount_amount=discount_amount,
+        )
+
+
+def redeem_code(code_id, user, order=None):
+    """
+    Take a single-use campaign code for ``user``.
+
+    Raises:
+        VoucherError: The code has already been used.
+    """
+    redeemed = VoucherCode.objects.filter(id=code_id, redeemed_at__isnull=True).update(
+        redeemed_at=timezone.now(),
+        redeemed_by=user,
+        order_id=order.id if order is not None else None,
+    )
+    if not redeemed:
+        raise VoucherError('Voucher expired or max uses reached')
+
+
+def unredeem(order_ids):
+    """
+    Give back the voucher uses and campaign codes taken by ``order_ids``.
+
+    Call in the transaction that cancels the orders. Vouchers are touched last
+    and in id order, as at checkout.
+    """
+    VoucherCode.objects.filter(order_id__in=order_ids).update(redeemed_at=None, redeemed_by=None, order_id=None)
+    redemptions = VoucherRedemption.objects.filter(order_id__in=order_ids)
+    uses = Counter(redemptions.values_list('voucher_id', flat=True))
+    if not uses:
+        return
+    redemptions.delete()
+    for voucher_id in sorted(uses):
+        Voucher.objects.filter(pk=voucher_id).update(
+            current_uses=Greatest(F('current_uses') - uses[voucher_id], 0)
+        )
+
+
+def _random_codes(prefix, length, count):
+    # One randbits call per code rather than one secrets.choice per character
+    codes = set()
+    while len(codes) < count:
+        bits = secrets.randbits(5 * length)
+        codes.add(prefix + ''.join(CODE_ALPHABET[(bits >> shift) & 31] for shift in range(0, 5 * length, 5)))
+    return codes
+
+
+def generate_codes(campaign, count, length=None, batch_size=None):
+    """
+    Generate ``count`` new unique codes for ``campaign``.
+
+    Each batch is de-duplicated in memory, checked against existing codes
+    (campaign codes and vouchers) with one indexed ``IN`` query per table, and
+    written with one ``bulk_create``. Codes that collide are replaced in the
+    next round; a batch that races another generator is retried.
+
+    Yields:
+        Number of codes created so far, after each batch
+    """
+    length = length or settings.VOUCHER_CODE_LENGTH
+    batch_size = batch_size or settings.VOUCHER_CODE_BATCH_SIZE
+    created = 0
+    while created < count:
+        codes = _random_codes(campaign.code_prefix, length, min(batch_size, count - created))
+        codes -= set(VoucherCode.objects.filter(code__in=codes).values_list('code', flat=True))
+        codes -= set(Voucher.objects.filter(code__in=codes).values_list('code', flat=True))
+        try:
+            with transaction.atomic():
+                VoucherCode.objects.bulk_create(
+                    [VoucherCode(code=code, campaign=campaign) for code in codes],
+                    batch_size=batch_size,
+                )
+        except IntegrityError:
+            continue
+        created += len(codes)
+        yield created
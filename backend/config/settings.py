@@ -96,6 +96,23 @@ except:
         }
     }
 
+# Cache
+# Set CACHE_BACKEND=redis to share per-session state (recently viewed,
+# co-view session tails) across workers; defaults to per-process memory
+if os.getenv('CACHE_BACKEND', 'locmem') == 'redis':
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": f"redis://{REDIS_HOST}:{REDIS_PORT}/1",
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
 # Database
 # Supports both SQLite (default) and PostgreSQL (production)
 DB_ENGINE = os.getenv('DB_ENGINE', 'django.db.backends.sqlite3')
@@ -160,6 +177,88 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Buffered writes (clickstream, experiment logs)
+# Set to False to disable the background flusher thread (e.g. in tests)
+BUFFERED_WRITES_BACKGROUND = os.getenv('BUFFERED_WRITES_BACKGROUND', 'True') == 'True'
+
+# Clickstream ingestion
+CLICKSTREAM_BATCH_SIZE = int(os.getenv('CLICKSTREAM_BATCH_SIZE', 500))
+CLICKSTREAM_FLUSH_INTERVAL = float(os.getenv('CLICKSTREAM_FLUSH_INTERVAL', 2.0))
+CLICKSTREAM_MAX_BUFFER = int(os.getenv('CLICKSTREAM_MAX_BUFFER', 50000))
+CLICKSTREAM_MAX_EVENTS_PER_REQUEST = int(os.getenv('CLICKSTREAM_MAX_EVENTS_PER_REQUEST', 200))
+
+# Product broadcasts to ws/products/: changes are coalesced per product for
+# PRODUCT_BROADCAST_DEBOUNCE_SECONDS and sent up to PRODUCT_BROADCAST_BATCH_SIZE per message
+# (the publisher thread also follows BUFFERED_WRITES_BACKGROUND)
+PRODUCT_BROADCAST_DEBOUNCE_SECONDS = float(os.getenv('PRODUCT_BROADCAST_DEBOUNCE_SECONDS', 0.5))
+PRODUCT_BROADCAST_BATCH_SIZE = int(os.getenv('PRODUCT_BROADCAST_BATCH_SIZE', 200))
+# New arrivals / featured lists sent on connect are rebuilt on relevant product
+# changes and at least every PRODUCT_SNAPSHOT_TTL_SECONDS
+PRODUCT_SNAPSHOT_TTL_SECONDS = int(os.getenv('PRODUCT_SNAPSHOT_TTL_SECONDS', 300))
+# Topics (product.<id>, category.<id>, featured, ...) one ws/products/ connection may subscribe to
+WS_MAX_SUBSCRIPTIONS = int(os.getenv('WS_MAX_SUBSCRIPTIONS', 50))
+
+# Session co-view ("viewed together") model
+# Two views in a session are paired when they are at most COVIEW_WINDOW_SIZE
+# views and COVIEW_WINDOW_SECONDS apart
+COVIEW_WINDOW_SIZE = int(os.getenv('COVIEW_WINDOW_SIZE', 5))
+COVIEW_WINDOW_SECONDS = int(os.getenv('COVIEW_WINDOW_SECONDS', 1800))
+
+# Recently viewed products (per user / session)
+RECENTLY_VIEWED_SIZE = int(os.getenv('RECENTLY_VIEWED_SIZE', 20))
+RECENTLY_VIEWED_TTL = int(os.getenv('RECENTLY_VIEWED_TTL', 60 * 60 * 24 * 30))
+
+# A/B experiments
+# Definitions are re-read from the database at most every EXPERIMENTS_CONFIG_TTL seconds
+EXPERIMENTS_CONFIG_TTL = float(os.getenv('EXPERIMENTS_CONFIG_TTL', 60))
+EXPERIMENT_LOG_BATCH_SIZE = int(os.getenv('EXPERIMENT_LOG_BATCH_SIZE', 500))
+EXPERIMENT_LOG_FLUSH_INTERVAL = float(os.getenv('EXPERIMENT_LOG_FLUSH_INTERVAL', 5.0))
+
+# Inventory holds (cart reservations)
+INVENTORY_HOLD_TTL = int(os.getenv('INVENTORY_HOLD_TTL', 600))
+INVENTORY_HOLD_MAX_QUANTITY = int(os.getenv('INVENTORY_HOLD_MAX_QUANTITY', 10))
+
+# Cart and pricing
+# Compiled voucher rules are re-read at most every PRICING_RULES_TTL seconds per worker
+CART_MAX_LINES = int(os.getenv('CART_MAX_LINES', 100))
+CART_MAX_QUANTITY = int(os.getenv('CART_MAX_QUANTITY', 99))
+PRICING_RULES_TTL = int(os.getenv('PRICING_RULES_TTL', 60))
+PRICING_BUNDLE_TTL = int(os.getenv('PRICING_BUNDLE_TTL', 3600))
+
+# Campaign voucher codes (generate_voucher_codes)
+VOUCHER_CODE_LENGTH = int(os.getenv('VOUCHER_CODE_LENGTH', 12))
+VOUCHER_CODE_BATCH_SIZE = int(os.getenv('VOUCHER_CODE_BATCH_SIZE', 5000))
+
+# Transactional outbox (order events)
+# Failed deliveries are retried after OUTBOX_RETRY_BASE_SECONDS * 2^(attempt - 1);
+# claimed events not finished within OUTBOX_LEASE_SECONDS are claimed again
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 100))
+OUTBOX_LEASE_SECONDS = int(os.getenv('OUTBOX_LEASE_SECONDS', 300))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 8))
+OUTBOX_RETRY_BASE_SECONDS = int(os.getenv('OUTBOX_RETRY_BASE_SECONDS', 5))
+OUTBOX_RETENTION_DAYS = int(os.getenv('OUTBOX_RETENTION_DAYS', 7))
+
+# Bulk order / shipment updates (warehouse integrations)
+ORDER_BULK_UPDATE_MAX = int(os.getenv('ORDER_BULK_UPDATE_MAX', 5000))
+ORDER_BULK_UPDATE_CHUNK = int(os.getenv('ORDER_BULK_UPDATE_CHUNK', 500))
+
+# Live sales dashboard (stream_sales_dashboard, ws/dashboard/)
+SALES_DASHBOARD_TICK_SECONDS = float(os.getenv('SALES_DASHBOARD_TICK_SECONDS', 1))
+SALES_DASHBOARD_STOCK_SYNC_SECONDS = int(os.getenv('SALES_DASHBOARD_STOCK_SYNC_SECONDS', 60))
+SALES_DASHBOARD_TOP_PRODUCTS = int(os.getenv('SALES_DASHBOARD_TOP_PRODUCTS', 5))
+LOW_STOCK_THRESHOLD = int(os.getenv('LOW_STOCK_THRESHOLD', 10))
+
+# Daily sales rollup (rollup_sales): orders changed in the last
+# SALES_ROLLUP_LAG_SECONDS are left for the next run
+SALES_ROLLUP_LAG_SECONDS = int(os.getenv('SALES_ROLLUP_LAG_SECONDS', 60))
+
+# Distinct customer / visitor sketches (HyperLogLog): 2 ** precision bytes per
+# day and category, relative error about 1.04 / sqrt(2 ** precision)
+DISTINCT_SKETCH_PRECISION = int(os.getenv('DISTINCT_SKETCH_PRECISION', 12))
+
+# Order archive: delivered/cancelled orders older than this move to cold storage
+ORDER_ARCHIVE_AFTER_MONTHS = int(os.getenv('ORDER_ARCHIVE_AFTER_MONTHS', 12))
+
 # CORS Configuration - Allow frontend to communicate
 CORS_ALLOWED_ORIGINS = [
     'http://localhost:3000',